@@ -0,0 +1,249 @@
+"""
+Boligmarked Analyse - Aggregat-kube
+(kommune × boligtype × renset) med antall, summer, min/maks og en kvantil-skisse
+for pris. Beregnes én gang per datasettversjon, lagres ved siden av datasettet
+og svarer på statistikk per kommune/boligtype med roll-ups i stedet for å
+skanne alle rader. Inkrementelle scrapes oppdaterer kuben uten full omberegning
+"""
+
+import json
+import math
+import os
+from collections import Counter
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from storage import OUTLIER_BOUNDS, dataset_version, load_dataset
+
+DIMENSIONS = ['kommune', 'boligtype', 'renset']
+
+# Kvantil-skisse: logaritmiske bøtter med relativ feil ~1 % (DDSketch-prinsippet)
+SKETCH_GAMMA = 1.02
+
+
+def sketch_bins(values, gamma: float = SKETCH_GAMMA) -> np.ndarray:
+    """Bøtte-indeks for hver (positive) verdi: bøtte i dekker (gamma^(i-1), gamma^i]"""
+    return np.ceil(np.log(np.asarray(values, dtype=np.float64)) / math.log(gamma)).astype(np.int64)
+
+
+def sketch_value(bin_index, gamma: float = SKETCH_GAMMA):
+    """Representativ verdi for en bøtte (relativ feil under (gamma - 1) / 2)"""
+    return 2 * gamma ** np.asarray(bin_index, dtype=np.float64) / (gamma + 1)
+
+
+def _sketch_bins(pris: pd.Series) -> pd.Series:
+    """Bøtte-indeks for hver pris"""
+    return pd.Series(sketch_bins(pris.astype(np.float64).clip(lower=1)), index=pris.index)
+
+
+def _sketch_quantile(sketch: Counter, q: float) -> float:
+    """Estimer kvantil q fra en skisse"""
+    total = sum(sketch.values())
+    if total == 0:
+        return np.nan
+    rank = q * (total - 1)
+    seen = 0
+    for bin_index in sorted(sketch):
+        seen += sketch[bin_index]
+        if seen > rank:
+            return float(sketch_value(bin_index))
+    return float(sketch_value(max(sketch)))
+
+
+def cube_path(data_path: str) -> str:
+    """Kuben lagres ved siden av datasettet"""
+    return f"{os.path.splitext(data_path)[0]}_aggregater.json"
+
+
+def with_dimensions(df: pd.DataFrame) -> pd.DataFrame:
+    """Legg til 'renset'-dimensjonen (raden er innenfor OUTLIER_BOUNDS)"""
+    renset = pd.Series(True, index=df.index)
+    for col, (lo, hi) in OUTLIER_BOUNDS.items():
+        renset &= (df[col] >= lo) & (df[col] <= hi)
+    return df.assign(
+        kommune=df['kommune'].astype(str),
+        boligtype=df['boligtype'].astype(str),
+        renset=renset
+    )
+
+
+class AggregateCube:
+    """Materialisert aggregat-kube over datasettet"""
+
+    def __init__(self, cells: pd.DataFrame, sketches: Dict, data_version: Optional[str] = None):
+        self.cells = cells
+        self.sketches = sketches
+        self.data_version = data_version
+
+    @classmethod
+    def build(cls, df: pd.DataFrame, data_version: Optional[str] = None) -> 'AggregateCube':
+        """Beregn kuben fra bunnen av"""
+        cells, sketches = cls._aggregate(df)
+        return cls(cells, sketches, data_version)
+
+    @staticmethod
+    def _aggregate(df: pd.DataFrame):
+        """Celler (antall, summer, min/maks) og skisser for et sett rader"""
+        df = with_dimensions(df)
+        cells = df.groupby(DIMENSIONS).agg(
+            antall=('pris', 'count'),
+            sum_pris=('pris', 'sum'),
+            sum_kvm=('storrelse_kvm', 'sum'),
+            sum_kr_kvm=('pris_per_kvm', 'sum'),
+            min=('pris', 'min'),
+            maks=('pris', 'max')
+        ).astype({'sum_pris': np.float64, 'sum_kvm': np.float64, 'sum_kr_kvm': np.float64})
+
+        sketches = {}
+        bins = df[DIMENSIONS].assign(bin=_sketch_bins(df['pris']))
+        for (kommune, boligtype, renset, bin_index), n in bins.value_counts().items():
+            sketches.setdefault((kommune, boligtype, bool(renset)), Counter())[int(bin_index)] = int(n)
+        return cells, sketches
+
+    def update(self, added: pd.DataFrame, removed: pd.DataFrame, data: pd.DataFrame,
+               data_version: Optional[str] = None) -> None:
+        """
+        Oppdater kuben etter en inkrementell scrape: legg til nye rader og trekk
+        fra gamle versjoner av endrede rader. Antall, summer og skisser oppdateres
+        direkte; min/maks regnes bare på nytt for cellene der en fjernet verdi
+        kan ha vært min eller maks
+        """
+        sum_cols = ['antall', 'sum_pris', 'sum_kvm', 'sum_kr_kvm']
+        cells = self.cells.copy()
+
+        if len(added):
+            add_cells, add_sketches = self._aggregate(added)
+            cells = cells.reindex(cells.index.union(add_cells.index))
+            cells[sum_cols] = cells[sum_cols].fillna(0).add(add_cells[sum_cols], fill_value=0)
+            cells['min'] = cells['min'].combine(add_cells['min'].reindex(cells.index), min_nan)
+            cells['maks'] = cells['maks'].combine(add_cells['maks'].reindex(cells.index), max_nan)
+            for key, sketch in add_sketches.items():
+                self.sketches.setdefault(key, Counter()).update(sketch)
+
+        dirty = []
+        if len(removed):
+            rem_cells, rem_sketches = self._aggregate(removed)
+            cells[sum_cols] = cells[sum_cols].sub(rem_cells[sum_cols].reindex(cells.index), fill_value=0)
+            for key, sketch in rem_sketches.items():
+                self.sketches.setdefault(key, Counter()).subtract(sketch)
+                self.sketches[key] = +self.sketches[key]
+
+            rem_min = rem_cells['min'].reindex(cells.index)
+            rem_max = rem_cells['maks'].reindex(cells.index)
+            dirty = cells.index[(rem_min <= cells['min']) | (rem_max >= cells['maks'])].tolist()
+
+        cells = cells[cells['antall'] > 0]
+        if dirty:
+            dims = with_dimensions(data)
+            keys = pd.MultiIndex.from_frame(dims[DIMENSIONS])
+            rows = dims[keys.isin(dirty)]
+            exact = rows.groupby(DIMENSIONS)['pris'].agg(['min', 'max'])
+            cells.loc[exact.index, 'min'] = exact['min']
+            cells.loc[exact.index, 'maks'] = exact['max']
+
+        self.cells = cells.astype({'antall': np.int64})
+        self.sketches = {key: sketch for key, sketch in self.sketches.items() if sketch}
+        self.data_version = data_version
+
+    def rollup(self, by: Optional[str] = None, renset: Optional[bool] = True) -> pd.DataFrame:
+        """
+        Statistikk per `by` ('kommune', 'boligtype' eller None = totalt).
+        renset=True: kun rader innenfor OUTLIER_BOUNDS (som i dashboardet),
+        renset=None: alle rader (som i scraper-rapporten).
+        Samme kolonner som SqlStore.aggregate
+        """
+        cells = self.cells
+        if renset is not None:
+            cells = cells[cells.index.get_level_values('renset') == renset]
+
+        labels = cells.index.get_level_values(by) if by else pd.Index(['Totalt'] * len(cells))
+        rows = {}
+        for label in labels.unique():
+            group = cells[labels == label]
+            antall = group['antall'].sum()
+            sketch = Counter()
+            for key in group.index:
+                sketch.update(self.sketches.get(key, {}))
+            rows[label] = {
+                'antall': antall,
+                'snitt': group['sum_pris'].sum() / antall,
+                'median': _sketch_quantile(sketch, 0.5),
+                'min': group['min'].min(),
+                'maks': group['maks'].max(),
+                'snitt_kvm': group['sum_kvm'].sum() / antall,
+                'kr_kvm': group['sum_kr_kvm'].sum() / antall,
+            }
+
+        result = pd.DataFrame.from_dict(rows, orient='index')
+        result.index.name = by
+        return result
+
+    def save(self, path: str) -> None:
+        """Lagre kuben som JSON"""
+        cells = self.cells.reset_index()
+        data = {
+            'data_version': self.data_version,
+            'cells': cells.to_dict(orient='records'),
+            'sketches': [
+                {'key': list(key), 'bins': {str(b): n for b, n in sketch.items()}}
+                for key, sketch in self.sketches.items()
+            ],
+        }
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, default=_json_default)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'AggregateCube':
+        """Last en lagret kube"""
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        cells = pd.DataFrame(data['cells'], columns=DIMENSIONS + [
+            'antall', 'sum_pris', 'sum_kvm', 'sum_kr_kvm', 'min', 'maks'
+        ]).set_index(DIMENSIONS)
+        sketches = {
+            (s['key'][0], s['key'][1], bool(s['key'][2])): Counter({int(b): n for b, n in s['bins'].items()})
+            for s in data['sketches']
+        }
+        return cls(cells, sketches, data['data_version'])
+
+    @classmethod
+    def for_dataset(cls, data_path: str, df: Optional[pd.DataFrame] = None) -> 'AggregateCube':
+        """
+        Lagret kube for datasettet hvis den er oppdatert, ellers beregn og lagre en ny
+        (df kan gis hvis datasettet allerede er lastet)
+        """
+        path = cube_path(data_path)
+        version = dataset_version(data_path)
+        if os.path.exists(path):
+            cube = cls.load(path)
+            if cube.data_version == version:
+                return cube
+
+        cube = cls.build(df if df is not None else load_dataset(data_path), version)
+        cube.save(path)
+        return cube
+
+
+def min_nan(a, b):
+    """min() som ignorerer NaN"""
+    return b if pd.isna(a) else a if pd.isna(b) else min(a, b)
+
+
+def max_nan(a, b):
+    """max() som ignorerer NaN"""
+    return b if pd.isna(a) else a if pd.isna(b) else max(a, b)
+
+
+def _json_default(value):
+    """numpy-typer til JSON"""
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    if isinstance(value, np.bool_):
+        return bool(value)
+    raise TypeError(f"Kan ikke serialisere {type(value)}")
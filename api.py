@@ -0,0 +1,289 @@
+"""
+Boligmarked Analyse - HTTP-API
+Prismodellen, sammenlignbare boliger og statistikk per kommune/boligtype
+for interne verktøy, uten Streamlit. Datasettet, modellen, nabo-indeksen og
+aggregat-kuben lastes én gang ved oppstart. Forespørslene håndteres i
+tråder, og svar på GET-forespørsler caches i en LRU-cache
+
+    python api.py --port 8502
+    curl 'localhost:8502/predict?storrelse=80&kommune=Fredrikstad&boligtype=Leilighet'
+    curl -X POST localhost:8502/predict -d '{"boliger": [{"storrelse": 80, "kommune": "Moss", "boligtype": "Enebolig"}]}'
+    curl 'localhost:8502/comparables?storrelse=80&kommune=Moss&boligtype=Leilighet&k=5'
+    curl 'localhost:8502/stats?by=kommune'
+"""
+
+import argparse
+import json
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from metrics import METRICS
+
+CACHE_ENTRIES = 4096
+MAX_BATCH = 10_000
+MAX_BODY_BYTES = MAX_BATCH * 256   # Romslig for MAX_BATCH boliger som JSON
+MAX_K = 100
+
+
+class ApiError(Exception):
+    """Feil i forespørselen - gir 400 med meldingen"""
+
+
+class ResponseCache:
+    """LRU-cache for ferdig serialiserte svar (trådsikker)"""
+    def __init__(self, max_entries: int = CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries: OrderedDict = OrderedDict()
+
+    def get(self, key) -> Optional[bytes]:
+        with self.lock:
+            body = self.entries.get(key)
+            if body is not None:
+                self.entries.move_to_end(key)
+            return body
+
+    def put(self, key, body: bytes) -> None:
+        with self.lock:
+            self.entries[key] = body
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+def _json_value(value):
+    """NumPy-tall til Python, NaN/NA til null"""
+    if value is None or value is pd.NA:
+        return None
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else round(float(value), 2)
+    return value
+
+
+def _encode(result: Dict) -> bytes:
+    return json.dumps(result, ensure_ascii=False).encode('utf-8')
+
+
+class BoligService:
+    """Alt som trengs for å svare, lastet én gang fra datasettet"""
+    def __init__(self, path: Optional[str] = None):
+        from aggregates import AggregateCube
+        from indexes import ComparablesIndex
+        from model import ModelRegistry, make_pricer
+        from storage import dataset_version, default_path, load_dataset, remove_outliers, to_compact
+
+        path = path or default_path()
+        with METRICS.span('api_load'):
+            # Samme rensing som dashboardet, så svarene stemmer med det
+            df = to_compact(remove_outliers(load_dataset(path)))
+            model, self.r2, self.mae, feature_names, _ = ModelRegistry().get_or_train(df)
+            self.pricer = make_pricer(model, feature_names)
+            self.comparables_index = ComparablesIndex(df)
+            cube = AggregateCube.for_dataset(path)
+        self.data_version = dataset_version(path)
+        self.kommuner = set(df['kommune'].astype(str).unique())
+        self.boligtyper = set(df['boligtype'].astype(str).unique())
+        self.stats_tables = {by: self._records(cube.rollup(by), by) for by in ('kommune', 'boligtype', None)}
+        self.antall = len(df)
+
+    @staticmethod
+    def _records(stats, by: Optional[str]) -> List[Dict]:
+        rows = stats.astype({'antall': 'int64'}).to_dict('index')
+        return [{**({by: label} if by else {}), **{col: _json_value(v) for col, v in row.items()}}
+                for label, row in rows.items()]
+
+    def _input(self, params: Dict) -> Tuple[float, str, str]:
+        """(størrelse, kommune, boligtype) fra parametrene, med validering"""
+        try:
+            storrelse = float(params['storrelse'])
+            kommune = str(params['kommune'])
+            boligtype = str(params['boligtype'])
+        except KeyError as e:
+            raise ApiError(f"mangler parameter {e.args[0]}")
+        except (TypeError, ValueError):
+            raise ApiError("storrelse må være et tall")
+        if not 0 < storrelse < 10_000:
+            raise ApiError("storrelse må være mellom 0 og 10 000 kvm")
+        if kommune not in self.kommuner:
+            raise ApiError(f"ukjent kommune: {kommune}")
+        if boligtype not in self.boligtyper:
+            raise ApiError(f"ukjent boligtype: {boligtype}")
+        return storrelse, kommune, boligtype
+
+    def predict(self, params: Dict) -> Dict:
+        storrelse, kommune, boligtype = self._input(params)
+        return {'pris': round(self.pricer.predict_one(storrelse, kommune, boligtype))}
+
+    def predict_batch(self, boliger: List[Dict]) -> Dict:
+        """Hele batchen i én vektorisert prediksjon"""
+        if not isinstance(boliger, list) or len(boliger) > MAX_BATCH:
+            raise ApiError(f"boliger må være en liste med maks {MAX_BATCH} elementer")
+        rader = []
+        for i, bolig in enumerate(boliger):
+            try:
+                rader.append(self._input(bolig if isinstance(bolig, dict) else {}))
+            except ApiError as e:
+                raise ApiError(f"bolig {i}: {e}")
+        if not rader:
+            return {'priser': []}
+        storrelse, kommune, boligtype = zip(*rader)
+        return {'priser': [round(p) for p in self.pricer.predict(storrelse, kommune, boligtype)]}
+
+    def comparables(self, params: Dict) -> Dict:
+        storrelse, kommune, boligtype = self._input(params)
+        try:
+            k = int(params.get('k', 10))
+        except ValueError:
+            raise ApiError("k må være et heltall")
+        if not 1 <= k <= MAX_K:
+            raise ApiError(f"k må være mellom 1 og {MAX_K}")
+        naboer, estimat = self.comparables_index.comparables(storrelse, kommune, boligtype, k)
+        kolonner = [col for col in ('finn_kode', 'tittel', 'pris', 'storrelse_kvm', 'pris_per_kvm',
+                                    'kommune', 'boligtype', 'avstand') if col in naboer.columns]
+        # Kolonnevis tolist() er langt raskere enn å konvertere DataFrame-rader
+        verdier = zip(*(naboer[col].tolist() for col in kolonner))
+        return {
+            'estimat': _json_value(estimat),
+            'naboer': [{col: _json_value(v) for col, v in zip(kolonner, rad)} for rad in verdier],
+        }
+
+    def stats(self, params: Dict) -> Dict:
+        by = params.get('by') or None
+        if by not in self.stats_tables:
+            raise ApiError("by må være kommune, boligtype eller tom (totalt)")
+        return {'by': by, 'rader': self.stats_tables[by]}
+
+    def health(self, params: Dict) -> Dict:
+        return {'status': 'ok', 'data_version': self.data_version, 'boliger': self.antall,
+                'r2': _json_value(self.r2), 'mae': _json_value(self.mae)}
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    # Keep-alive, så klienter slipper ny TCP-forbindelse per forespørsel. Uten
+    # TCP_NODELAY venter body-en på ACK for headerne (~40 ms med delayed ACK)
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    service: BoligService = None
+    cache: ResponseCache = None
+
+    GET_ROUTES = {
+        '/predict': 'predict',
+        '/comparables': 'comparables',
+        '/stats': 'stats',
+        '/health': 'health',
+    }
+
+    def log_message(self, format, *args):
+        pass   # Logging per forespørsel koster mer enn selve svaret
+
+    def _send(self, status: int, body: bytes, content_type: str = 'application/json') -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _respond(self, endpoint: str, handler, cache_key=None) -> None:
+        """Svar med handler() som JSON (400 ved ApiError), og legg vellykkede svar i cachen"""
+        start = time.perf_counter()
+        try:
+            status, body = 200, _encode(handler())
+            if cache_key is not None:
+                self.cache.put(cache_key, body)
+        except ApiError as e:
+            status, body = 400, _encode({'feil': str(e)})
+        except Exception as e:
+            # Svar i stedet for å bryte forbindelsen - klienten får vite hva som skjedde
+            METRICS.inc('api_errors_total', endpoint=endpoint, reason=type(e).__name__)
+            status, body = 500, _encode({'feil': f"intern feil: {type(e).__name__}"})
+        self._send(status, body)
+        METRICS.observe('api_request_seconds', time.perf_counter() - start, endpoint=endpoint, status=status)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/metrics':
+            self._send(200, METRICS.prometheus().encode('utf-8'), 'text/plain; version=0.0.4')
+            return
+        method = self.GET_ROUTES.get(url.path)
+        if method is None:
+            self._send(404, b'{"feil": "ukjent endepunkt"}')
+            return
+
+        params = dict(parse_qsl(url.query))
+        # Svarene avhenger bare av parametrene (datasettet er fast i prosessens levetid)
+        key = (url.path, tuple(sorted(params.items()))) if method != 'health' else None
+        cached = self.cache.get(key) if key is not None else None
+        if cached is not None:
+            start = time.perf_counter()
+            self._send(200, cached)
+            METRICS.inc('api_cache_hits_total', endpoint=url.path)
+            METRICS.observe('api_request_seconds', time.perf_counter() - start, endpoint=url.path, status=200)
+            return
+        self._respond(url.path, lambda: getattr(self.service, method)(params), key)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != '/predict':
+            self.close_connection = True   # Body-en er ikke lest
+            self._send(404, b'{"feil": "ukjent endepunkt"}')
+            return
+
+        def handler():
+            try:
+                lengde = int(self.headers.get('Content-Length') or 0)
+            except ValueError:
+                lengde = -1
+            if not 0 <= lengde <= MAX_BODY_BYTES:
+                # Body-en leses ikke, så forbindelsen kan ikke gjenbrukes
+                self.close_connection = True
+                raise ApiError(f"Content-Length må være et heltall mellom 0 og {MAX_BODY_BYTES}")
+            body = self.rfile.read(lengde)
+            try:
+                payload = json.loads(body or b'{}')
+            except ValueError:
+                raise ApiError("ugyldig JSON")
+            return self.service.predict_batch(payload.get('boliger') if isinstance(payload, dict) else None)
+
+        self._respond('/predict[batch]', handler)
+
+
+class ApiServer(ThreadingHTTPServer):
+    """Én tråd per forbindelse, med plass til mange ventende tilkoblinger"""
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def make_server(service: BoligService, host: str = '127.0.0.1', port: int = 8502,
+                cache_entries: int = CACHE_ENTRIES) -> ApiServer:
+    handler = type('Handler', (ApiHandler,), {'service': service, 'cache': ResponseCache(cache_entries)})
+    return ApiServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP-API for prediksjon og statistikk")
+    parser.add_argument('--data', default=None, help="Datasett (standard: boliger_ostfold.parquet/.csv)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    parser.add_argument('--cache', type=int, default=CACHE_ENTRIES, help="Maks svar i LRU-cachen")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    service = BoligService(args.data)
+    server = make_server(service, args.host, args.port, args.cache)
+    print(f"🚀 {service.antall:,} boliger lastet på {time.perf_counter() - start:.1f} s - "
+          f"lytter på http://{args.host}:{args.port}".replace(",", " "))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -5,12 +5,24 @@ Interaktivt dashboard for boligprisanalyse
 
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from sklearn.linear_model import LinearRegression
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import r2_score, mean_absolute_error
 import numpy as np
+import os
+import time
+from contextlib import contextmanager
+
+# plotly (via charts) og sklearn (via modellregisteret) importeres først i
+# funksjonene som bygger figurer og henter modellen, så header og nøkkeltall
+# vises uten å vente på dem
+from aggregates import AggregateCube
+from history import PriceHistory
+from indexes import ComparablesIndex, FilterIndex
+from metrics import METRICS, METRICS_DIR
+from model import ModelRegistry, make_pricer
+from regions import PARTITION_ROOT, PartitionSelection, fylker, load_partitions, selection
+from storage import (DATA_SQLITE, SqlStore, dataset_version, default_path, load_dataset,
+                     remove_outliers, to_compact)
+
+TABS = ["📊 Oversikt", "🗺️ Per område", "🤖 Priskalkulator", "📉 Prisutvikling", "📈 Analyser"]
 
 # Page config
 st.set_page_config(
@@ -39,27 +51,121 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 @st.cache_data
-def load_data():
-    """Last boligdata"""
+def load_data(data_version=None):
+    """Last boligdata (data_version er med i cache-nøkkelen, så ny data lastes på nytt)"""
     try:
-        df = pd.read_csv('boliger_ostfold.csv')
-        
-        # DATA CLEANING - Fjern outliers
-        # Realistiske grenser for boliger i Østfold:
-        df = df[
-            (df['storrelse_kvm'] >= 20) &      # Min 20 kvm (hybler)
-            (df['storrelse_kvm'] <= 500) &     # Maks 500 kvm (store eneboliger)
-            (df['pris'] >= 500000) &           # Min 500k (realistisk i Østfold)
-            (df['pris'] <= 25000000) &         # Maks 25M (luksus)
-            (df['pris_per_kvm'] >= 5000) &     # Min 5k/kvm
-            (df['pris_per_kvm'] <= 150000)     # Maks 150k/kvm (leiligheter sentrum)
-        ]
-        
-        return df
+        with METRICS.span('app_load'):
+            if isinstance(data_version, PartitionSelection):
+                # Partisjonert datasett: bare filene for de valgte fylkene leses
+                df = load_partitions(data_version.root, list(data_version.fylker) or None)
+            else:
+                # Parquet (kompakte datatyper) hvis den finnes, ellers CSV
+                df = load_dataset()
+            
+            # DATA CLEANING - Fjern outliers (se OUTLIER_BOUNDS i storage.py)
+            return to_compact(remove_outliers(df))
     except FileNotFoundError:
-        st.error("⚠️ Fant ikke boliger_ostfold.csv - kjør scraper_final.py først!")
+        st.error("⚠️ Fant ikke boliger_ostfold.parquet eller boliger_ostfold.csv - kjør scraper.py først!")
         st.stop()
 
+@st.cache_resource
+def get_filter_index(data_version):
+    """Filterindeks for sidebar-filtrene, bygget én gang per datasettversjon og delt mellom sesjoner"""
+    df = load_data(data_version)
+    with METRICS.span('app_index_build', indeks='filter'):
+        return FilterIndex(df)
+
+@st.cache_resource(max_entries=1)
+def open_sql_store(path, mtime):
+    """Nøklet på filens mtime - en database som opprettes eller skrives på nytt gir en ny store"""
+    return SqlStore(path)
+
+def get_sql_store(data_version=None):
+    """
+    SQLite-backend hvis boliger_ostfold.db finnes (filtre og aggregater kjøres i
+    databasen) - men ikke for et utvalg fra det partisjonerte datasettet
+    """
+    if isinstance(data_version, PartitionSelection):
+        return None
+    try:
+        mtime = os.path.getmtime(DATA_SQLITE)
+    except OSError:
+        return None
+    return open_sql_store(DATA_SQLITE, mtime)
+
+@st.cache_data
+def load_options(_store, data_version):
+    """Verdier til sidebar-filtrene fra databasen"""
+    return _store.options()
+
+@st.cache_resource
+def get_cube(data_version):
+    """Aggregat-kuben for datasettet (lastes fra disk, eller beregnes og lagres)"""
+    if isinstance(data_version, PartitionSelection):
+        # Utvalget av fylker varierer - kuben bygges fra de lastede radene
+        return AggregateCube.build(load_data(data_version))
+    return AggregateCube.for_dataset(default_path())
+
+# Cachene under deler objektene mellom reruns og sesjoner uten å kopiere dem -
+# resultatene skal ikke endres av den som kaller
+
+@st.cache_resource(max_entries=16)
+def get_filtered(data_version, kommune, boligtype, pris_range):
+    """Rader som matcher sidebar-filtrene (None = 'Alle')"""
+    store = get_sql_store(data_version)
+    with METRICS.span('app_filter', backend='sql' if store is not None else 'indeks'):
+        if store is not None:
+            return store.filtered(kommune, boligtype, pris_range)
+        # Oppslag + binærsøk i filterindeksen i stedet for å skanne alle rader
+        return get_filter_index(data_version).filter(kommune, boligtype, pris_range)
+
+@st.cache_data(max_entries=64)
+def get_summary(data_version, kommune, boligtype, pris_range):
+    """Antall og snitt for sidebar-filtrene, regnet ut i databasen"""
+    with METRICS.span('app_filter', backend='sql-summary'):
+        return get_sql_store(data_version).summary(kommune, boligtype, pris_range)
+
+@st.cache_resource
+def get_group_stats(data_version):
+    """Statistikk per kommune og per boligtype - fra databasen eller aggregat-kuben"""
+    store = get_sql_store(data_version)
+    if store is not None:
+        return store.aggregate('kommune'), store.aggregate('boligtype')
+    cube = get_cube(data_version)
+    return cube.rollup('kommune'), cube.rollup('boligtype')
+
+@st.cache_resource
+def get_model(data_version):
+    """Prismodellen fra modellregisteret (trenes bare når datasettet er endret) som (pricer, r2, mae)"""
+    store = get_sql_store(data_version)
+    if store is not None:
+        # Kun kolonnene modellen trenger, hentet fra databasen
+        df_model = store.filtered(columns=['storrelse_kvm', 'kommune', 'boligtype', 'pris'])
+    else:
+        df_model = get_filter_index(data_version).df
+    model, r2, mae, feature_names, _ = ModelRegistry().get_or_train(df_model)
+    return make_pricer(model, feature_names), r2, mae
+
+@st.cache_resource
+def get_comparables(data_version):
+    """Nærmeste-nabo-indeks for sammenlignbare boliger (priskalkulatoren), én per datasettversjon"""
+    store = get_sql_store(data_version)
+    if store is not None:
+        df = store.filtered(columns=['finn_kode', 'tittel', 'storrelse_kvm', 'pris', 'pris_per_kvm',
+                                     'kommune', 'boligtype'])
+    else:
+        df = get_filter_index(data_version).df
+    with METRICS.span('app_index_build', indeks='sammenlignbare'):
+        return ComparablesIndex(df)
+
+@st.cache_resource(max_entries=32)
+def get_similar(data_version, kommune, boligtype):
+    """Boliger i samme kommune og boligtype (til sammenligningen i priskalkulatoren)"""
+    store = get_sql_store(data_version)
+    if store is not None:
+        return store.filtered(kommune, boligtype, columns=['storrelse_kvm', 'pris'])
+    return get_filter_index(data_version).filter(kommune, boligtype)
+
 def format_number(num):
     """Formater tall med norsk tallformat (mellomrom som tusenskiller)"""
     if pd.isna(num):
@@ -72,324 +178,505 @@ def format_currency(num):
         return "N/A"
     return f"{format_number(num)} kr"
 
-@st.cache_data
-def train_price_model(df):
-    """Tren ML-modell for prisprediksjon med flere features"""
-    # Fjern rader med manglende data
-    df_model = df[['storrelse_kvm', 'kommune', 'boligtype', 'pris']].dropna()
+class RerunTimer:
+    """Tid per del av en rerun, til debug-panelet"""
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.tider = {}
     
-    # Encode kategoriske variabler
-    # One-hot encoding for kommune og boligtype
-    df_encoded = pd.get_dummies(df_model, columns=['kommune', 'boligtype'], drop_first=True)
+    @contextmanager
+    def maal(self, navn):
+        start = time.perf_counter()
+        try:
+            with METRICS.span('app_section', section=navn):
+                yield
+        finally:
+            self.tider[navn] = self.tider.get(navn, 0.0) + (time.perf_counter() - start) * 1000
     
-    # Separer features og target
-    X = df_encoded.drop('pris', axis=1)
-    y = df_encoded['pris']
+    def total_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+# Figurene bygges bare når fanen vises, og caches på nøyaktig det de avhenger av
+
+@st.cache_resource(max_entries=32)
+def fig_prisfordeling(data_version, kommune, boligtype, pris_range):
+    """Histogram og box plot for filteret"""
+    with METRICS.span('app_figure', figur='prisfordeling'):
+        import charts
     
-    # Split data
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+        df_filtered = get_filtered(data_version, kommune, boligtype, pris_range)
     
-    # Tren modell
-    model = LinearRegression()
-    model.fit(X_train, y_train)
+        # Histogram (binet på serveren for store utvalg)
+        fig_hist = charts.histogram(
+            df_filtered,
+            x='pris',
+            nbins=30,
+            title='Prisfordeling',
+            labels={'pris': 'Pris (kr)', 'count': 'Antall boliger'},
+            color='#667eea'
+        )
     
-    # Evaluer
-    y_pred = model.predict(X_test)
-    r2 = r2_score(y_test, y_pred)
-    mae = mean_absolute_error(y_test, y_pred)
+        # Box plot
+        fig_box = charts.box(
+            df_filtered,
+            y='pris',
+            title='Prissprednng (box plot)',
+            labels={'pris': 'Pris (kr)'},
+            color='#764ba2'
+        )
+        return fig_hist, fig_box
+
+@st.cache_resource(max_entries=32)
+def fig_storrelse_pris(data_version, kommune, boligtype, pris_range, scatter_mode):
+    """Scatter: Størrelse vs Pris"""
+    with METRICS.span('app_figure', figur='storrelse_pris'):
+        import charts
     
-    # Returner også feature names for senere bruk
-    feature_names = X.columns.tolist()
+        return charts.scatter(
+            get_filtered(data_version, kommune, boligtype, pris_range),
+            x='storrelse_kvm',
+            y='pris',
+            color='boligtype',
+            hover_data=['kommune', 'tittel'],
+            title='Sammenheng mellom størrelse og pris',
+            labels={'storrelse_kvm': 'Størrelse (kvm)', 'pris': 'Pris (kr)'},
+            mode=scatter_mode
+        )
+
+@st.cache_resource
+def fig_per_omrade(data_version):
+    """Søyler per kommune og kakediagram per boligtype (uavhengig av sidebar-filtrene)"""
+    with METRICS.span('app_figure', figur='per_omrade'):
+        import plotly.express as px
+    
+        per_kommune, per_type = get_group_stats(data_version)
     
-    return model, r2, mae, feature_names, df_encoded.columns.tolist()
+        # Gjennomsnittspris per kommune
+        avg_by_kommune = per_kommune['snitt'].sort_values(ascending=True)
+        fig_bar = px.bar(
+            x=avg_by_kommune.values,
+            y=avg_by_kommune.index,
+            orientation='h',
+            title='Gjennomsnittspris per kommune',
+            labels={'x': 'Pris (kr)', 'y': 'Kommune'},
+            color=avg_by_kommune.values,
+            color_continuous_scale='blues'
+        )
+        fig_bar.update_layout(showlegend=False)
+    
+        # Pris per kvm per kommune
+        avg_kvm_by_kommune = per_kommune['kr_kvm'].sort_values(ascending=True)
+        fig_bar2 = px.bar(
+            x=avg_kvm_by_kommune.values,
+            y=avg_kvm_by_kommune.index,
+            orientation='h',
+            title='Pris per kvm per kommune',
+            labels={'x': 'Kr/kvm', 'y': 'Kommune'},
+            color=avg_kvm_by_kommune.values,
+            color_continuous_scale='purples'
+        )
+        fig_bar2.update_layout(showlegend=False)
+    
+        # Antall boliger per boligtype
+        type_counts = per_type['antall'].sort_values(ascending=False)
+        fig_pie = px.pie(
+            values=type_counts.values,
+            names=type_counts.index,
+            title='Fordeling av boligtyper',
+            hole=0.4
+        )
+        return fig_bar, fig_bar2, fig_pie
 
-def main():
-    # Header
-    st.markdown('<h1 class="main-header">🏠 Boligmarked Østfold</h1>', unsafe_allow_html=True)
-    st.markdown("**AI-drevet analyse av boligpriser i Østfold**")
-    st.markdown("---")
+@st.cache_resource(max_entries=64)
+def fig_sammenligning(data_version, kommune, boligtype, storrelse, predikert_pris, k):
+    """Lignende boliger og de k mest sammenlignbare mot prediksjonen"""
+    with METRICS.span('app_figure', figur='sammenligning'):
+        import charts
+        import plotly.graph_objects as go
     
-    # Last data
-    df = load_data()
+        similar_boliger = get_similar(data_version, kommune, boligtype)
+        naboer, _ = get_comparables(data_version).comparables(storrelse, kommune, boligtype, k)
+        fig_comparison = go.Figure()
     
-    # Sidebar filters
-    st.sidebar.header("🔍 Filtrer data")
+        # Scatter av lignende boliger
+        if len(similar_boliger) > 0:
+            fig_comparison.add_trace(charts.scatter_trace(
+                similar_boliger,
+                x='storrelse_kvm',
+                y='pris',
+                mode='markers',
+                name=f'{boligtype} i {kommune}',
+                marker=dict(size=8, color='lightblue', opacity=0.6)
+            ))
     
-    # Kommune filter
-    kommuner = ['Alle'] + sorted(df['kommune'].unique().tolist())
-    valgt_kommune = st.sidebar.selectbox("Velg kommune:", kommuner)
-    
-    # Boligtype filter
-    boligtyper = ['Alle'] + sorted(df['boligtype'].unique().tolist())
-    valgt_type = st.sidebar.selectbox("Velg boligtype:", boligtyper)
-    
-    # Pris range
-    min_pris = int(df['pris'].min())
-    max_pris = int(df['pris'].max())
-    pris_range = st.sidebar.slider(
-        "Prisintervall (kr):",
-        min_pris, max_pris,
-        (min_pris, max_pris),
-        step=100000,
-        format="%d kr"
-    )
+        # De mest sammenlignbare (kan være fra andre kommuner/boligtyper)
+        fig_comparison.add_trace(go.Scatter(
+            x=naboer['storrelse_kvm'],
+            y=naboer['pris'],
+            mode='markers',
+            name=f'{len(naboer)} mest sammenlignbare',
+            text=naboer['boligtype'].astype(str) + ' i ' + naboer['kommune'].astype(str),
+            marker=dict(size=11, color='orange', line=dict(width=1, color='black'))
+        ))
     
-    # Filtrer data
-    df_filtered = df.copy()
-    if valgt_kommune != 'Alle':
-        df_filtered = df_filtered[df_filtered['kommune'] == valgt_kommune]
-    if valgt_type != 'Alle':
-        df_filtered = df_filtered[df_filtered['boligtype'] == valgt_type]
-    df_filtered = df_filtered[
-        (df_filtered['pris'] >= pris_range[0]) & 
-        (df_filtered['pris'] <= pris_range[1])
-    ]
+        # Din prediksjon
+        fig_comparison.add_trace(go.Scatter(
+            x=[storrelse],
+            y=[predikert_pris],
+            mode='markers',
+            name='Din prediksjon',
+            marker=dict(size=20, color='red', symbol='star')
+        ))
     
-    # Main metrics
-    col1, col2, col3, col4 = st.columns(4)
+        fig_comparison.update_layout(
+            title=f'Sammenligning: {boligtype} i {kommune}',
+            xaxis_title='Størrelse (kvm)',
+            yaxis_title='Pris (kr)',
+            hovermode='closest'
+        )
+        return fig_comparison
+
+@st.cache_resource
+def get_history(history_version):
+    """Prishistorikken (hendelsene lastes ved første prisforløp), én per historikkversjon"""
+    return PriceHistory()
+
+@st.cache_resource(max_entries=32)
+def fig_prisutvikling(history_version, kommune, boligtype):
+    """Median pris per dag og hendelser per dag fra den ferdigberegnede serien i historikken"""
+    with METRICS.span('app_figure', figur='prisutvikling'):
+        import plotly.express as px
+    
+        serie = get_history(history_version).series(kommune, boligtype)
+        omrade = f"{boligtype or 'Alle boligtyper'} i {kommune or 'alle kommuner'}"
+        fig_median = px.line(
+            serie.reset_index(),
+            x='dag',
+            y='median_pris',
+            title=f'Medianpris: {omrade}',
+            labels={'dag': 'Dag', 'median_pris': 'Medianpris (kr)'},
+            markers=True
+        )
+        fig_hendelser = px.bar(
+            serie.reset_index(),
+            x='dag',
+            y=['ny', 'pris', 'fjernet', 'relistet'],
+            title='Nye, prisendrede, fjernede og relistede annonser per dag',
+            labels={'dag': 'Dag', 'value': 'Annonser', 'variable': 'Hendelse'},
+            barmode='group'
+        )
+        return serie, fig_median, fig_hendelser
+
+@st.cache_resource
+def get_stats_table(data_version):
+    """Statistikk per kommune til fanen Analyser"""
+    with METRICS.span('app_figure', figur='stats_table'):
+        per_kommune, _ = get_group_stats(data_version)
+        stats = per_kommune.round(0)
+        stats.columns = ['Antall', 'Snitt', 'Median', 'Min', 'Maks', 'Snitt kvm', 'Kr/kvm']
+        return stats.sort_values('Antall', ascending=False)
+
+def vis_oversikt(data_version, filtre, antall):
+    import charts
+    
+    st.header("Prisfordeling")
+    fig_hist, fig_box = fig_prisfordeling(data_version, *filtre)
+    
+    col1, col2 = st.columns(2)
     
     with col1:
-        st.metric("📊 Antall boliger", format_number(len(df_filtered)))
+        st.plotly_chart(fig_hist, use_container_width=True)
+    
     with col2:
-        st.metric("💰 Gjennomsnittspris", format_currency(df_filtered['pris'].mean()))
-    with col3:
-        st.metric("📏 Snitt størrelse", f"{df_filtered['storrelse_kvm'].mean():.0f} kvm")
-    with col4:
-        st.metric("📈 Pris/kvm", format_currency(df_filtered['pris_per_kvm'].mean()))
+        st.plotly_chart(fig_box, use_container_width=True)
     
-    st.markdown("---")
+    # Scatter: Størrelse vs Pris
+    st.subheader("Størrelse vs Pris")
+    scatter_mode = charts.SCATTER_MODES[0]
+    if antall > charts.RENDER_THRESHOLD:
+        scatter_mode = st.radio("Visning:", charts.SCATTER_MODES, horizontal=True,
+                                help="Punkter viser et utvalg som beholder avvikerne, tetthet viser alle boligene")
+    st.plotly_chart(fig_storrelse_pris(data_version, *filtre, scatter_mode), use_container_width=True)
+
+def vis_per_omrade(data_version):
+    st.header("Sammenligning per område")
+    fig_bar, fig_bar2, fig_pie = fig_per_omrade(data_version)
     
-    # Tabs
-    tab1, tab2, tab3, tab4 = st.tabs(["📊 Oversikt", "🗺️ Per område", "🤖 Priskalkulator", "📈 Analyser"])
+    col1, col2 = st.columns(2)
     
-    with tab1:
-        st.header("Prisfordeling")
-        
-        col1, col2 = st.columns(2)
+    with col1:
+        st.plotly_chart(fig_bar, use_container_width=True)
+    
+    with col2:
+        st.plotly_chart(fig_bar2, use_container_width=True)
+    
+    # Antall boliger per boligtype
+    st.subheader("Boligtyper")
+    st.plotly_chart(fig_pie, use_container_width=True)
+
+def vis_priskalkulator(data_version, options):
+    st.header("🤖 AI Priskalkulator")
+    st.markdown("Bruk maskinlæring til å predikere boligpris basert på størrelse, kommune og boligtype")
+    
+    # Hent modell fra registeret (trenes bare når datasettet er endret)
+    pricer, r2, mae = get_model(data_version)
+    
+    col1, col2 = st.columns([1, 1])
+    
+    with col1:
+        st.subheader("Inndata")
         
-        with col1:
-            # Histogram
-            fig_hist = px.histogram(
-                df_filtered,
-                x='pris',
-                nbins=30,
-                title='Prisfordeling',
-                labels={'pris': 'Pris (kr)', 'count': 'Antall boliger'},
-                color_discrete_sequence=['#667eea']
-            )
-            fig_hist.update_layout(showlegend=False)
-            st.plotly_chart(fig_hist, use_container_width=True)
+        # Input størrelse
+        storrelse_input = st.slider(
+            "Størrelse (kvm):",
+            min_value=20,
+            max_value=300,
+            value=100,
+            step=5
+        )
         
-        with col2:
-            # Box plot
-            fig_box = px.box(
-                df_filtered,
-                y='pris',
-                title='Prissprednng (box plot)',
-                labels={'pris': 'Pris (kr)'},
-                color_discrete_sequence=['#764ba2']
-            )
-            st.plotly_chart(fig_box, use_container_width=True)
+        # Input kommune
+        kommune_input = st.selectbox(
+            "Velg kommune:",
+            options['kommuner']
+        )
         
-        # Scatter: Størrelse vs Pris
-        st.subheader("Størrelse vs Pris")
-        fig_scatter = px.scatter(
-            df_filtered,
-            x='storrelse_kvm',
-            y='pris',
-            color='boligtype',
-            hover_data=['kommune', 'tittel'],
-            title='Sammenheng mellom størrelse og pris',
-            labels={'storrelse_kvm': 'Størrelse (kvm)', 'pris': 'Pris (kr)'}
+        # Input boligtype
+        boligtype_input = st.selectbox(
+            "Velg boligtype:",
+            options['boligtyper']
         )
-        st.plotly_chart(fig_scatter, use_container_width=True)
-    
-    with tab2:
-        st.header("Sammenligning per område")
         
-        col1, col2 = st.columns(2)
+        antall_naboer = st.slider("Antall sammenlignbare boliger:", min_value=3, max_value=25, value=10)
         
-        with col1:
-            # Gjennomsnittspris per kommune
-            avg_by_kommune = df.groupby('kommune')['pris'].mean().sort_values(ascending=True)
-            fig_bar = px.bar(
-                x=avg_by_kommune.values,
-                y=avg_by_kommune.index,
-                orientation='h',
-                title='Gjennomsnittspris per kommune',
-                labels={'x': 'Pris (kr)', 'y': 'Kommune'},
-                color=avg_by_kommune.values,
-                color_continuous_scale='blues'
-            )
-            fig_bar.update_layout(showlegend=False)
-            st.plotly_chart(fig_bar, use_container_width=True)
+        # Prediker
+        with METRICS.span('app_predict'):
+            predikert_pris = pricer.predict_one(storrelse_input, kommune_input, boligtype_input)
         
-        with col2:
-            # Pris per kvm per kommune
-            avg_kvm_by_kommune = df.groupby('kommune')['pris_per_kvm'].mean().sort_values(ascending=True)
-            fig_bar2 = px.bar(
-                x=avg_kvm_by_kommune.values,
-                y=avg_kvm_by_kommune.index,
-                orientation='h',
-                title='Pris per kvm per kommune',
-                labels={'x': 'Kr/kvm', 'y': 'Kommune'},
-                color=avg_kvm_by_kommune.values,
-                color_continuous_scale='purples'
-            )
-            fig_bar2.update_layout(showlegend=False)
-            st.plotly_chart(fig_bar2, use_container_width=True)
+        # Avstandsvektet estimat fra de nærmeste boligene (KD-tre, under 1 ms)
+        with METRICS.span('app_comparables'):
+            naboer, naboestimat = get_comparables(data_version).comparables(
+                storrelse_input, kommune_input, boligtype_input, antall_naboer)
         
-        # Antall boliger per boligtype
-        st.subheader("Boligtyper")
-        type_counts = df['boligtype'].value_counts()
-        fig_pie = px.pie(
-            values=type_counts.values,
-            names=type_counts.index,
-            title='Fordeling av boligtyper',
-            hole=0.4
-        )
-        st.plotly_chart(fig_pie, use_container_width=True)
+        st.markdown("### Predikert pris:")
+        st.markdown(f"## {format_currency(predikert_pris)}")
+        st.caption(f"Estimat fra de {len(naboer)} mest sammenlignbare boligene: {format_currency(naboestimat)}")
+        
+        st.info(f"""
+        **Modell-nøyaktighet:**
+        - R² score: {r2:.3f}
+        - Gjennomsnittlig avvik: {format_currency(mae)}
+        
+        *Prediksjonen er basert på {format_number(options['antall'])} boliger i Østfold*
+        
+        **R² forklaring:**
+        - 1.0 = Perfekt prediksjon
+        - 0.7+ = God modell
+        - 0.5-0.7 = OK modell
+        - <0.5 = Svak modell
+        """)
     
-    with tab3:
-        st.header("🤖 AI Priskalkulator")
-        st.markdown("Bruk maskinlæring til å predikere boligpris basert på størrelse, kommune og boligtype")
+    with col2:
+        st.subheader("Visualisering")
         
-        # Tren modell
-        model, r2, mae, feature_names, all_columns = train_price_model(df)
+        # Sammenlign med faktiske boliger i samme kategori
+        similar_boliger = get_similar(data_version, kommune_input, boligtype_input)
         
-        col1, col2 = st.columns([1, 1])
+        fig_comparison = fig_sammenligning(data_version, kommune_input, boligtype_input,
+                                           storrelse_input, round(predikert_pris), antall_naboer)
+        st.plotly_chart(fig_comparison, use_container_width=True)
         
-        with col1:
-            st.subheader("Inndata")
-            
-            # Input størrelse
-            storrelse_input = st.slider(
-                "Størrelse (kvm):",
-                min_value=20,
-                max_value=300,
-                value=100,
-                step=5
-            )
-            
-            # Input kommune
-            kommune_input = st.selectbox(
-                "Velg kommune:",
-                sorted(df['kommune'].unique())
-            )
-            
-            # Input boligtype
-            boligtype_input = st.selectbox(
-                "Velg boligtype:",
-                sorted(df['boligtype'].unique())
-            )
-            
-            # Lag input array for modell
-            # Opprett en rad med alle kolonner satt til 0
-            input_data = pd.DataFrame(0, index=[0], columns=all_columns)
-            
-            # Sett størrelse
-            input_data['storrelse_kvm'] = storrelse_input
-            
-            # Sett kommune (one-hot encoded)
-            kommune_col = f'kommune_{kommune_input}'
-            if kommune_col in input_data.columns:
-                input_data[kommune_col] = 1
-            
-            # Sett boligtype (one-hot encoded)
-            boligtype_col = f'boligtype_{boligtype_input}'
-            if boligtype_col in input_data.columns:
-                input_data[boligtype_col] = 1
-            
-            # Fjern pris-kolonnen (target)
-            input_features = input_data.drop('pris', axis=1, errors='ignore')
-            
-            # Prediker
-            predikert_pris = model.predict(input_features)[0]
-            
-            st.markdown("### Predikert pris:")
-            st.markdown(f"## {format_currency(predikert_pris)}")
-            
-            st.info(f"""
-            **Modell-nøyaktighet:**
-            - R² score: {r2:.3f}
-            - Gjennomsnittlig avvik: {format_currency(mae)}
-            
-            *Prediksjonen er basert på {format_number(len(df))} boliger i Østfold*
-            
-            **R² forklaring:**
-            - 1.0 = Perfekt prediksjon
-            - 0.7+ = God modell
-            - 0.5-0.7 = OK modell
-            - <0.5 = Svak modell
-            """)
+        if len(similar_boliger) > 0:
+            # Statistikk for lignende boliger
+            st.markdown("**Lignende boliger i markedet:**")
+            st.write(f"- Antall: {len(similar_boliger)}")
+            st.write(f"- Gjennomsnittspris: {format_currency(similar_boliger['pris'].mean())}")
+            st.write(f"- Prisintervall: {format_currency(similar_boliger['pris'].min())} - {format_currency(similar_boliger['pris'].max())}")
+        else:
+            st.info(f"Ingen {boligtype_input} funnet i {kommune_input} i datasettet - "
+                    f"viser de mest sammenlignbare fra andre kommuner og boligtyper.")
         
-        with col2:
-            st.subheader("Visualisering")
-            
-            # Sammenlign med faktiske boliger i samme kategori
-            similar_boliger = df[
-                (df['kommune'] == kommune_input) & 
-                (df['boligtype'] == boligtype_input)
-            ]
-            
-            if len(similar_boliger) > 0:
-                fig_comparison = go.Figure()
-                
-                # Scatter av lignende boliger
-                fig_comparison.add_trace(go.Scatter(
-                    x=similar_boliger['storrelse_kvm'],
-                    y=similar_boliger['pris'],
-                    mode='markers',
-                    name=f'{boligtype_input} i {kommune_input}',
-                    marker=dict(size=8, color='lightblue', opacity=0.6)
-                ))
-                
-                # Din prediksjon
-                fig_comparison.add_trace(go.Scatter(
-                    x=[storrelse_input],
-                    y=[predikert_pris],
-                    mode='markers',
-                    name='Din prediksjon',
-                    marker=dict(size=20, color='red', symbol='star')
-                ))
-                
-                fig_comparison.update_layout(
-                    title=f'Sammenligning: {boligtype_input} i {kommune_input}',
-                    xaxis_title='Størrelse (kvm)',
-                    yaxis_title='Pris (kr)',
-                    hovermode='closest'
-                )
-                
-                st.plotly_chart(fig_comparison, use_container_width=True)
-                
-                # Statistikk for lignende boliger
-                st.markdown("**Lignende boliger i markedet:**")
-                st.write(f"- Antall: {len(similar_boliger)}")
-                st.write(f"- Gjennomsnittspris: {format_currency(similar_boliger['pris'].mean())}")
-                st.write(f"- Prisintervall: {format_currency(similar_boliger['pris'].min())} - {format_currency(similar_boliger['pris'].max())}")
-            else:
-                st.warning(f"Ingen {boligtype_input} funnet i {kommune_input} i datasettet.")
+        st.markdown("**Mest sammenlignbare boliger:**")
+        st.dataframe(
+            naboer[['tittel', 'pris', 'storrelse_kvm', 'pris_per_kvm', 'boligtype', 'kommune', 'avstand']].round(
+                {'avstand': 2}),
+            use_container_width=True,
+            hide_index=True
+        )
+
+def vis_prisutvikling(filtre):
+    st.header("📉 Prisutvikling")
+    history = PriceHistory()
+    history_version = history.version()
+    if not os.path.exists(history.series_path):
+        st.info("Ingen prishistorikk ennå - den bygges opp av hver kjøring av scraper.py")
+        return
+    
+    serie, fig_median, fig_hendelser = fig_prisutvikling(history_version, filtre[0], filtre[1])
+    if serie.empty:
+        st.info("Ingen historikk for dette utvalget")
+        return
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("📅 Dager med data", len(serie))
+    with col2:
+        endring = serie['median_pris'].iloc[-1] - serie['median_pris'].iloc[0]
+        st.metric("💰 Medianpris nå", format_currency(serie['median_pris'].iloc[-1]),
+                  delta=f"{endring:+,.0f} kr".replace(",", " "))
+    with col3:
+        st.metric("🏷️ Prisendringer", format_number(int(serie['pris'].sum())))
+    
+    st.plotly_chart(fig_median, use_container_width=True)
+    st.plotly_chart(fig_hendelser, use_container_width=True)
+    
+    # Prisforløpet til én annonse
+    st.subheader("Prisforløp for en annonse")
+    finn_kode = st.text_input("Finn-kode:", placeholder="f.eks. 123456789")
+    if finn_kode.strip().isdigit():
+        forlop = get_history(history_version).trajectory(finn_kode.strip())
+        if forlop.empty:
+            st.warning("Fant ikke annonsen i historikken")
+        else:
+            st.dataframe(forlop, use_container_width=True, hide_index=True)
+
+def vis_analyser(data_version, filtre):
+    st.header("📈 Detaljert analyse")
     
-    with tab4:
-        st.header("📈 Detaljert analyse")
+    # Statistikk per kommune
+    st.subheader("Statistikk per kommune")
+    st.dataframe(get_stats_table(data_version), use_container_width=True)
+    
+    # Rå data
+    st.subheader("Rå data (filtrert)")
+    st.dataframe(
+        get_filtered(data_version, *filtre)[['tittel', 'pris', 'storrelse_kvm', 'pris_per_kvm', 'boligtype', 'kommune']],
+        use_container_width=True
+    )
+
+def vis_debug_panel(timer):
+    """Latens per del av reruns (skrus på i sidebaren)"""
+    if not st.sidebar.checkbox("🐞 Vis latens (debug)"):
+        return
+    historikk = st.session_state.setdefault('rerun_ms', [])
+    historikk.append(timer.total_ms())
+    del historikk[:-50]
+    
+    with st.sidebar.expander("⏱️ Latens", expanded=True):
+        st.dataframe(pd.DataFrame({'ms': timer.tider}).round(1), use_container_width=True)
+        st.caption(f"Denne rerunen: {historikk[-1]:.0f} ms | median siste {len(historikk)}: "
+                   f"{np.median(historikk):.0f} ms")
+        st.line_chart(pd.Series(historikk, name='ms'), height=120)
         
-        # Statistikk per kommune
-        st.subheader("Statistikk per kommune")
-        stats = df.groupby('kommune').agg({
-            'pris': ['count', 'mean', 'median', 'min', 'max'],
-            'storrelse_kvm': 'mean',
-            'pris_per_kvm': 'mean'
-        }).round(0)
-        stats.columns = ['Antall', 'Snitt', 'Median', 'Min', 'Maks', 'Snitt kvm', 'Kr/kvm']
-        stats = stats.sort_values('Antall', ascending=False)
-        st.dataframe(stats, use_container_width=True)
+        # Alle spans i denne prosessen (alle sesjoner) siden oppstart
+        st.caption("Siden oppstart:")
+        st.dataframe(pd.DataFrame(METRICS.summary()).T.round(1), use_container_width=True)
+
+@st.cache_resource
+def start_metrics():
+    """Trace-fil for app-prosessen - startes én gang, ikke per rerun"""
+    try:
+        METRICS.start_trace(os.path.join(METRICS_DIR, 'app_trace.jsonl'))
+    except OSError:
+        return False
+    return True
+
+def export_metrics(timer):
+    """Rerun-tid til histogrammet og textfile for Prometheus"""
+    METRICS.observe('app_rerun_seconds', timer.total_ms() / 1000)
+    METRICS.inc('app_reruns_total')
+    try:
+        METRICS.write_prometheus(os.path.join(METRICS_DIR, 'app.prom'))
+    except OSError:
+        pass   # Skrivebeskyttet katalog skal ikke stoppe dashboardet
+
+def main():
+    start_metrics()
+    timer = RerunTimer()
+    
+    # Regioner fra det partisjonerte datasettet (scraper.py --fylke), hvis det finnes.
+    # Sjekkes hver rerun, så nye fylker dukker opp uten omstart
+    regioner = fylker(PARTITION_ROOT)
+    store = None if regioner else get_sql_store()
+    st.sidebar.header("🔍 Filtrer data")
+    valgte_fylker = []
+    if regioner:
+        valgte_fylker = st.sidebar.multiselect("Velg fylke:", regioner, default=regioner[:1],
+                                               help="Bare de valgte fylkene lastes inn")
+    omrade = ', '.join(valgte_fylker) if valgte_fylker else ('hele landet' if regioner else 'Østfold')
+    
+    # Header
+    st.markdown(f'<h1 class="main-header">🏠 Boligmarked {omrade}</h1>', unsafe_allow_html=True)
+    st.markdown(f"**AI-drevet analyse av boligpriser i {omrade}**")
+    st.markdown("---")
+    
+    with timer.maal("Data og filtre"):
+        # Last data - fra partisjonene, SQLite-databasen (spørringer) eller fra fil (alt i minnet)
+        if store is not None:
+            data_version = os.path.getmtime(DATA_SQLITE)
+            options = load_options(store, data_version)
+        else:
+            data_version = selection(PARTITION_ROOT, valgte_fylker) if regioner else dataset_version()
+            filter_index = get_filter_index(data_version)
+            options = filter_index.options()
         
-        # Rå data
-        st.subheader("Rå data (filtrert)")
-        st.dataframe(
-            df_filtered[['tittel', 'pris', 'storrelse_kvm', 'pris_per_kvm', 'boligtype', 'kommune']],
-            use_container_width=True
+        # Kommune filter
+        kommuner = ['Alle'] + options['kommuner']
+        valgt_kommune = st.sidebar.selectbox("Velg kommune:", kommuner)
+        
+        # Boligtype filter
+        boligtyper = ['Alle'] + options['boligtyper']
+        valgt_type = st.sidebar.selectbox("Velg boligtype:", boligtyper)
+        
+        # Pris range
+        min_pris = options['min_pris']
+        max_pris = options['max_pris']
+        pris_range = st.sidebar.slider(
+            "Prisintervall (kr):",
+            min_pris, max_pris,
+            (min_pris, max_pris),
+            step=100000,
+            format="%d kr"
         )
+        
+        # Filtrer data
+        filtre = (
+            None if valgt_kommune == 'Alle' else valgt_kommune,
+            None if valgt_type == 'Alle' else valgt_type,
+            tuple(pris_range),
+        )
+        # Nøkkeltallene regnes uten å hente radene - de filtrerte radene
+        # hentes (get_filtered) bare i fanene som viser dem
+        summary = get_summary(data_version, *filtre) if store is not None else filter_index.summary(*filtre)
+    
+    # Main metrics
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric("📊 Antall boliger", format_number(summary['antall']))
+    with col2:
+        st.metric("💰 Gjennomsnittspris", format_currency(summary['pris']))
+    with col3:
+        st.metric("📏 Snitt størrelse", f"{summary['storrelse_kvm']:.0f} kvm")
+    with col4:
+        st.metric("📈 Pris/kvm", format_currency(summary['pris_per_kvm']))
+    
+    st.markdown("---")
+    
+    # Faner - bare den valgte fanen kjøres (st.tabs kjører alle ved hver rerun)
+    fane = st.radio("Fane:", TABS, horizontal=True, label_visibility="collapsed")
+    
+    with timer.maal(fane):
+        if fane == TABS[0]:
+            vis_oversikt(data_version, filtre, summary['antall'])
+        elif fane == TABS[1]:
+            vis_per_omrade(data_version)
+        elif fane == TABS[2]:
+            vis_priskalkulator(data_version, options)
+        elif fane == TABS[3]:
+            vis_prisutvikling(filtre)
+        else:
+            vis_analyser(data_version, filtre)
     
     # Footer
     st.markdown("---")
@@ -399,6 +686,9 @@ def main():
         <a href='https://github.com/Jorgenfje' target='_blank'>GitHub</a></p>
     </div>
     """, unsafe_allow_html=True)
+    
+    vis_debug_panel(timer)
+    export_metrics(timer)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,245 @@
+"""
+Boligmarked Analyse - Arkiv over rå søkeresultat-sider
+Sidene scraperen henter kan lagres komprimert (zlib per side) i et
+append-only arkiv: én segmentfil per kjøring og en JSON-lines indeks med
+URL, tidspunkt, location og side. En uendret side (samme innhold som forrige
+versjon av URL-en) får bare en ny indekslinje som peker på den lagrede kopien.
+
+Replay kjører ekstraksjonen på nytt over arkivet i en prosesspool, uten
+nettverk - når Finn endrer markup eller parseren forbedres:
+
+    python scraper.py --arkiv .finn_arkiv                  # scrape og arkiver
+    python scraper.py --replay --arkiv .finn_arkiv         # parse arkivet på nytt
+    python archive.py --arkiv .finn_arkiv                  # innhold og komprimering
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from extractors import get_extractor
+
+ARCHIVE_DIR = '.finn_arkiv'
+INDEX_FILE = 'indeks.jsonl'
+
+# Sider per oppgave i replay
+PAGES_PER_TASK = 8
+
+
+def _timestamp() -> str:
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+
+def _as_of_bound(as_of: str) -> str:
+    """'2026-10-01' betyr til og med den dagen"""
+    return f"{as_of}T23:59:59Z" if len(as_of) == 10 else as_of
+
+
+class PageArchive:
+    """
+    Append-only arkiv i archive_dir: segmentfiler (<tid>-<pid>.z) med
+    zlib-komprimerte sider etter hverandre, og indeks.jsonl med én linje per
+    arkivert side (segment, offset og lengde peker ut kopien)
+    """
+    def __init__(self, archive_dir: str = ARCHIVE_DIR, level: int = 6):
+        self.archive_dir = archive_dir
+        self.level = level
+        self.index_path = os.path.join(archive_dir, INDEX_FILE)
+        self.lock = threading.Lock()
+        self._segment = None
+        self._segment_name = None
+        self._index = None
+        # Siste lagrede kopi per URL (lastes ved første put) - uendrede sider lagres ikke på nytt
+        self._latest: Optional[Dict[str, Dict]] = None
+
+    def entries(self) -> List[Dict]:
+        """Alle indekslinjer i rekkefølgen de ble skrevet"""
+        if not os.path.exists(self.index_path):
+            return []
+        with open(self.index_path, encoding='utf-8') as f:
+            # En avbrutt skriving kan etterlate en halv siste linje
+            entries = []
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+            return entries
+
+    def put(self, url: str, body: bytes, location_id: str, area_name: str, page: int,
+            sort: Optional[str] = None) -> Dict:
+        """Arkiver en side (trådsikker). Returnerer indekslinjen"""
+        sha1 = hashlib.sha1(body).hexdigest()
+        entry = {'url': url, 'tid': _timestamp(), 'location_id': location_id, 'kommune': area_name,
+                 'side': page, 'sort': sort, 'sha1': sha1, 'bytes': len(body)}
+
+        with self.lock:
+            if self._latest is None:
+                self._latest = {e['url']: e for e in self.entries()}
+            forrige = self._latest.get(url)
+            if forrige is not None and forrige['sha1'] == sha1:
+                entry.update(segment=forrige['segment'], offset=forrige['offset'], lengde=forrige['lengde'])
+            else:
+                blob = zlib.compress(body, self.level)
+                segment = self._open_segment()
+                entry.update(segment=self._segment_name, offset=segment.tell(), lengde=len(blob))
+                segment.write(blob)
+                # Dataene må være på disk før indekslinjen som peker på dem
+                segment.flush()
+            self._open_index().write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self._latest[url] = entry
+        return entry
+
+    def _open_segment(self):
+        if self._segment is None:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            self._segment_name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.z"
+            self._segment = open(os.path.join(self.archive_dir, self._segment_name), 'ab')
+        return self._segment
+
+    def _open_index(self):
+        # Egen åpning - en kjøring der alle sider er uendret åpner aldri et segment
+        if self._index is None:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            self._index = open(self.index_path, 'a', encoding='utf-8', buffering=1)
+        return self._index
+
+    def close(self) -> None:
+        with self.lock:
+            if self._segment is not None:
+                self._segment.close()
+            if self._index is not None:
+                self._index.close()
+            self._segment = self._index = None
+
+    def read(self, entry: Dict) -> bytes:
+        """Den arkiverte siden for en indekslinje"""
+        return read_page(self.archive_dir, entry)
+
+    def select(self, as_of: Optional[str] = None, location_ids: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Sidene fra siste henting av hver location (til og med as_of, ISO-tid
+        eller dato), sortert etter location i arkivets rekkefølge og deretter side.
+        En henting starter med side 1, så sider fra eldre hentinger (f.eks. en
+        side 12 når søket nå bare har 10 sider) tas ikke med
+        """
+        bound = _as_of_bound(as_of) if as_of else None
+        latest: Dict[str, Dict] = {}
+        run_start: Dict[Tuple[str, Optional[str]], str] = {}
+        location_order: Dict[str, int] = {}
+        for entry in self.entries():
+            if bound is not None and entry['tid'] > bound:
+                continue
+            if location_ids is not None and entry['location_id'] not in location_ids:
+                continue
+            location_order.setdefault(entry['location_id'], len(location_order))
+            latest[entry['url']] = entry
+            if entry['side'] == 1:
+                run_start[(entry['location_id'], entry['sort'])] = entry['tid']
+
+        selected = [e for e in latest.values() if e['tid'] >= run_start.get((e['location_id'], e['sort']), '')]
+        return sorted(selected, key=lambda e: (location_order[e['location_id']], e['sort'] or '', e['side']))
+
+    def stats(self) -> Dict:
+        """Antall sider, snapshots og komprimering"""
+        entries = self.entries()
+        blobs = {(e['segment'], e['offset']): e for e in entries}
+        raw = sum(e['bytes'] for e in blobs.values())
+        stored = sum(e['lengde'] for e in blobs.values())
+        return {
+            'indekslinjer': len(entries),
+            'urler': len({e['url'] for e in entries}),
+            'lagrede_sider': len(blobs),
+            'dager': sorted({e['tid'][:10] for e in entries}),
+            'rå_mb': raw / 1e6,
+            'lagret_mb': stored / 1e6,
+            'komprimering': raw / stored if stored else 0.0,
+        }
+
+
+def read_page(archive_dir: str, entry: Dict) -> bytes:
+    with open(os.path.join(archive_dir, entry['segment']), 'rb') as f:
+        f.seek(entry['offset'])
+        return zlib.decompress(f.read(entry['lengde']))
+
+
+_archive_dir: Optional[str] = None
+_extractor = None
+
+
+def _init_worker(archive_dir: str, extractor: str) -> None:
+    global _archive_dir, _extractor
+    _archive_dir = archive_dir
+    _extractor = get_extractor(extractor)
+
+
+def _parse_entries(entries: List[Dict]) -> List[Optional[List[Dict]]]:
+    """Les og parse en bit av arkivet (i en worker)"""
+    return [_extractor.parse_page(read_page(_archive_dir, entry), entry['kommune']) for entry in entries]
+
+
+def iter_replay(archive_dir: str = ARCHIVE_DIR, extractor: str = 'lxml', workers: int = 1,
+                as_of: Optional[str] = None, location_ids: Optional[List[str]] = None,
+                stats: Optional[Dict] = None) -> Iterator[Tuple[str, str, List[Dict]]]:
+    """
+    Parse arkiverte sider på nytt og gi (location_id, area_name, boliger) per
+    location, samme form som pipeline.fetch. Sidene parses i biter på
+    PAGES_PER_TASK i `workers` prosesser, med maks 2 biter per worker i arbeid
+    """
+    entries = PageArchive(archive_dir).select(as_of, location_ids)
+    tasks = [entries[i:i + PAGES_PER_TASK] for i in range(0, len(entries), PAGES_PER_TASK)]
+    # En bit skal bare inneholde sider fra én location
+    tasks = [[e for e in task if e['location_id'] == loc]
+             for task in tasks for loc in dict.fromkeys(e['location_id'] for e in task)]
+
+    def results() -> Iterator[Tuple[List[Dict], List[Optional[List[Dict]]]]]:
+        if workers <= 1:
+            _init_worker(archive_dir, extractor)
+            for task in tasks:
+                yield task, _parse_entries(task)
+            return
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(archive_dir, extractor)) as pool:
+            pending = deque()
+            for task in tasks:
+                pending.append((task, pool.submit(_parse_entries, task)))
+                if len(pending) >= 2 * workers:
+                    task, future = pending.popleft()
+                    yield task, future.result()
+            while pending:
+                task, future = pending.popleft()
+                yield task, future.result()
+
+    current: Optional[Tuple[str, str]] = None
+    boliger: List[Dict] = []
+    for task, sider in results():
+        location = (task[0]['location_id'], task[0]['kommune'])
+        if current is not None and location != current:
+            yield current[0], current[1], boliger
+            boliger = []
+        current = location
+        for side in sider:
+            boliger.extend(side or [])
+        if stats is not None:
+            stats['sider'] = stats.get('sider', 0) + len(task)
+    if current is not None:
+        yield current[0], current[1], boliger
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vis innholdet i side-arkivet")
+    parser.add_argument('--arkiv', default=ARCHIVE_DIR, help="Arkivmappe")
+    args = parser.parse_args()
+
+    stats = PageArchive(args.arkiv).stats()
+    print(f"🗄️  {args.arkiv}: {stats['lagrede_sider']} lagrede sider for {stats['urler']} URL-er "
+          f"({stats['indekslinjer']} hentinger)")
+    print(f"   {stats['rå_mb']:.1f} MB rå -> {stats['lagret_mb']:.1f} MB lagret ({stats['komprimering']:.1f}×)")
+    if stats['dager']:
+        print(f"   Snapshots fra {stats['dager'][0]} til {stats['dager'][-1]} ({len(stats['dager'])} dager)")
@@ -0,0 +1,162 @@
+"""
+Lasttest av HTTP-API-et (api.py) på localhost: starter serveren i en egen
+prosess (eller bruker --url), kjører hvert scenario i --varighet sekunder
+med --klienter samtidige keep-alive-forbindelser, og rapporterer p50/p99
+latens og forespørsler per sekund. Klientene kjører i samme maskin, så på
+få kjerner konkurrerer de med serveren om CPU
+
+    python benchmarks/bench_api.py
+    python benchmarks/bench_api.py --klienter 1 8 32 --varighet 10
+    python benchmarks/bench_api.py --url http://127.0.0.1:8502
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+Request = Tuple[str, str, bytes]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(data: str, port: int, timeout: float = 300) -> subprocess.Popen:
+    """Start api.py og vent til /health svarer (modellen kan måtte trenes først)"""
+    cmd = [sys.executable, os.path.join(ROOT, 'api.py'), '--port', str(port)] + (['--data', data] if data else [])
+    proc = subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.DEVNULL)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"api.py avsluttet med kode {proc.returncode}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("api.py svarte ikke på /health")
+
+
+def get_json(host: str, port: int, path: str) -> Dict:
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    conn.request('GET', path)
+    return json.loads(conn.getresponse().read())
+
+
+def scenarios(kommuner: List[str], boligtyper: List[str], batch: int) -> Dict[str, Callable[[random.Random], Request]]:
+    """Forespørselsgeneratorer per scenario: (metode, sti, body)"""
+    def bolig(rng: random.Random, unik: bool) -> Dict:
+        # Unike størrelser (desimaler) treffer aldri cachen, runde størrelser fra en liten mengde gjør det
+        storrelse = round(rng.uniform(30, 250), 3) if unik else rng.choice([60, 80, 100, 120])
+        return {'storrelse': storrelse, 'kommune': rng.choice(kommuner), 'boligtype': rng.choice(boligtyper)}
+
+    def batch_body(rng: random.Random) -> bytes:
+        return json.dumps({'boliger': [bolig(rng, True) for _ in range(batch)]}).encode('utf-8')
+
+    return {
+        'predict (unik)': lambda rng: ('GET', '/predict?' + urlencode(bolig(rng, True)), b''),
+        'predict (cache)': lambda rng: ('GET', '/predict?' + urlencode(bolig(rng, False)), b''),
+        'comparables (unik)': lambda rng: ('GET', '/comparables?' + urlencode({**bolig(rng, True), 'k': 10}), b''),
+        'stats': lambda rng: ('GET', '/stats?' + urlencode({'by': rng.choice(['kommune', 'boligtype'])}), b''),
+        f'predict batch ({batch})': lambda rng: ('POST', '/predict', batch_body(rng)),
+    }
+
+
+def run(host: str, port: int, make_request: Callable[[random.Random], Request], klienter: int,
+        varighet: float) -> Dict:
+    """Kjør scenarioet med `klienter` tråder i `varighet` sekunder"""
+    tider: List[List[float]] = [[] for _ in range(klienter)]
+    feil = [0] * klienter
+    start_signal = threading.Event()
+    deadline = [0.0]
+
+    def client(i: int) -> None:
+        rng = random.Random(i)
+        conn = http.client.HTTPConnection(host, port, timeout=30)
+        start_signal.wait()
+        while time.perf_counter() < deadline[0]:
+            method, path, body = make_request(rng)
+            headers = {'Content-Type': 'application/json'} if body else {}
+            start = time.perf_counter()
+            conn.request(method, path, body=body or None, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            tider[i].append(time.perf_counter() - start)
+            if response.status != 200:
+                feil[i] += 1
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(klienter)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    t0 = time.perf_counter()
+    deadline[0] = t0 + varighet
+    start_signal.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - t0
+
+    alle = np.concatenate([np.array(t) for t in tider]) if any(tider) else np.array([np.nan])
+    p50, p99 = np.percentile(alle, [50, 99]) * 1000
+    return {'antall': int(sum(len(t) for t in tider)), 'per_sek': sum(len(t) for t in tider) / elapsed,
+            'p50_ms': p50, 'p99_ms': p99, 'feil': sum(feil)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lasttest av HTTP-API-et")
+    parser.add_argument('--url', default=None, help="Kjørende API (standard: start api.py på en ledig port)")
+    parser.add_argument('--data', default=None, help="Datasett for serveren som startes")
+    parser.add_argument('--klienter', type=int, nargs='+', default=[1, 8, 32], help="Samtidige forbindelser")
+    parser.add_argument('--varighet', type=float, default=5.0, help="Sekunder per scenario og klientantall")
+    parser.add_argument('--batch', type=int, default=100, help="Boliger per batch-forespørsel")
+    args = parser.parse_args()
+
+    proc = None
+    if args.url:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        host, port = '127.0.0.1', free_port()
+        print(f"🚀 Starter api.py på port {port}...")
+        proc = start_server(args.data, port)
+
+    try:
+        kommuner = [rad['kommune'] for rad in get_json(host, port, '/stats?by=kommune')['rader']]
+        boligtyper = [rad['boligtype'] for rad in get_json(host, port, '/stats?by=boligtype')['rader']]
+        health = get_json(host, port, '/health')
+        print(f"   {health['boliger']:,} boliger, {os.cpu_count()} kjerner\n".replace(",", " "))
+
+        print(f"{'Scenario':<24}{'Klienter':>9}{'Forespørsler':>14}{'Per sek':>10}{'p50 (ms)':>10}"
+              f"{'p99 (ms)':>10}{'Feil':>6}")
+        for navn, make_request in scenarios(kommuner, boligtyper, args.batch).items():
+            for klienter in args.klienter:
+                r = run(host, port, make_request, klienter, args.varighet)
+                print(f"{navn:<24}{klienter:>9}{r['antall']:>14,}{r['per_sek']:>10,.0f}{r['p50_ms']:>10.2f}"
+                      f"{r['p99_ms']:>10.2f}{r['feil']:>6}".replace(",", " "))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark av sammenlignbare boliger i priskalkulatoren: eksakt filter på
+(kommune, boligtype) slik fanen gjorde det, mot ComparablesIndex i
+indexes.py (KD-tre). Måler byggetid, latens per spørring (p50/p99),
+batch for alle boliger, og sjekker naboene mot et brute force-søk
+
+    python benchmarks/bench_comparables.py --rader 1000 100000 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from indexes import ComparablesIndex
+from storage import DATA_CSV, remove_outliers
+from synthetic import fit_profile, generate
+
+
+def mask_similar(df, kommune, boligtype):
+    """Lignende boliger slik priskalkulatoren fant dem før (full skann)"""
+    return df[(df['kommune'] == kommune) & (df['boligtype'] == boligtype)]
+
+
+def latency_us(fn, queries):
+    """p50 og p99 i mikrosekunder over spørringene"""
+    tider = []
+    for q in queries:
+        start = time.perf_counter()
+        fn(*q)
+        tider.append(time.perf_counter() - start)
+    return np.percentile(tider, [50, 99]) * 1e6
+
+
+def brute_force_ok(index: ComparablesIndex, queries, k: int) -> bool:
+    """Samme avstander som et lineært søk over alle punktene"""
+    for storrelse, kommune, boligtype in queries[:20]:
+        avstand, _ = index.query(storrelse, kommune, boligtype, k)
+        k_code = index.kommuner.get(kommune, -1)
+        t_code = index.boligtyper.get(boligtype, -1)
+        point = index._encode(np.log([storrelse]), index._median_log_kr[[k_code], [t_code]],
+                              np.array([k_code]), np.array([t_code]))[0]
+        fasit = np.sort(np.linalg.norm(index.tree.data - point, axis=1))[:len(avstand)]
+        if not np.allclose(fasit, avstand):
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sammenlignbare boliger")
+    parser.add_argument('--rader', type=int, nargs='+', default=[1_000, 100_000, 1_000_000])
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--spørringer', dest='queries', type=int, default=1000)
+    parser.add_argument('--maks-batch', type=int, default=200_000, help="Maks boliger i batch-målingen")
+    args = parser.parse_args()
+
+    profile = fit_profile(pd.read_csv(DATA_CSV))
+    rng = np.random.default_rng(0)
+
+    print(f"{'Rader':>10}{'Bygg (s)':>10}{'Filter p50/p99 (µs)':>22}{'Tomme':>7}"
+          f"{'Estimat p50/p99 (µs)':>23}{'Naboer p50/p99 (µs)':>22}{'Batch (/s)':>12}{'MdAPE':>7}{'Fasit':>7}")
+    for rader in args.rader:
+        df = remove_outliers(generate(rader, profile))
+        kommuner = df['kommune'].astype(str).unique()
+        boligtyper = df['boligtype'].astype(str).unique()
+        queries = [(float(rng.integers(30, 250)), str(rng.choice(kommuner)), str(rng.choice(boligtyper)))
+                   for _ in range(args.queries)]
+
+        start = time.perf_counter()
+        index = ComparablesIndex(df)
+        bygg = time.perf_counter() - start
+
+        filter_lat = latency_us(lambda s, k, t: mask_similar(df, k, t), queries[:200])
+        tomme = sum(len(mask_similar(df, k, t)) == 0 for _, k, t in queries[:200]) / 200
+        estimat_lat = latency_us(lambda s, k, t: index.estimate(s, k, t, args.k), queries)
+        naboer_lat = latency_us(lambda s, k, t: index.comparables(s, k, t, args.k), queries)
+
+        # Batch på et utvalg (samme tre, alle boliger kan spørres)
+        batch = ComparablesIndex(df.iloc[:args.maks_batch]) if len(df) > args.maks_batch else index
+        start = time.perf_counter()
+        estimat, _ = batch.estimate_batch(args.k)
+        per_sek = len(batch.df) / (time.perf_counter() - start)
+        mdape = float(np.nanmedian(np.abs(estimat / batch.df['pris'].to_numpy(dtype=np.float64) - 1))) * 100
+
+        print(f"{rader:>10,}{bygg:>10.2f}{'%.0f / %.0f' % tuple(filter_lat):>22}{tomme:>7.0%}"
+              f"{'%.0f / %.0f' % tuple(estimat_lat):>23}{'%.0f / %.0f' % tuple(naboer_lat):>22}"
+              f"{per_sek:>12,.0f}{mdape:>6.1f}%{'ok' if brute_force_ok(index, queries, args.k) else 'FEIL':>7}"
+              .replace(",", " "))
+
+
+if __name__ == "__main__":
+    main()
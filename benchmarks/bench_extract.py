@@ -0,0 +1,205 @@
+"""
+Benchmark + paritetssjekk for HTML-ekstraktorene i extractors.py
+
+Pariteten sjekkes på lagrede søkeresultat-sider (benchmarks/fixtures/finn_sok/):
+alle backends skal gi identiske records som den opprinnelige parseren, også
+med ekte markup (entiteter, uavsluttede tagger, nestede annonser). Farten
+måles på sider generert fra boliger_ostfold.csv, med like mange annonser per side.
+
+    python benchmarks/bench_extract.py
+    python benchmarks/bench_extract.py --html ".finn_cache/*.html"   # flere sider til paritet og fart
+"""
+
+import argparse
+import glob
+import html as html_lib
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+from extractors import EXTRACTORS, get_extractor
+
+
+def reference_parse_page(html: bytes, area_name: str):
+    """Den opprinnelige parseren (før extractors.py), brukt som fasit"""
+    base_url = "https://www.finn.no"
+    soup = BeautifulSoup(html, 'html.parser')
+    annonser = soup.find_all('article', class_='sf-search-ad')
+    if not annonser:
+        return None
+
+    def parse_pris(pris_text):
+        if not pris_text:
+            return None
+        nummer = re.sub(r'[^\d]', '', pris_text)
+        try:
+            return float(nummer)
+        except:
+            return None
+
+    def parse_storrelse(size_text):
+        if not size_text:
+            return None
+        match = re.search(r'(\d+)', size_text)
+        if match:
+            return float(match.group(1))
+        return None
+
+    boliger = []
+    for annonse in annonser:
+        try:
+            lenke_tag = annonse.find('a', href=re.compile(r'/realestate/homes/ad.html'))
+            lenke = None
+            finn_kode = None
+            if lenke_tag and lenke_tag.get('href'):
+                lenke = base_url + lenke_tag['href']
+                match = re.search(r'finnkode=(\d+)', lenke)
+                if match:
+                    finn_kode = match.group(1)
+
+            pris = None
+            pris_elements = annonse.find_all(string=re.compile(r'\d+.*kr', re.IGNORECASE))
+            if pris_elements:
+                pris = parse_pris(pris_elements[0])
+
+            storrelse = None
+            size_elements = annonse.find_all(string=re.compile(r'\d+\s*m²'))
+            if size_elements:
+                storrelse = parse_storrelse(size_elements[0])
+
+            tittel = None
+            heading = annonse.find(['h2', 'h3'])
+            if heading:
+                tittel = heading.get_text(strip=True)
+
+            text = annonse.get_text().lower()
+            boligtype = 'Annet'
+            if 'leilighet' in text:
+                boligtype = 'Leilighet'
+            elif 'enebolig' in text:
+                boligtype = 'Enebolig'
+            elif 'rekkehus' in text:
+                boligtype = 'Rekkehus'
+            elif 'tomannsbolig' in text:
+                boligtype = 'Tomannsbolig'
+
+            if pris and storrelse and pris > 100000 and storrelse > 10:
+                boliger.append({
+                    'finn_kode': finn_kode,
+                    'tittel': tittel,
+                    'pris': pris,
+                    'storrelse_kvm': storrelse,
+                    'pris_per_kvm': round(pris / storrelse, 0),
+                    'boligtype': boligtype,
+                    'kommune': area_name,
+                    'lenke': lenke
+                })
+        except:
+            pass
+    return boliger
+
+
+def render_search_page(rows) -> bytes:
+    """Lag en søkeresultat-side i Finn-format fra en bit av datasettet"""
+    articles = []
+    for row in rows:
+        tittel = html_lib.escape(str(row.tittel))
+        pris = f"{int(row.pris):,}".replace(',', ' ')
+        articles.append(f"""
+<article class="sf-search-ad relative">
+  <div class="sf-search-ad-image"><img src="/img/{row.finn_kode}.jpg" alt=""></div>
+  <div class="sf-ad-content">
+    <div class="text-s"><span>{html_lib.escape(str(row.kommune))}</span></div>
+    <h2 class="h4"><a href="/realestate/homes/ad.html?finnkode={row.finn_kode}" id="{row.finn_kode}">
+      <span class="absolute" aria-hidden="true"></span>{tittel}</a></h2>
+    <!-- pris og areal -->
+    <div class="justify-between"><span>{int(row.storrelse_kvm)} m²</span><span>{pris} kr</span></div>
+    <div class="text-s">Selveier &bull; {html_lib.escape(str(row.boligtype))} &bull; 3 soverom</div>
+  </div>
+</article>""")
+    return f"""<!DOCTYPE html>
+<html lang="no"><head><meta charset="utf-8"><title>Boliger til salgs | FINN eiendom</title></head>
+<body><main><section aria-label="Søkeresultater">{''.join(articles)}</section></main></body></html>
+""".encode('utf-8')
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'finn_sok', '*.html')
+
+
+def read_pages(html_glob):
+    """Lagrede HTML-sider som (filnavn, innhold)"""
+    pages = []
+    for path in sorted(glob.glob(html_glob)):
+        with open(path, 'rb') as f:
+            pages.append((os.path.basename(path), f.read()))
+    return pages
+
+
+def generated_pages(csv_path, per_page):
+    """Sider generert fra datasettet - bare til fartsmålingen"""
+    df = pd.read_csv(csv_path)
+    rows = list(df.itertuples(index=False))
+    return [render_search_page(rows[i:i + per_page]) for i in range(0, len(rows), per_page)]
+
+
+def check_parity(pages):
+    """Navnene på sidene der hver backend avviker fra referanseparseren"""
+    fasit = {navn: reference_parse_page(page, 'Bench') for navn, page in pages}
+    return {name: [navn for navn, page in pages if get_extractor(name).parse_page(page, 'Bench') != fasit[navn]]
+            for name in EXTRACTORS}, sum(len(records or []) for records in fasit.values())
+
+
+def run(parse_page, pages, repeat):
+    """Kjør parse_page over alle sider, returner (records, sekunder)"""
+    best = float('inf')
+    records = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        records = []
+        for page in pages:
+            records.extend(parse_page(page, 'Bench') or [])
+        best = min(best, time.perf_counter() - start)
+    return records, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HTML-ekstraktorer")
+    parser.add_argument('--fixtures', default=FIXTURES, help="Glob med lagrede sider til paritetssjekken")
+    parser.add_argument('--html', help="Flere lagrede sider - med i pariteten, og brukes til fartsmålingen")
+    parser.add_argument('--csv', default='boliger_ostfold.csv', help="Datasett for genererte sider")
+    parser.add_argument('--per-side', type=int, default=50, help="Annonser per generert side")
+    parser.add_argument('--repeat', type=int, default=3, help="Antall runder (beste tid brukes)")
+    args = parser.parse_args()
+
+    lagrede = read_pages(args.fixtures) + (read_pages(args.html) if args.html else [])
+    if not lagrede:
+        print("❌ Ingen lagrede sider å sjekke pariteten på")
+        sys.exit(1)
+
+    avvik, antall = check_parity(lagrede)
+    print(f"Paritet på {len(lagrede)} lagrede sider, {antall} annonser:")
+    for name, sider in avvik.items():
+        print(f"  {name:<10}{'✓' if not sider else '✗ ' + ', '.join(sider)}")
+
+    pages = [page for _, page in read_pages(args.html)] if args.html else generated_pages(args.csv, args.per_side)
+    fasit, ref_tid = run(reference_parse_page, pages, args.repeat)
+    print(f"\nFart på {len(pages)} {'lagrede' if args.html else 'genererte'} sider, {len(fasit)} annonser\n")
+    print(f"{'Backend':<12}{'Tid (s)':>10}{'Annonser/sek':>16}")
+    print(f"{'referanse':<12}{ref_tid:>10.3f}{len(fasit) / ref_tid:>16,.0f}")
+    for name in EXTRACTORS:
+        records, tid = run(get_extractor(name).parse_page, pages, args.repeat)
+        print(f"{name:<12}{tid:>10.3f}{len(records) / tid:>16,.0f}")
+
+    if any(avvik.values()):
+        print("\n❌ Backends gir ikke identiske records!")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark av sidebar-filtreringen: boolske masker (slik app.py gjorde det)
+mot FilterIndex i indexes.py, for økende datasettstørrelser
+
+    python benchmarks/bench_filter.py --rader 10000 100000 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from bench_storage import scale_up
+from indexes import FilterIndex
+from storage import DATA_CSV, to_compact
+
+
+def mask_filter(df, kommune, boligtype, pris_range):
+    """Filtreringen slik den var i app.main"""
+    df_filtered = df.copy()
+    if kommune is not None:
+        df_filtered = df_filtered[df_filtered['kommune'] == kommune]
+    if boligtype is not None:
+        df_filtered = df_filtered[df_filtered['boligtype'] == boligtype]
+    return df_filtered[(df_filtered['pris'] >= pris_range[0]) & (df_filtered['pris'] <= pris_range[1])]
+
+
+def time_ms(fn, repeat):
+    """Median tid i millisekunder"""
+    tider = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        tider.append((time.perf_counter() - start) * 1000)
+    return float(np.median(tider))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sidebar-filtrering")
+    parser.add_argument('--csv', default=DATA_CSV, help="Kildedatasett")
+    parser.add_argument('--rader', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    base = pd.read_csv(args.csv)
+    kommune = base['kommune'].mode()[0]
+    boligtype = base['boligtype'].mode()[0]
+    pris_range = (2_000_000, 6_000_000)
+    filtre = [
+        ('kommune+type', kommune, boligtype),
+        ('kommune', kommune, None),
+        ('type', None, boligtype),
+        ('alle', None, None),
+    ]
+
+    # Indeks: posisjoner. Rader: filter() som DataFrame - første kall for en
+    # familie kopierer radene én gang (Første), deretter er det slices
+    print(f"{'Rader':>10}  {'Filter':<14}{'Maske (ms)':>12}{'Indeks (ms)':>13}{'Rader (ms)':>12}"
+          f"{'Første (ms)':>13}{'Summary (ms)':>14}{'Bygg (s)':>10}")
+    for rader in args.rader:
+        df = to_compact(scale_up(base, rader))
+        start = time.perf_counter()
+        index = FilterIndex(df)
+        bygg = time.perf_counter() - start
+
+        for navn, k, t in filtre:
+            maske = time_ms(lambda: mask_filter(df, k, t, pris_range), args.repeat)
+            indeks = time_ms(lambda: index.positions(k, t, pris_range), args.repeat)
+            forste = time_ms(lambda: index.filter(k, t, pris_range), 1)
+            rader_ms = time_ms(lambda: index.filter(k, t, pris_range), args.repeat)
+            summary = time_ms(lambda: index.summary(k, t, pris_range), args.repeat)
+            print(f"{rader:>10,}  {navn:<14}{maske:>12.3f}{indeks:>13.3f}{rader_ms:>12.3f}{forste:>13.3f}"
+                  f"{summary:>14.3f}{bygg:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
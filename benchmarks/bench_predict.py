@@ -0,0 +1,110 @@
+"""
+Benchmark av prisprediksjonen: sklearn-veien slik Priskalkulatoren gjorde det
+(én DataFrame per prediksjon) mot LinearPricer i model.py, skalar og batch.
+Sjekker også at alle veiene gir samme pris
+
+    python benchmarks/bench_predict.py --batch 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from model import LinearPricer, train_price_model
+from storage import DATA_CSV, remove_outliers, to_compact
+
+
+def sklearn_predict(model, all_columns, storrelse, kommune, boligtype):
+    """Prediksjonen slik den var i app.main"""
+    input_data = pd.DataFrame(0, index=[0], columns=all_columns)
+    input_data['storrelse_kvm'] = storrelse
+    kommune_col = f'kommune_{kommune}'
+    if kommune_col in input_data.columns:
+        input_data[kommune_col] = 1
+    boligtype_col = f'boligtype_{boligtype}'
+    if boligtype_col in input_data.columns:
+        input_data[boligtype_col] = 1
+    input_features = input_data.drop('pris', axis=1, errors='ignore')
+    return model.predict(input_features)[0]
+
+
+def sklearn_batch(model, feature_names, storrelse, kommune, boligtype):
+    """Batch via one-hot DataFrame og model.predict"""
+    df = pd.DataFrame({'storrelse_kvm': storrelse, 'kommune': kommune, 'boligtype': boligtype})
+    X = pd.get_dummies(df, columns=['kommune', 'boligtype'])
+    return model.predict(X.reindex(columns=feature_names, fill_value=0))
+
+
+def per_sec(fn, n, repeat=3):
+    """Beste gjennomstrømning (prediksjoner/s) av `repeat` kjøringer"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return n / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark prisprediksjon")
+    parser.add_argument('--csv', default=DATA_CSV, help="Treningsdata")
+    parser.add_argument('--enkelt', type=int, default=1000, help="Antall enkeltprediksjoner")
+    parser.add_argument('--batch', type=int, default=1_000_000, help="Størrelse på batchen")
+    args = parser.parse_args()
+
+    df = to_compact(remove_outliers(pd.read_csv(args.csv)))
+    model, r2, mae, feature_names, all_columns = train_price_model(df)
+    pricer = LinearPricer.from_model(model, feature_names)
+
+    rng = np.random.default_rng(42)
+    kommuner = df['kommune'].astype(str).unique()
+    typer = df['boligtype'].astype(str).unique()
+    storrelse = rng.uniform(20, 300, args.batch)
+    kommune = rng.choice(kommuner, args.batch)
+    boligtype = rng.choice(typer, args.batch)
+
+    # Paritet
+    n_sjekk = min(200, args.batch)
+    forventet = np.array([sklearn_predict(model, all_columns, s, k, t)
+                          for s, k, t in zip(storrelse[:n_sjekk], kommune[:n_sjekk], boligtype[:n_sjekk])])
+    skalar = np.array([pricer.predict_one(s, k, t)
+                       for s, k, t in zip(storrelse[:n_sjekk], kommune[:n_sjekk], boligtype[:n_sjekk])])
+    kommune_kat, boligtype_kat = pd.Categorical(kommune), pd.Categorical(boligtype)
+    batch = pricer.predict(storrelse, kommune, boligtype)
+    sklearn_full = sklearn_batch(model, feature_names, storrelse, kommune, boligtype)
+    assert np.allclose(skalar, forventet, rtol=1e-9), "predict_one avviker fra sklearn"
+    assert np.allclose(batch[:n_sjekk], forventet, rtol=1e-9), "predict avviker fra sklearn"
+    assert np.allclose(batch, sklearn_full, rtol=1e-9), "predict avviker fra sklearn-batch"
+    assert np.allclose(pricer.predict(storrelse, kommune_kat, boligtype_kat), batch, rtol=1e-12), \
+        "predict avviker med kategoriske kolonner"
+    print(f"✓ Paritet med sklearn (R² {r2:.3f}, {len(feature_names)} features)\n")
+
+    n = min(args.enkelt, args.batch)
+    enkelt = list(zip(storrelse[:n], kommune[:n], boligtype[:n]))
+    resultater = [
+        ('sklearn, én DataFrame per kall', per_sec(
+            lambda: [sklearn_predict(model, all_columns, s, k, t) for s, k, t in enkelt], n, repeat=1)),
+        ('LinearPricer.predict_one', per_sec(
+            lambda: [pricer.predict_one(s, k, t) for s, k, t in enkelt], n)),
+        ('sklearn, batch', per_sec(
+            lambda: sklearn_batch(model, feature_names, storrelse, kommune, boligtype), args.batch)),
+        ('LinearPricer.predict', per_sec(
+            lambda: pricer.predict(storrelse, kommune, boligtype), args.batch)),
+        # Som i dashboardet: kategoriske kolonner (to_compact), kodene brukes direkte
+        ('LinearPricer.predict, kategorisk', per_sec(
+            lambda: pricer.predict(storrelse, kommune_kat, boligtype_kat), args.batch)),
+    ]
+    per_kall, batch_rate = resultater[0][1], resultater[2][1]
+    print(f"{'Vei':<34}{'Prediksjoner/s':>18}{'× per kall':>12}{'× sklearn batch':>17}")
+    for navn, rate in resultater:
+        print(f"{navn:<34}{rate:>18,.0f}{rate / per_kall:>12,.1f}{rate / batch_rate:>17,.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Skaleringsbenchmark på syntetiske datasett (synthetic.py) fra 1k til 10M
+annonser: lasting som i app.load_data, sidebar-filtrering, gruppe-aggregater,
+trening, prediksjon og HTML-parsing. Resultatet legges til i
+benchmarks/resultater/skalering.jsonl og sammenlignes med forrige kjøring,
+så regresjoner synes
+
+    python benchmarks/bench_scaling.py
+    python benchmarks/bench_scaling.py --rader 1000 100000 --repeat 5 --toleranse 0.2
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+# model.py importerer sklearn først ved trening - importeres her (bare for
+# sideeffekten) så importtiden ikke måles i train_price_model
+import sklearn.linear_model  # noqa: F401
+import sklearn.metrics  # noqa: F401
+
+from aggregates import AggregateCube
+from bench_extract import render_search_page
+from bench_startup import git_commit, previous_run
+from extractors import FINN_PER_PAGE, get_extractor
+from indexes import FilterIndex
+from model import make_pricer, train_price_model
+from storage import DATA_CSV, load_dataset, remove_outliers, save_dataset, to_compact
+from synthetic import fit_profile, generate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HISTORY = os.path.join(ROOT, 'benchmarks', 'resultater', 'skalering.jsonl')
+
+SIZES = [1_000, 100_000, 1_000_000, 10_000_000]
+
+# Fra denne størrelsen kjøres hvert steg én gang (ellers best av --repeat)
+SINGLE_RUN_FROM = 1_000_000
+
+
+def best_of(fn: Callable, repeat: int):
+    """Beste tid i sekunder av `repeat` kjøringer, og resultatet fra siste"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_size(rader: int, profile: Dict, fmt: str, repeat: int, maks_parse: int, workdir: str) -> Dict:
+    """Alle stegene for ett datasett på `rader` rader. Tider i sekunder"""
+    repeat = 1 if rader >= SINGLE_RUN_FROM else repeat
+    tider: Dict[str, float] = {}
+    info: Dict = {}
+
+    start = time.perf_counter()
+    raw = generate(rader, profile)
+    tider['generer'] = time.perf_counter() - start
+
+    path = os.path.join(workdir, f"boliger_{rader}.{fmt}")
+    start = time.perf_counter()
+    save_dataset(raw, path)
+    tider['lagre'] = time.perf_counter() - start
+    info['fil_mb'] = round(os.path.getsize(path) / 1e6, 1)
+    del raw
+
+    # Samme som app.load_data
+    tider['load_data'], df = best_of(lambda: to_compact(remove_outliers(load_dataset(path))), repeat)
+    info['minne_mb'] = round(df.memory_usage(deep=True).sum() / 1e6, 1)
+
+    tider['filterindeks_bygg'], index = best_of(lambda: FilterIndex(df), repeat)
+    kommune = df['kommune'].mode()[0]
+    boligtype = df['boligtype'].mode()[0]
+    pris_range = (2_000_000, 6_000_000)
+    for navn, k, t in (('kommune+type', kommune, boligtype), ('alle', None, None)):
+        tider[f'filter[{navn}]'], _ = best_of(lambda: index.filter(k, t, pris_range), repeat)
+    tider['summary'], _ = best_of(lambda: index.summary(kommune, None, pris_range), repeat)
+
+    def groupby():
+        return [df.groupby(by, observed=True).agg(antall=('pris', 'count'), snitt=('pris', 'mean'),
+                                                  median=('pris', 'median'))
+                for by in ('kommune', 'boligtype')]
+
+    tider['groupby'], _ = best_of(groupby, repeat)
+    tider['kube_bygg'], cube = best_of(lambda: AggregateCube.build(df), repeat)
+    tider['kube_rollup'], _ = best_of(lambda: (cube.rollup('kommune'), cube.rollup('boligtype')), repeat)
+
+    tider['train_price_model'], (model, _, _, feature_names, _) = best_of(lambda: train_price_model(df), 1)
+    pricer = make_pricer(model, feature_names)
+    kommuner = df['kommune'].astype(str).to_numpy()
+    boligtyper = df['boligtype'].astype(str).to_numpy()
+    tider['predict_batch'], _ = best_of(lambda: pricer.predict(df['storrelse_kvm'], kommuner, boligtyper), repeat)
+    n_one = 10_000
+    par = [(kommuner[i % len(df)], boligtyper[i % len(df)]) for i in range(n_one)]
+    tider['predict_one'], _ = best_of(lambda: [pricer.predict_one(80.0, k, t) for k, t in par], repeat)
+    info['predict_one_us'] = round(tider['predict_one'] / n_one * 1e6, 2)
+
+    # Parsing er lineær i antall annonser - over maks_parse måles et utsnitt og skaleres opp
+    n_parse = min(len(df), maks_parse)
+    rows = list(df.head(n_parse).itertuples(index=False))
+    pages = [render_search_page(rows[i:i + FINN_PER_PAGE]) for i in range(0, len(rows), FINN_PER_PAGE)]
+    extractor = get_extractor('lxml')
+    parse_tid, _ = best_of(lambda: [extractor.parse_page(page, 'Bench') for page in pages], repeat)
+    tider['parse'] = parse_tid * len(df) / n_parse
+    info['parse_per_sek'] = round(n_parse / parse_tid)
+    info['parse_estimert'] = n_parse < len(df)
+
+    info['rader_renset'] = len(df)
+    return {'tider': {navn: round(sek, 6) for navn, sek in tider.items()}, **info}
+
+
+def compare(run: Dict, forrige: Dict, toleranse: float) -> List[str]:
+    """Steg som er mer enn `toleranse` (relativt) tregere enn i forrige kjøring"""
+    regresjoner = []
+    for rader, resultat in run['størrelser'].items():
+        gammel = forrige.get('størrelser', {}).get(rader, {}).get('tider', {})
+        for navn, sek in resultat['tider'].items():
+            # Under 1 ms er støyen større enn endringen
+            if navn in gammel and gammel[navn] > 1e-3 and sek > gammel[navn] * (1 + toleranse):
+                regresjoner.append(f"{int(rader):,} rader {navn}: {gammel[navn]:.4f} s -> {sek:.4f} s "
+                                   f"({sek / gammel[navn] - 1:+.0%})".replace(",", " "))
+    return regresjoner
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Skaleringsbenchmark på syntetiske datasett")
+    parser.add_argument('--rader', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--format', default='parquet', choices=['parquet', 'csv', 'db'])
+    parser.add_argument('--repeat', type=int, default=3, help=f"Runder per steg under {SINGLE_RUN_FROM:,} rader")
+    parser.add_argument('--maks-parse', type=int, default=200_000,
+                        help="Maks annonser som parses - over dette estimeres tiden fra et utsnitt")
+    parser.add_argument('--kilde', default=DATA_CSV, help="Datasett fordelingene tilpasses")
+    parser.add_argument('--toleranse', type=float, default=0.25, help="Relativ endring som regnes som regresjon")
+    parser.add_argument('--ikke-lagre', action='store_true', help="Ikke legg resultatet til i historikken")
+    args = parser.parse_args()
+
+    profile = fit_profile(pd.read_csv(args.kilde))
+    forrige = previous_run(HISTORY)
+    run = {
+        'tid': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'maskin': f"{platform.machine()} / {os.cpu_count()} kjerner",
+        'format': args.format,
+        'størrelser': {},
+    }
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for rader in args.rader:
+            print(f"\n📐 {rader:,} rader ({args.format})".replace(",", " "))
+            resultat = bench_size(rader, profile, args.format, args.repeat, args.maks_parse, workdir)
+            run['størrelser'][str(rader)] = resultat
+            for navn, sek in resultat['tider'].items():
+                merknad = ' (estimert)' if navn == 'parse' and resultat['parse_estimert'] else ''
+                print(f"   {navn:<22}{sek * 1000:>12.2f} ms{merknad}")
+            print(f"   fil {resultat['fil_mb']} MB | minne {resultat['minne_mb']} MB | "
+                  f"predict_one {resultat['predict_one_us']} µs | parse {resultat['parse_per_sek']:,}/s"
+                  .replace(",", " "))
+
+    # Tid per rad ved største mot minste størrelse. Under 1 for steg med fast kostnad eller O(log n)
+    sizes = sorted(int(r) for r in run['størrelser'])
+    if len(sizes) > 1:
+        lo, hi = run['størrelser'][str(sizes[0])]['tider'], run['størrelser'][str(sizes[-1])]['tider']
+        print(f"\n📈 Tid per rad ved {sizes[-1]:_} mot {sizes[0]:_} rader (1.00× = lineær):".replace("_", " "))
+        for navn in lo:
+            if lo[navn] > 0:
+                print(f"   {navn:<22}{(hi[navn] / sizes[-1]) / (lo[navn] / sizes[0]):>8.2f}×")
+
+    if forrige:
+        regresjoner = compare(run, forrige, args.toleranse)
+        print(f"\n🔁 Mot {forrige['commit'] or forrige['tid']}: "
+              f"{len(regresjoner) or 'ingen'} regresjoner over {args.toleranse:.0%}")
+        for linje in regresjoner:
+            print(f"   ⚠️  {linje}")
+
+    if not args.ikke_lagre:
+        os.makedirs(os.path.dirname(HISTORY), exist_ok=True)
+        with open(HISTORY, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(run, ensure_ascii=False) + '\n')
+        print(f"\n📁 Lagt til i {os.path.relpath(HISTORY, ROOT)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Oppstartstid for inngangspunktene, målt med `python -X importtime` i en ny
+prosess per måling. Viser hvilke tunge biblioteker hvert inngangspunkt
+drar inn og de tregeste importene, og legger resultatet til i
+benchmarks/resultater/oppstart.jsonl så utviklingen kan følges over tid
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --repeat 5 --topp 15 --mål app scraper
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HISTORY = os.path.join(ROOT, 'benchmarks', 'resultater', 'oppstart.jsonl')
+
+# Det som kjøres ved kald start. 'app' er streamlit-skriptet frem til main()
+# (page config + definisjoner); header og nøkkeltall skal ikke trenge mer
+TARGETS = {
+    'scraper': 'import scraper',
+    'app': 'import app',
+    'model': 'import model',
+    'scoring': 'import scoring',
+}
+
+HEAVY = ['pandas', 'numpy', 'pyarrow', 'sklearn', 'plotly', 'bs4', 'lxml', 'requests', 'streamlit', 'joblib']
+
+
+def parse_importtime(stderr: str) -> List[Tuple[int, str, float]]:
+    """(nivå, modul, kumulativ ms) for hver linje i -X importtime-utskriften"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        rows.append((depth, name.strip(), int(cumulative) / 1000))
+    return rows
+
+
+def measure(code: str) -> Dict:
+    """Én kald import i en ny prosess"""
+    probe = f"{code}; import sys, json; print(json.dumps([m for m in {HEAVY!r} if m in sys.modules]))"
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', probe], cwd=ROOT,
+                          capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        return {'feil': proc.stderr.strip().splitlines()[-1]}
+
+    rows = parse_importtime(proc.stderr)
+    top_level = [ms for depth, _, ms in rows if depth == 0]
+    # Direkte importer fra inngangspunktet (nivå 1) sier mest om hvor tiden går
+    direct = [(name, round(ms, 1)) for depth, name, ms in rows if depth == 1]
+    return {
+        'import_ms': round(sum(top_level), 1),
+        'wall_ms': round(wall_ms, 1),
+        'tunge': json.loads(proc.stdout.strip().splitlines()[-1]),
+        'topp': sorted(direct, key=lambda row: -row[1]),
+    }
+
+
+def best_of(code: str, repeat: int) -> Dict:
+    """Raskeste av `repeat` målinger (minst støy fra disk-cache og andre prosesser)"""
+    results = [measure(code) for _ in range(repeat)]
+    ok = [r for r in results if 'feil' not in r]
+    return min(ok, key=lambda r: r['import_ms']) if ok else results[0]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_run(path: str = HISTORY) -> Optional[Dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        lines = [line for line in f if line.strip()]
+    return json.loads(lines[-1]) if lines else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark kald oppstart (python -X importtime)")
+    parser.add_argument('--mål', dest='targets', nargs='+', default=list(TARGETS), choices=list(TARGETS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--topp', type=int, default=8, help="Antall tregeste importer som vises")
+    parser.add_argument('--ikke-lagre', action='store_true', help="Ikke legg resultatet til i historikken")
+    args = parser.parse_args()
+
+    forrige = previous_run()
+    run = {
+        'tid': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'mål': {},
+    }
+
+    for target in args.targets:
+        result = best_of(TARGETS[target], args.repeat)
+        if 'feil' in result:
+            print(f"❌ {target}: {result['feil']}")
+            run['mål'][target] = {'feil': result['feil']}
+            continue
+
+        endring = ''
+        tidligere = (forrige or {}).get('mål', {}).get(target, {}).get('import_ms')
+        if tidligere:
+            endring = f" ({result['import_ms'] - tidligere:+.0f} ms mot {forrige['commit'] or forrige['tid']})"
+        print(f"\n🚀 {target}: {result['import_ms']:.0f} ms import, {result['wall_ms']:.0f} ms prosess{endring}")
+        print(f"   Tunge biblioteker lastet: {', '.join(result['tunge']) or 'ingen'}")
+        for name, ms in result['topp'][:args.topp]:
+            print(f"   {ms:>8.1f} ms  {name}")
+
+        run['mål'][target] = {key: result[key] for key in ('import_ms', 'wall_ms', 'tunge')}
+        run['mål'][target]['topp'] = result['topp'][:args.topp]
+
+    if not args.ikke_lagre:
+        os.makedirs(os.path.dirname(HISTORY), exist_ok=True)
+        with open(HISTORY, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(run, ensure_ascii=False) + '\n')
+        print(f"\n📁 Lagt til i {os.path.relpath(HISTORY, ROOT)}")
+
+
+if __name__ == "__main__":
+    main()
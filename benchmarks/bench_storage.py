@@ -0,0 +1,76 @@
+"""
+Benchmark av lagringsformatene i storage.py
+
+Skalerer opp boliger_ostfold.csv til ønsket antall rader, skriver det som
+ren CSV (slik app.py leste det før) og som kompakt Parquet, og måler
+lastetid og minnebruk for begge.
+
+    python benchmarks/bench_storage.py --rader 1000000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from storage import DATA_CSV, load_dataset, save_dataset
+
+
+def scale_up(df: pd.DataFrame, rader: int) -> pd.DataFrame:
+    """Gjenta datasettet til `rader` rader, med unike finn_koder"""
+    reps = -(-rader // len(df))
+    big = pd.concat([df] * reps, ignore_index=True).iloc[:rader].copy()
+    big['finn_kode'] = np.arange(400_000_000, 400_000_000 + len(big))
+    big['lenke'] = "https://www.finn.no/realestate/homes/ad.html?finnkode=" + big['finn_kode'].astype(str)
+    return big
+
+
+def best_of(fn, repeat):
+    """Beste tid av `repeat` kjøringer, og resultatet"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CSV vs Parquet")
+    parser.add_argument('--csv', default=DATA_CSV, help="Kildedatasett")
+    parser.add_argument('--rader', type=int, default=1_000_000, help="Antall rader i testdatasettet")
+    parser.add_argument('--repeat', type=int, default=3, help="Antall runder (beste tid brukes)")
+    args = parser.parse_args()
+
+    big = scale_up(pd.read_csv(args.csv), args.rader)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'boliger.csv')
+        parquet_path = os.path.join(tmp, 'boliger.parquet')
+        big.to_csv(csv_path, index=False)
+        save_dataset(big, parquet_path)
+
+        csv_tid, csv_df = best_of(lambda: pd.read_csv(csv_path), args.repeat)
+        pq_tid, pq_df = best_of(lambda: load_dataset(parquet_path), args.repeat)
+
+        csv_mb = csv_df.memory_usage(deep=True).sum() / 1e6
+        pq_mb = pq_df.memory_usage(deep=True).sum() / 1e6
+        csv_fil = os.path.getsize(csv_path) / 1e6
+        pq_fil = os.path.getsize(parquet_path) / 1e6
+
+    print(f"{args.rader:,} rader\n")
+    print(f"{'Format':<10}{'Last (s)':>10}{'Minne (MB)':>12}{'Fil (MB)':>10}")
+    print(f"{'CSV':<10}{csv_tid:>10.3f}{csv_mb:>12.1f}{csv_fil:>10.1f}")
+    print(f"{'Parquet':<10}{pq_tid:>10.3f}{pq_mb:>12.1f}{pq_fil:>10.1f}")
+    print(f"\nParquet: {csv_tid / pq_tid:.1f}x raskere lasting, {csv_mb / pq_mb:.1f}x mindre minne")
+
+
+if __name__ == "__main__":
+    main()
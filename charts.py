@@ -0,0 +1,132 @@
+"""
+Boligmarked Analyse - Figurer for dashboardet
+Under RENDER_THRESHOLD rader sendes radene til nettleseren som før. Over
+terskelen bines histogram og boksplott på serveren (NumPy), og scatterplott
+tegnes med WebGL på et stratifisert utvalg (avvikere beholdes) eller som
+2D-tetthet - figurene har en øvre grense for størrelse uansett datamengde
+"""
+
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+RENDER_THRESHOLD = 5_000
+MAX_POINTS = 5_000
+DENSITY_BINS = 60
+
+SCATTER_MODES = ['Punkter (WebGL)', 'Tetthet']
+
+
+def downsample(df: pd.DataFrame, max_points: int = MAX_POINTS, strata: Optional[str] = None,
+               columns: Sequence[str] = ('storrelse_kvm', 'pris'), seed: int = 42) -> pd.DataFrame:
+    """
+    Stratifisert utvalg på maks ~max_points rader: avvikere (utenfor 1.-99. persentil
+    i en av kolonnene, opptil en femtedel av utvalget) beholdes, resten trekkes
+    tilfeldig fra hvert stratum i forhold til størrelsen
+    """
+    if len(df) <= max_points:
+        return df
+
+    rng = np.random.default_rng(seed)
+    avvik = np.zeros(len(df), dtype=bool)
+    for col in columns:
+        values = df[col].to_numpy(dtype=np.float64)
+        lo, hi = np.nanpercentile(values, [1, 99])
+        avvik |= (values < lo) | (values > hi)
+
+    outliers = np.flatnonzero(avvik)
+    if len(outliers) > max_points // 5:
+        outliers = rng.choice(outliers, max_points // 5, replace=False)
+
+    vanlige = np.flatnonzero(~avvik)
+    rest = max_points - len(outliers)
+    if strata is not None:
+        codes = df[strata].astype('category').cat.codes.to_numpy()[vanlige]
+    else:
+        codes = np.zeros(len(vanlige), dtype=np.int8)
+
+    chosen: List[np.ndarray] = [outliers]
+    for code in np.unique(codes):
+        members = vanlige[codes == code]
+        n = max(1, round(rest * len(members) / len(vanlige)))
+        chosen.append(rng.choice(members, min(n, len(members)), replace=False))
+    return df.iloc[np.sort(np.concatenate(chosen))]
+
+
+def histogram(df: pd.DataFrame, x: str, nbins: int, title: str, labels: Dict[str, str],
+              color: str) -> go.Figure:
+    """Histogram - binet i NumPy over terskelen, så bare søylene sendes"""
+    if len(df) <= RENDER_THRESHOLD:
+        fig = px.histogram(df, x=x, nbins=nbins, title=title, labels=labels, color_discrete_sequence=[color])
+        fig.update_layout(showlegend=False)
+        return fig
+
+    counts, edges = np.histogram(df[x].dropna().to_numpy(dtype=np.float64), bins=nbins)
+    fig = go.Figure(go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges), marker_color=color))
+    fig.update_layout(title=title, xaxis_title=labels.get(x, x), yaxis_title=labels.get('count', 'count'),
+                      bargap=0, showlegend=False)
+    return fig
+
+
+def box(df: pd.DataFrame, y: str, title: str, labels: Dict[str, str], color: str) -> go.Figure:
+    """Boksplott - kvartiler og whiskers regnes ut på serveren over terskelen"""
+    values = df[y].dropna().to_numpy(dtype=np.float64)
+    if len(df) <= RENDER_THRESHOLD or len(values) == 0:
+        return px.box(df, y=y, title=title, labels=labels, color_discrete_sequence=[color])
+
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    inne = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    outliers = values[(values < inne.min()) | (values > inne.max())]
+    if len(outliers) > MAX_POINTS:
+        outliers = np.random.default_rng(42).choice(outliers, MAX_POINTS, replace=False)
+
+    name = labels.get(y, y)
+    fig = go.Figure(go.Box(x=[name], q1=[q1], median=[median], q3=[q3], lowerfence=[inne.min()],
+                           upperfence=[inne.max()], mean=[values.mean()], marker_color=color, name=name))
+    fig.add_trace(go.Scattergl(x=[name] * len(outliers), y=outliers, mode='markers',
+                               marker=dict(color=color, size=4), showlegend=False))
+    fig.update_layout(title=title, yaxis_title=name, showlegend=False)
+    return fig
+
+
+def scatter(df: pd.DataFrame, x: str, y: str, color: Optional[str], hover_data: List[str], title: str,
+            labels: Dict[str, str], mode: str = SCATTER_MODES[0]) -> go.Figure:
+    """
+    Scatterplott - over terskelen enten WebGL på et stratifisert utvalg
+    (mode='Punkter (WebGL)') eller 2D-tetthet over alle radene (mode='Tetthet')
+    """
+    if len(df) <= RENDER_THRESHOLD:
+        return px.scatter(df, x=x, y=y, color=color, hover_data=hover_data, title=title, labels=labels)
+
+    if mode == 'Tetthet':
+        xs = df[x].to_numpy(dtype=np.float64)
+        ys = df[y].to_numpy(dtype=np.float64)
+        gyldig = ~(np.isnan(xs) | np.isnan(ys))
+        counts, x_edges, y_edges = np.histogram2d(xs[gyldig], ys[gyldig], bins=DENSITY_BINS)
+        fig = go.Figure(go.Heatmap(
+            x=(x_edges[:-1] + x_edges[1:]) / 2,
+            y=(y_edges[:-1] + y_edges[1:]) / 2,
+            z=np.where(counts == 0, np.nan, counts).T,
+            colorscale='Blues',
+            colorbar=dict(title='Antall')
+        ))
+        fig.update_layout(title=f"{title} (tetthet, {len(df):,} boliger)".replace(",", " "),
+                          xaxis_title=labels.get(x, x), yaxis_title=labels.get(y, y))
+        return fig
+
+    sample = downsample(df, strata=color, columns=(x, y))
+    fig = px.scatter(sample, x=x, y=y, color=color, hover_data=hover_data, labels=labels, render_mode='webgl',
+                     title=f"{title} (utvalg: {len(sample):,} av {len(df):,})".replace(",", " "))
+    return fig
+
+
+def scatter_trace(df: pd.DataFrame, x: str, y: str, **kwargs) -> go.Scatter:
+    """go.Scatter for små datasett, ellers go.Scattergl på et utvalg som beholder avvikerne"""
+    if len(df) <= RENDER_THRESHOLD:
+        return go.Scatter(x=df[x], y=df[y], **kwargs)
+    sample = downsample(df, columns=(x, y))
+    return go.Scattergl(x=sample[x], y=sample[y], **kwargs)
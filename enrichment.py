@@ -0,0 +1,193 @@
+"""
+Boligmarked Analyse - Berikelse fra annonsesidene
+Søkeresultatene har bare pris, størrelse, tittel og boligtype. Berikelsen
+følger lenken til hver annonse og henter byggeår, soverom, tomteareal,
+fellesgjeld og energimerke (se extractors.parse_ad_page). Hentingen går
+via scraperens session og rate limit, med et tak på samtidige forespørsler,
+og resultatet caches på disk per finn_kode - en annonse hentes aldri to ganger
+
+    python scraper.py --detaljer                   # berik som del av scrapingen
+    python enrichment.py --workers 4 --output boliger_beriket.parquet
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+
+import pandas as pd
+import requests
+
+from extractors import DETAIL_COLUMNS, parse_ad_page
+from metrics import METRICS
+from storage import AD_URL, default_path, load_dataset, save_dataset
+
+DETAILS_PATH = 'boliger_detaljer.jsonl'
+
+# Statuskoder som betyr at annonsen er borte - caches så den ikke prøves igjen
+GONE_STATUS = {404, 410}
+
+DETAIL_DTYPES = {
+    'byggeaar': 'Int16',
+    'soverom': 'Int8',
+    'tomt_kvm': 'float32',
+    'fellesgjeld': 'float64',
+    'energimerke': 'category',
+}
+
+
+class DetailCache:
+    """
+    Detaljer per finn_kode i en append-only JSON-lines fil. Én linje per
+    hentet annonse (også de som er borte, med status), lastet inn ved start
+    """
+    def __init__(self, path: str = DETAILS_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.records: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue   # halv linje etter en avbrutt kjøring
+                    self.records[record['finn_kode']] = record
+        self._file = None
+
+    def __contains__(self, finn_kode: str) -> bool:
+        return finn_kode in self.records
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def put(self, record: Dict) -> None:
+        """Lagre en record (trådsikker, skrives til disk med en gang)"""
+        line = json.dumps(record, ensure_ascii=False)
+        with self.lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8', buffering=1)
+            self._file.write(line + '\n')
+            self.records[record['finn_kode']] = record
+
+    def close(self) -> None:
+        with self.lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def frame(self) -> pd.DataFrame:
+        """Detaljene som DataFrame med finn_kode (Int64) og DETAIL_COLUMNS"""
+        rows = [r for r in self.records.values() if r.get('status') == 200]
+        df = pd.DataFrame(rows, columns=['finn_kode'] + DETAIL_COLUMNS)
+        df['finn_kode'] = pd.to_numeric(df['finn_kode'], errors='coerce').astype('Int64')
+        return df.astype(DETAIL_DTYPES)
+
+
+def with_details(df: pd.DataFrame, cache: Optional[DetailCache] = None) -> pd.DataFrame:
+    """Datasettet med detaljkolonnene (manglende detaljer blir NA)"""
+    cache = cache or DetailCache()
+    detaljer = cache.frame()
+    df = df.drop(columns=[col for col in DETAIL_COLUMNS if col in df.columns])
+    return df.merge(detaljer, on='finn_kode', how='left')
+
+
+class DetailEnricher:
+    """
+    Henter annonsesider for finn_koder som ikke er i cachen, med maks
+    max_workers samtidige forespørsler. Forespørslene går via scraperen
+    (felles rate limit per host, retry og backoff), men utenom respons-cachen
+    """
+    def __init__(self, scraper, cache: Optional[DetailCache] = None, max_workers: int = 4):
+        self.scraper = scraper
+        self.cache = cache or DetailCache()
+        self.max_workers = max_workers
+        self.stats = {'hentet': 0, 'cache': 0, 'borte': 0, 'feil': 0}
+
+    def _fetch(self, finn_kode: str) -> None:
+        record = {'finn_kode': finn_kode, 'hentet': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        with METRICS.span('detail_fetch'):
+            try:
+                html = self.scraper._get(AD_URL + finn_kode, use_cache=False)
+            except requests.HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                if status not in GONE_STATUS:
+                    raise
+                self.cache.put({**record, 'status': status})
+                METRICS.inc('details_gone_total')
+                self.stats['borte'] += 1
+                return
+            self.cache.put({**record, 'status': 200, **parse_ad_page(html)})
+        METRICS.inc('details_fetched_total')
+        self.stats['hentet'] += 1
+
+    def enrich(self, finn_koder: Iterable[str]) -> Dict[str, int]:
+        """
+        Sørg for at alle finn_kodene er i cachen. Feil (etter retry) telles
+        og hoppes over - de prøves igjen neste kjøring
+        """
+        koder = list(dict.fromkeys(str(kode) for kode in finn_koder if kode))
+        mangler = [kode for kode in koder if kode not in self.cache]
+        METRICS.inc('details_cache_hits_total', len(koder) - len(mangler))
+        self.stats['cache'] += len(koder) - len(mangler)
+
+        with ThreadPoolExecutor(self.max_workers) as pool:
+            pending = deque()
+
+            def collect():
+                try:
+                    pending.popleft().result()
+                except Exception:
+                    METRICS.inc('details_failed_total')
+                    self.stats['feil'] += 1
+
+            # Maks 2 oppgaver per worker i køen, så store lister ikke fyller minnet
+            for finn_kode in mangler:
+                pending.append(pool.submit(self._fetch, finn_kode))
+                if len(pending) >= 2 * self.max_workers:
+                    collect()
+            while pending:
+                collect()
+        return self.stats
+
+
+def enrich_dataset(path: Optional[str] = None, output: Optional[str] = None, max_workers: int = 4,
+                   rate_per_host: float = 2.0, details_path: str = DETAILS_PATH) -> pd.DataFrame:
+    """Berik et eksisterende datasett. Med output lagres datasettet med detaljkolonnene"""
+    from scraper import FinnScraper
+
+    path = path or default_path()
+    df = load_dataset(path)
+    scraper = FinnScraper(rate_per_host=rate_per_host, max_workers=max_workers, cache_dir=None)
+    enricher = DetailEnricher(scraper, DetailCache(details_path), max_workers)
+
+    koder = df['finn_kode'].dropna().astype('int64').astype(str).tolist()
+    start = time.perf_counter()
+    stats = enricher.enrich(koder)
+    enricher.cache.close()
+    print(f"🔎 {stats['hentet']} annonser hentet, {stats['cache']} fra cache, {stats['borte']} borte, "
+          f"{stats['feil']} feil ({time.perf_counter() - start:.1f} s)")
+
+    beriket = with_details(df, enricher.cache)
+    dekning = beriket[DETAIL_COLUMNS].notna().mean() * 100
+    print("   Dekning: " + ", ".join(f"{col} {pct:.0f} %" for col, pct in dekning.items()))
+    if output:
+        save_dataset(beriket, output)
+        print(f"📁 Lagret til: {output}")
+    return beriket
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Berik boligene med detaljer fra annonsesidene")
+    parser.add_argument('--data', default=None, help="Datasett (standard: boliger_ostfold.parquet/.csv)")
+    parser.add_argument('--output', default=None, help="Lagre datasettet med detaljkolonnene hit")
+    parser.add_argument('--workers', type=int, default=4, help="Maks samtidige forespørsler")
+    parser.add_argument('--rate', type=float, default=2.0, help="Maks forespørsler per sekund per host")
+    parser.add_argument('--cache', default=DETAILS_PATH, help="Detaljcache (JSON-lines per finn_kode)")
+    args = parser.parse_args()
+
+    enrich_dataset(args.data, args.output, args.workers, args.rate, args.cache)
@@ -0,0 +1,343 @@
+"""
+Boligmarked Analyse - Ekstraktorer for Finn.no søkeresultater
+Pluggbare backends som gir identiske records:
+  - 'soup': BeautifulSoup + html.parser (opprinnelig logikk)
+  - 'lxml': lxml, én gjennomgang av tekstnodene per annonse (rask)
+"""
+
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from lxml import etree
+from lxml import html as lxml_html
+
+BASE_URL = "https://www.finn.no"
+
+# Forhåndskompilerte mønstre
+AD_HREF_RE = re.compile(r'/realestate/homes/ad.html')
+FINNKODE_RE = re.compile(r'finnkode=(\d+)')
+PRIS_RE = re.compile(r'\d+.*kr', re.IGNORECASE)
+STORRELSE_RE = re.compile(r'\d+\s*m²')
+NON_DIGIT_RE = re.compile(r'[^\d]')
+DIGITS_RE = re.compile(r'(\d+)')
+
+# Treffinfo på side 1 (JSON-data i siden, ev. "1 234 treff" i teksten)
+MATCH_COUNT_RE = re.compile(r'"match_count"\s*:\s*(\d+)')
+LAST_PAGE_RE = re.compile(r'"paging"\s*:\s*\{[^}]*"last"\s*:\s*(\d+)')
+TREFF_RE = re.compile(r'(\d[\d \xa0]*)\s*treff')
+FINN_PER_PAGE = 50
+
+# Kolonnene i hver record (og i boliger_ostfold.csv)
+COLUMNS = ['finn_kode', 'tittel', 'pris', 'storrelse_kvm', 'pris_per_kvm', 'boligtype', 'kommune', 'lenke']
+
+# Rekkefølgen betyr noe - første treff vinner
+BOLIGTYPER = (
+    ('leilighet', 'Leilighet'),
+    ('enebolig', 'Enebolig'),
+    ('rekkehus', 'Rekkehus'),
+    ('tomannsbolig', 'Tomannsbolig'),
+)
+
+# Detaljer fra annonsesiden (nøkkelinfo-listen: etikett etterfulgt av verdi)
+DETAIL_COLUMNS = ['byggeaar', 'soverom', 'tomt_kvm', 'fellesgjeld', 'energimerke']
+DETAIL_LABELS = {
+    'byggeår': 'byggeaar',
+    'soverom': 'soverom',
+    'tomteareal': 'tomt_kvm',
+    'tomt': 'tomt_kvm',
+    'fellesgjeld': 'fellesgjeld',
+    'energimerking': 'energimerke',
+}
+LABEL_RE = re.compile(r'^(%s)(?:\s*:\s*(.+))?$' % '|'.join(DETAIL_LABELS), re.IGNORECASE)
+AAR_RE = re.compile(r'\b(1[6-9]\d\d|20\d\d)\b')
+KVM_RE = re.compile(r'(\d[\d \xa0]*)(?:[.,]\d+)?\s*m²')
+ENERGI_RE = re.compile(r'^([A-G])\b')
+
+ANNONSE_XPATH = etree.XPath(
+    "//article[contains(concat(' ', normalize-space(@class), ' '), ' sf-search-ad ')]"
+)
+# Annonse inne i en annen annonse - prosjektkort, eller et treet libxml2 har
+# bygget annerledes enn html.parser (se LxmlExtractor.parse_page)
+NESTET_XPATH = etree.XPath(
+    "//article[contains(concat(' ', normalize-space(@class), ' '), ' sf-search-ad ')]"
+    "//article[contains(concat(' ', normalize-space(@class), ' '), ' sf-search-ad ')]"
+)
+
+
+def parse_pris(pris_text: str) -> Optional[float]:
+    """Parse pris"""
+    if not pris_text:
+        return None
+    nummer = NON_DIGIT_RE.sub('', pris_text)
+    try:
+        return float(nummer)
+    except ValueError:
+        return None
+
+
+def parse_storrelse(size_text: str) -> Optional[float]:
+    """Parse størrelse"""
+    if not size_text:
+        return None
+    match = DIGITS_RE.search(size_text)
+    if match:
+        return float(match.group(1))
+    return None
+
+
+def parse_result_info(html: bytes) -> Tuple[Optional[int], Optional[int]]:
+    """Les totalt antall treff og antall sider fra side 1 av et søk"""
+    text = html.decode('utf-8', errors='ignore')
+
+    treff = None
+    match = MATCH_COUNT_RE.search(text) or TREFF_RE.search(text)
+    if match:
+        treff = int(NON_DIGIT_RE.sub('', match.group(1)))
+
+    sider = None
+    match = LAST_PAGE_RE.search(text)
+    if match:
+        sider = int(match.group(1))
+    elif treff is not None:
+        sider = max(1, -(-treff // FINN_PER_PAGE))
+
+    return treff, sider
+
+
+def guess_boligtype(text: str) -> str:
+    """Gjett boligtype fra annonsetekst (allerede lowercase)"""
+    for keyword, boligtype in BOLIGTYPER:
+        if keyword in text:
+            return boligtype
+    return 'Annet'
+
+
+def build_record(href: Optional[str], strings: List[str], tittel: Optional[str],
+                 text: str, area_name: str) -> Optional[Dict]:
+    """
+    Felles logikk for alle backends: gitt rådata fra en annonse,
+    bygg record (eller None hvis sanity check feiler)
+    """
+    # Finn lenke og Finn-kode
+    lenke = None
+    finn_kode = None
+    if href:
+        lenke = BASE_URL + href
+        match = FINNKODE_RE.search(lenke)
+        if match:
+            finn_kode = match.group(1)
+
+    # Første tekstnode som ser ut som pris / størrelse
+    pris = None
+    storrelse = None
+    for s in strings:
+        if pris is None and PRIS_RE.search(s):
+            pris = parse_pris(s) or 0
+        if storrelse is None and STORRELSE_RE.search(s):
+            storrelse = parse_storrelse(s) or 0
+        if pris is not None and storrelse is not None:
+            break
+
+    boligtype = guess_boligtype(text.lower())
+
+    # Kun returner hvis vi har pris OG størrelse
+    if pris and storrelse and pris > 100000 and storrelse > 10:  # Sanity check
+        return {
+            'finn_kode': finn_kode,
+            'tittel': tittel,
+            'pris': pris,
+            'storrelse_kvm': storrelse,
+            'pris_per_kvm': round(pris / storrelse, 0),
+            'boligtype': boligtype,
+            'kommune': area_name,
+            'lenke': lenke
+        }
+
+    return None
+
+
+class SoupExtractor:
+    """BeautifulSoup + html.parser - samme resultat som den opprinnelige parseren"""
+    name = 'soup'
+
+    def extract(self, annonse, area_name: str) -> Optional[Dict]:
+        """Ekstraher data fra en bs4-annonse"""
+        try:
+            lenke_tag = annonse.find('a', href=AD_HREF_RE)
+            href = lenke_tag.get('href') if lenke_tag else None
+
+            heading = annonse.find(['h2', 'h3'])
+            tittel = heading.get_text(strip=True) if heading else None
+
+            # Én gjennomgang av tekstnodene i stedet for to find_all med regex
+            strings = annonse.find_all(string=True)
+
+            return build_record(href, strings, tittel, annonse.get_text(), area_name)
+        except Exception:
+            return None
+
+    def parse_page(self, html: bytes, area_name: str) -> Optional[List[Dict]]:
+        """Parse en søkeresultat-side. None = ingen annonser på siden"""
+        # bs4 importeres først når soup-backenden faktisk brukes
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(html, 'html.parser')
+        annonser = soup.find_all('article', class_='sf-search-ad')
+
+        if not annonser:
+            return None
+
+        boliger = []
+        for annonse in annonser:
+            bolig_data = self.extract(annonse, area_name)
+            if bolig_data:
+                boliger.append(bolig_data)
+        return boliger
+
+
+def _lxml_text_nodes(el, out: List[Tuple[str, bool]]) -> None:
+    """
+    Samle tekstnoder under el i dokumentrekkefølge som (tekst, er_kommentar),
+    tilsvarende NavigableString-ene bs4 ser
+    """
+    for child in el:
+        if isinstance(child.tag, str):
+            if child.text:
+                out.append((child.text, False))
+            _lxml_text_nodes(child, out)
+        elif child.tag is etree.Comment and child.text:
+            out.append((child.text, True))
+        if child.tail:
+            out.append((child.tail, False))
+
+
+class LxmlExtractor:
+    """lxml-backend - C-parser og én gjennomgang av tekstnodene per annonse"""
+    name = 'lxml'
+
+    def __init__(self):
+        # lxml-parsere skal ikke deles mellom tråder
+        self._local = threading.local()
+
+    @property
+    def parser(self):
+        if not hasattr(self._local, 'parser'):
+            self._local.parser = lxml_html.HTMLParser(encoding='utf-8')
+        return self._local.parser
+
+    def extract(self, annonse, area_name: str) -> Optional[Dict]:
+        """Ekstraher data fra et lxml-element"""
+        try:
+            href = None
+            for a in annonse.iter('a'):
+                candidate = a.get('href')
+                if candidate and AD_HREF_RE.search(candidate):
+                    href = candidate
+                    break
+
+            tittel = None
+            heading = next(annonse.iter('h2', 'h3'), None)
+            if heading is not None:
+                parts = []
+                if heading.text:
+                    parts.append(heading.text)
+                nodes = []
+                _lxml_text_nodes(heading, nodes)
+                parts.extend(t for t, er_kommentar in nodes if not er_kommentar)
+                tittel = ''.join(p.strip() for p in parts if p.strip())
+
+            nodes = []
+            if annonse.text:
+                nodes.append((annonse.text, False))
+            _lxml_text_nodes(annonse, nodes)
+
+            strings = [t for t, _ in nodes]
+            text = ''.join(t for t, er_kommentar in nodes if not er_kommentar)
+
+            return build_record(href, strings, tittel, text, area_name)
+        except Exception:
+            return None
+
+    def parse_page(self, html: bytes, area_name: str) -> Optional[List[Dict]]:
+        """Parse en søkeresultat-side. None = ingen annonser på siden"""
+        if not html or not html.strip():
+            return None
+        root = lxml_html.document_fromstring(html, parser=self.parser)
+        if NESTET_XPATH(root):
+            # libxml2 kjenner ikke HTML5-elementet article: </article> lukker ikke
+            # en uavsluttet <div>, så resten av siden havner inne i annonsen.
+            # Nestede annonser parses derfor som html.parser (og nettleseren) ser dem
+            return SoupExtractor().parse_page(html, area_name)
+        annonser = ANNONSE_XPATH(root)
+
+        if not annonser:
+            return None
+
+        boliger = []
+        for annonse in annonser:
+            bolig_data = self.extract(annonse, area_name)
+            if bolig_data:
+                boliger.append(bolig_data)
+        return boliger
+
+
+def parse_detail_value(felt: str, verdi: str):
+    """Tolk verdien til et detaljfelt (None hvis den ikke gir mening)"""
+    verdi = verdi.replace('\xa0', ' ').strip()
+    if felt == 'byggeaar':
+        match = AAR_RE.search(verdi)
+        return int(match.group(1)) if match else None
+    if felt == 'soverom':
+        match = DIGITS_RE.search(verdi)
+        return int(match.group(1)) if match else None
+    if felt == 'tomt_kvm':
+        match = KVM_RE.search(verdi)
+        return float(NON_DIGIT_RE.sub('', match.group(1))) if match else None
+    if felt == 'fellesgjeld':
+        return parse_pris(verdi)
+    if felt == 'energimerke':
+        match = ENERGI_RE.match(verdi.upper())
+        return match.group(1) if match else None
+    return None
+
+
+def parse_ad_page(html: bytes) -> Dict:
+    """
+    Byggeår, soverom, tomteareal, fellesgjeld og energimerke fra en annonseside.
+    Leser tekstnodene i rekkefølge: en node med etiketten (f.eks. 'Byggeår' i
+    en <dt>) etterfølges av verdien, eller etikett og verdi står i samme node
+    med kolon ('Byggeår: 1985'). Felter som mangler blir None
+    """
+    detaljer = dict.fromkeys(DETAIL_COLUMNS)
+    if not html or not html.strip():
+        return detaljer
+    root = lxml_html.document_fromstring(html, parser=lxml_html.HTMLParser(encoding='utf-8'))
+    for bad in root.iter('script', 'style'):
+        bad.text = None
+
+    nodes = [t.strip() for t in root.itertext() if t.strip()]
+    for i, node in enumerate(nodes):
+        match = LABEL_RE.match(node)
+        if not match:
+            continue
+        felt = DETAIL_LABELS[match.group(1).lower()]
+        if detaljer[felt] is not None:
+            continue
+        verdi = match.group(2) or (nodes[i + 1] if i + 1 < len(nodes) else '')
+        detaljer[felt] = parse_detail_value(felt, verdi)
+    return detaljer
+
+
+EXTRACTORS = {
+    'soup': SoupExtractor,
+    'lxml': LxmlExtractor,
+}
+
+
+def get_extractor(name: str = 'lxml'):
+    """Hent ekstraktor etter navn"""
+    try:
+        return EXTRACTORS[name]()
+    except KeyError:
+        raise ValueError(f"Ukjent ekstraktor: {name} (velg en av {', '.join(EXTRACTORS)})")
@@ -0,0 +1,247 @@
+"""
+Boligmarked Analyse - Prishistorikk
+Hver scrape overskriver datasettet. Historikken tar vare på endringene per
+finn_kode i stedet for hele kopier av hver snapshot:
+
+    historikk/tilstand.parquet      siste kjente tilstand per finn_kode (pris, først/sist sett, aktiv)
+    historikk/hendelser/<tid>.parquet
+                                    endringene i én snapshot: ny, pris (med endring), fjernet, relistet
+    historikk/serie.parquet         antall og medianer per dag × kommune × boligtype (med roll-ups)
+
+Lagringen vokser med antall endringer, ikke med annonser × dager. Serien
+beregnes når en snapshot registreres, så tidsserier per kommune leses
+direkte uten å gå gjennom hendelsene
+
+    python history.py --kommune Fredrikstad             # median per dag
+    python history.py --finn-kode 123456789             # prisforløp for en annonse
+    python history.py --fra-arkiv .finn_arkiv           # bygg historikk fra side-arkivet
+"""
+
+import argparse
+import glob
+import os
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from storage import remove_outliers, to_compact
+
+HISTORY_DIR = 'historikk'
+
+# Roll-up-verdi i serien (alle kommuner eller alle boligtyper)
+ALLE = 'Alle'
+
+EVENTS = ['ny', 'pris', 'fjernet', 'relistet']
+
+# Nivåene i serien: per kommune × boligtype, per kommune, per boligtype og totalt
+ROLLUPS = [('kommune', 'boligtype'), ('kommune',), ('boligtype',), ()]
+
+SERIES_COLUMNS = ['kommune', 'boligtype', 'antall', 'median_pris', 'median_kr_kvm'] + EVENTS
+
+STATE_DTYPES = {
+    'finn_kode': 'int64',
+    'kommune': 'category',
+    'boligtype': 'category',
+    'storrelse_kvm': 'float32',
+    'pris': 'int32',
+    'forst_sett': 'datetime64[s]',
+    'sist_sett': 'datetime64[s]',
+    'aktiv': 'bool',
+    'prisendringer': 'int16',
+}
+
+EVENT_DTYPES = {
+    'finn_kode': 'int64',
+    'tid': 'datetime64[s]',
+    'hendelse': pd.CategoricalDtype(EVENTS),
+    'pris': 'int32',
+    'endring': 'int32',
+}
+
+
+class PriceHistory:
+    """
+    Endringslogg per finn_kode i history_dir. record() sammenligner en
+    snapshot med siste tilstand og lagrer bare forskjellene
+    """
+    def __init__(self, history_dir: str = HISTORY_DIR):
+        self.history_dir = history_dir
+        self.state_path = os.path.join(history_dir, 'tilstand.parquet')
+        self.series_path = os.path.join(history_dir, 'serie.parquet')
+        self.events_dir = os.path.join(history_dir, 'hendelser')
+        # Hendelsene sortert på finn_kode (lastes ved første oppslag)
+        self._events: Optional[pd.DataFrame] = None
+        self._koder: Optional[np.ndarray] = None
+
+    def version(self) -> str:
+        """Endres når en ny snapshot registreres - brukes som cache-nøkkel"""
+        if not os.path.exists(self.series_path):
+            return self.series_path
+        return f"{self.series_path}@{os.path.getmtime(self.series_path)}"
+
+    def state(self) -> pd.DataFrame:
+        """Siste kjente tilstand for alle annonser som er sett"""
+        if not os.path.exists(self.state_path):
+            return pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in STATE_DTYPES.items()})
+        return pd.read_parquet(self.state_path).astype(STATE_DTYPES)
+
+    def record(self, df: pd.DataFrame, tid: Optional[pd.Timestamp] = None, full: bool = True) -> Dict[str, int]:
+        """
+        Registrer en snapshot. full=False (inkrementell scrape, der ikke alle
+        annonser hentes) gir ingen fjernet-hendelser. Returnerer antall per hendelse
+        """
+        tid = pd.Timestamp(tid or pd.Timestamp.now()).floor('s')
+        snap = to_compact(df)[['finn_kode', 'kommune', 'boligtype', 'storrelse_kvm', 'pris']]
+        snap = snap.dropna(subset=['finn_kode', 'pris']).drop_duplicates('finn_kode')
+        snap = snap.astype({'finn_kode': 'int64', 'kommune': str, 'boligtype': str})
+
+        state = self.state()
+        forrige = state.set_index('finn_kode')[['pris', 'aktiv', 'forst_sett', 'prisendringer']]
+        merged = snap.join(forrige, on='finn_kode', rsuffix='_forrige')
+        sett = merged['aktiv'].notna().to_numpy()
+        aktiv_for = merged['aktiv'].fillna(False).to_numpy(dtype=bool)
+        pris = merged['pris'].to_numpy(dtype=np.int64)
+        pris_for = merged['pris_forrige'].fillna(0).to_numpy(dtype=np.int64)
+
+        ny = ~sett
+        relistet = sett & ~aktiv_for
+        pris_endret = sett & aktiv_for & (pris != pris_for)
+
+        fjernet = state['aktiv'].to_numpy() & ~state['finn_kode'].isin(snap['finn_kode']).to_numpy() & full
+
+        events = pd.concat([
+            pd.DataFrame({'finn_kode': snap['finn_kode'].to_numpy()[ny], 'hendelse': 'ny',
+                          'pris': pris[ny], 'endring': 0}),
+            pd.DataFrame({'finn_kode': snap['finn_kode'].to_numpy()[pris_endret], 'hendelse': 'pris',
+                          'pris': pris[pris_endret], 'endring': (pris - pris_for)[pris_endret]}),
+            pd.DataFrame({'finn_kode': snap['finn_kode'].to_numpy()[relistet], 'hendelse': 'relistet',
+                          'pris': pris[relistet], 'endring': (pris - pris_for)[relistet]}),
+            pd.DataFrame({'finn_kode': state['finn_kode'].to_numpy()[fjernet], 'hendelse': 'fjernet',
+                          'pris': state['pris'].to_numpy()[fjernet], 'endring': 0}),
+        ], ignore_index=True)
+        events['tid'] = tid
+        events = events[list(EVENT_DTYPES)].astype(EVENT_DTYPES).sort_values('finn_kode', kind='stable')
+
+        # Ny tilstand: snapshotens annonser, pluss de som ikke var med (fjernet hvis full)
+        nye_rader = snap.assign(
+            forst_sett=merged['forst_sett'].fillna(tid).to_numpy(),
+            sist_sett=tid,
+            aktiv=True,
+            prisendringer=merged['prisendringer'].fillna(0).to_numpy() + pris_endret,
+        )
+        i_snap = state['finn_kode'].isin(snap['finn_kode']).to_numpy()
+        ikke_sett = state[~i_snap].copy()
+        ikke_sett.loc[fjernet[~i_snap], 'aktiv'] = False
+        ny_state = pd.concat([ikke_sett.astype({'kommune': str, 'boligtype': str}), nye_rader], ignore_index=True)
+        ny_state = ny_state.astype(STATE_DTYPES).sort_values('finn_kode', ignore_index=True)
+
+        os.makedirs(self.events_dir, exist_ok=True)
+        if len(events):
+            events.to_parquet(os.path.join(self.events_dir, f"{tid:%Y%m%d-%H%M%S}.parquet"),
+                              index=False, compression='zstd')
+        self._write_series(ny_state, events, tid)
+        # Tilstanden skrives sist, så den aldri er foran hendelsene og serien
+        tmp = self.state_path + '.tmp'
+        ny_state.to_parquet(tmp, index=False, compression='zstd')
+        os.replace(tmp, self.state_path)
+
+        self._events = None
+        return events['hendelse'].value_counts().reindex(EVENTS, fill_value=0).to_dict()
+
+    def _write_series(self, state: pd.DataFrame, events: pd.DataFrame, tid: pd.Timestamp) -> None:
+        """Antall, median pris og kr/kvm for aktive annonser, og hendelser, per dag × kommune × boligtype"""
+        def rollups(d: pd.DataFrame) -> pd.DataFrame:
+            # Radene én gang per nivå, med ALLE for dimensjonene det summeres over
+            d = d.astype({'kommune': str, 'boligtype': str})
+            return pd.concat([d.assign(**{col: ALLE for col in ('kommune', 'boligtype') if col not in by})
+                              for by in ROLLUPS], ignore_index=True)
+
+        aktive = remove_outliers(state[state['aktiv']].assign(pris_per_kvm=lambda d: d['pris'] / d['storrelse_kvm']))
+        stats = rollups(aktive).groupby(['kommune', 'boligtype']).agg(
+            antall=('pris', 'size'), median_pris=('pris', 'median'), median_kr_kvm=('pris_per_kvm', 'median'))
+        hendelser = rollups(events.merge(state[['finn_kode', 'kommune', 'boligtype']], on='finn_kode'))
+        teller = hendelser.groupby(['kommune', 'boligtype', 'hendelse'], observed=True).size().unstack()
+        serie = stats.join(teller.reindex(columns=EVENTS), how='outer').fillna({col: 0 for col in ['antall'] + EVENTS})
+        serie = serie.astype({'antall': 'int32', 'median_pris': 'float32', 'median_kr_kvm': 'float32',
+                              **{col: 'int32' for col in EVENTS}})
+        serie = serie.reset_index().assign(dag=tid.normalize())[['dag'] + SERIES_COLUMNS]
+
+        if os.path.exists(self.series_path):
+            gammel = pd.read_parquet(self.series_path)
+            # Flere snapshots samme dag: den siste gjelder for tilstanden, hendelsene summeres
+            samme = gammel[gammel['dag'] == serie['dag'].iloc[0]].set_index(['kommune', 'boligtype'])[EVENTS]
+            if len(samme):
+                serie = serie.set_index(['kommune', 'boligtype'])
+                serie[EVENTS] = serie[EVENTS].add(samme.reindex(serie.index, fill_value=0)).astype('int32')
+                serie = serie.reset_index()
+            serie = pd.concat([gammel[gammel['dag'] != serie['dag'].iloc[0]], serie], ignore_index=True)
+        serie = serie.astype({'kommune': 'category', 'boligtype': 'category'}).sort_values(['dag', 'kommune', 'boligtype'])
+        tmp = self.series_path + '.tmp'
+        serie.to_parquet(tmp, index=False, compression='zstd')
+        os.replace(tmp, self.series_path)
+
+    def events(self) -> pd.DataFrame:
+        """Alle hendelser, sortert på finn_kode og tid"""
+        if self._events is None:
+            paths = sorted(glob.glob(os.path.join(self.events_dir, '*.parquet')))
+            deler = [pd.read_parquet(path) for path in paths]
+            events = pd.concat(deler, ignore_index=True) if deler else pd.DataFrame(columns=list(EVENT_DTYPES))
+            self._events = events.astype(EVENT_DTYPES).sort_values(['finn_kode', 'tid'], kind='stable',
+                                                                   ignore_index=True)
+            self._koder = self._events['finn_kode'].to_numpy()
+        return self._events
+
+    def trajectory(self, finn_kode) -> pd.DataFrame:
+        """Prisforløpet til en annonse (binærsøk i hendelsene sortert på finn_kode)"""
+        events = self.events()
+        kode = int(finn_kode)
+        lo, hi = np.searchsorted(self._koder, [kode, kode + 1])
+        return events.iloc[lo:hi].drop(columns='finn_kode').reset_index(drop=True)
+
+    def series(self, kommune: Optional[str] = None, boligtype: Optional[str] = None) -> pd.DataFrame:
+        """Tidsserien for en kommune og/eller boligtype (None = alle), indeksert på dag"""
+        if not os.path.exists(self.series_path):
+            return pd.DataFrame(columns=SERIES_COLUMNS[2:])
+        serie = pd.read_parquet(self.series_path, filters=[('kommune', '==', kommune or ALLE),
+                                                           ('boligtype', '==', boligtype or ALLE)])
+        return serie.drop(columns=['kommune', 'boligtype']).set_index('dag').sort_index()
+
+
+def backfill_from_archive(archive_dir: str, history_dir: str = HISTORY_DIR, extractor: str = 'lxml',
+                          workers: int = 1) -> None:
+    """Registrer én snapshot per dag i side-arkivet (se archive.py), eldste først"""
+    from archive import PageArchive, iter_replay
+    from extractors import COLUMNS
+    from pipeline import dedupe, validate
+
+    history = PriceHistory(history_dir)
+    sist = history.state()['sist_sett'].max() if os.path.exists(history.state_path) else None
+    for dag in PageArchive(archive_dir).stats()['dager']:
+        if sist is not None and pd.Timestamp(dag) <= sist.normalize():
+            continue
+        boliger = [bolig for _, _, batch in dedupe(validate(iter_replay(archive_dir, extractor, workers, dag)), set())
+                   for bolig in batch]
+        if boliger:
+            teller = history.record(pd.DataFrame(boliger, columns=COLUMNS), pd.Timestamp(f"{dag}T23:59:59"))
+            print(f"📅 {dag}: {len(boliger)} boliger - " + ", ".join(f"{k} {v}" for k, v in teller.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prishistorikk per annonse og per kommune")
+    parser.add_argument('--historikk', default=HISTORY_DIR, help="Historikkmappe")
+    parser.add_argument('--kommune', default=None, help="Vis median per dag for kommunen")
+    parser.add_argument('--boligtype', default=None, help="Vis median per dag for boligtypen")
+    parser.add_argument('--finn-kode', default=None, help="Vis prisforløpet til en annonse")
+    parser.add_argument('--fra-arkiv', default=None, help="Bygg historikk fra side-arkivet (én snapshot per dag)")
+    args = parser.parse_args()
+
+    history = PriceHistory(args.historikk)
+    if args.fra_arkiv:
+        backfill_from_archive(args.fra_arkiv, args.historikk)
+    if args.finn_kode:
+        print(history.trajectory(args.finn_kode).to_string(index=False))
+    else:
+        serie = history.series(args.kommune, args.boligtype)
+        print(f"📈 {args.kommune or ALLE} / {args.boligtype or ALLE}: {len(serie)} dager")
+        print(serie.to_string())
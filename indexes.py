@@ -0,0 +1,281 @@
+"""
+Boligmarked Analyse - Indekser for dashboardet
+Forhåndsberegnede strukturer som bygges én gang per datasettversjon
+"""
+
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Kolonner vi holder prefikssummer for (snitt over et filter i O(1))
+SUM_COLUMNS = ('pris', 'storrelse_kvm', 'pris_per_kvm')
+
+
+def _group_bounds(codes: np.ndarray) -> Dict[int, Tuple[int, int]]:
+    """Start/slutt for hver kode i et sortert kode-array"""
+    if len(codes) == 0:
+        return {}
+    starts = np.flatnonzero(np.diff(codes)) + 1
+    starts = np.concatenate(([0], starts))
+    ends = np.concatenate((starts[1:], [len(codes)]))
+    return {int(codes[s]): (int(s), int(e)) for s, e in zip(starts, ends)}
+
+
+class _Family:
+    """Posisjoner sortert etter (gruppe, pris) + prefikssummer, for én filterkombinasjon"""
+
+    def __init__(self, positions: np.ndarray, codes: np.ndarray, columns: Dict[str, np.ndarray]):
+        self.positions = positions.astype(np.int32)
+        self.pris = columns['pris'][positions]
+        self.cumsums = {
+            col: np.concatenate(([0.0], np.cumsum(columns[col][positions], dtype=np.float64)))
+            for col in SUM_COLUMNS
+        }
+        self.bounds = _group_bounds(codes[positions])
+        # Radene i familiens rekkefølge (se FilterIndex._frame)
+        self.frame: Optional[pd.DataFrame] = None
+
+
+class FilterIndex:
+    """
+    Filterindeks for sidebar-filtrene i app.py.
+
+    Radene sorteres én gang etter (kommune, boligtype, pris), så hver
+    (kommune, boligtype) er en sammenhengende blokk - et filter blir et
+    dict-oppslag + binærsøk på pris, og resultatet er en view (ingen kopi).
+    For 'Alle' i ett eller begge filtrene holdes egne posisjons-arrays
+    sortert etter pris, og radene i den rekkefølgen kopieres én gang første
+    gang familien filtreres - deretter er også de filtrene slices.
+    Prefikssummer gir antall og snitt uten å se på radene
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        kommune = df['kommune'].astype('category')
+        boligtype = df['boligtype'].astype('category')
+        k = kommune.cat.codes.to_numpy().astype(np.int64)
+        t = boligtype.cat.codes.to_numpy().astype(np.int64)
+        pris = df['pris'].to_numpy(dtype=np.float64)
+
+        order = np.lexsort((pris, t, k))
+        self.df = df.iloc[order].reset_index(drop=True)
+        k, t = k[order], t[order]
+
+        self.kommuner = {str(name): code for code, name in enumerate(kommune.cat.categories)}
+        self.boligtyper = {str(name): code for code, name in enumerate(boligtype.cat.categories)}
+        n_typer = max(len(self.boligtyper), 1)
+
+        columns = {col: self.df[col].to_numpy(dtype=np.float64) for col in SUM_COLUMNS}
+
+        # (kommune, boligtype): sammenhengende blokker i self.df
+        self._exact = _Family(np.arange(len(self.df)), k * n_typer + t, columns)
+        self._n_typer = n_typer
+
+        # (kommune, Alle), (Alle, boligtype) og (Alle, Alle)
+        pris_sorted = columns['pris']
+        self._per_kommune = _Family(np.lexsort((pris_sorted, k)), k, columns)
+        self._per_type = _Family(np.lexsort((pris_sorted, t)), t, columns)
+        self._alle = _Family(np.argsort(pris_sorted, kind='stable'), np.zeros(len(self.df), dtype=np.int64),
+                             columns)
+
+    def _locate(self, kommune: Optional[str], boligtype: Optional[str],
+                pris_range: Optional[Tuple[float, float]]) -> Tuple[_Family, int, int]:
+        """Finn familie og [a, b) i familiens posisjoner for et filter"""
+        if kommune is not None and boligtype is not None:
+            family = self._exact
+            if kommune not in self.kommuner or boligtype not in self.boligtyper:
+                return family, 0, 0
+            key = self.kommuner[kommune] * self._n_typer + self.boligtyper[boligtype]
+        elif kommune is not None:
+            family = self._per_kommune
+            key = self.kommuner.get(kommune, -1)
+        elif boligtype is not None:
+            family = self._per_type
+            key = self.boligtyper.get(boligtype, -1)
+        else:
+            family = self._alle
+            key = 0
+
+        start, end = family.bounds.get(key, (0, 0))
+        if pris_range is not None and end > start:
+            block = family.pris[start:end]
+            lo = start + int(np.searchsorted(block, pris_range[0], side='left'))
+            hi = start + int(np.searchsorted(block, pris_range[1], side='right'))
+            return family, lo, hi
+        return family, start, end
+
+    def positions(self, kommune: Optional[str] = None, boligtype: Optional[str] = None,
+                  pris_range: Optional[Tuple[float, float]] = None) -> np.ndarray:
+        """Radposisjoner i self.df som matcher filteret, sortert etter pris (view)"""
+        family, a, b = self._locate(kommune, boligtype, pris_range)
+        return family.positions[a:b]
+
+    def filter(self, kommune: Optional[str] = None, boligtype: Optional[str] = None,
+               pris_range: Optional[Tuple[float, float]] = None) -> pd.DataFrame:
+        """Rader som matcher filteret. None = 'Alle'"""
+        family, a, b = self._locate(kommune, boligtype, pris_range)
+        # Sammenhengende blokk i familiens rader - slice uten kopi
+        return self._frame(family).iloc[a:b]
+
+    def _frame(self, family: _Family) -> pd.DataFrame:
+        """Radene sortert som familien. Bygges én gang (kopi), så er hvert filter en slice"""
+        if family.frame is None:
+            family.frame = self.df if family is self._exact else self.df.take(family.positions)
+        return family.frame
+
+    def summary(self, kommune: Optional[str] = None, boligtype: Optional[str] = None,
+                pris_range: Optional[Tuple[float, float]] = None) -> Dict:
+        """Antall og snitt av pris, størrelse og kr/kvm for filteret, i O(log n)"""
+        family, a, b = self._locate(kommune, boligtype, pris_range)
+        antall = b - a
+        summary = {'antall': antall}
+        for col in SUM_COLUMNS:
+            total = family.cumsums[col][b] - family.cumsums[col][a]
+            summary[col] = total / antall if antall else np.nan
+        return summary
+
+    def options(self) -> Dict:
+        """Verdier til sidebar-filtrene (samme format som SqlStore.options)"""
+        pris = self._alle.pris
+        return {
+            'kommuner': sorted(self.kommuner),
+            'boligtyper': sorted(self.boligtyper),
+            'min_pris': int(pris[0]) if len(pris) else 0,
+            'max_pris': int(pris[-1]) if len(pris) else 0,
+            'antall': len(self.df),
+        }
+
+
+# Vekter i avstanden til sammenlignbare boliger: størrelse og kr/kvm i
+# standardavvik (log), kommune og boligtype som one-hot. Annen boligtype
+# teller mer enn annen kommune
+COMPARABLE_WEIGHTS = {'storrelse_kvm': 1.0, 'pris_per_kvm': 0.5, 'kommune': 1.0, 'boligtype': 1.5}
+
+# Minste antall boliger for at et segment skal ha egen median-kr/kvm
+MIN_SEGMENT = 3
+
+# Demper vekten til naboer med avstand ~0 (1 / (avstand + DISTANCE_EPS))
+DISTANCE_EPS = 0.05
+
+
+class ComparablesIndex:
+    """
+    Nærmeste-nabo-indeks for sammenlignbare boliger (KD-tre, scipy).
+
+    Hver bolig er et punkt: standardisert log-størrelse og log-kr/kvm, og
+    one-hot kommune og boligtype, skalert med COMPARABLE_WEIGHTS. En sjelden
+    kombinasjon gir da de nærmeste boligene i nabokategoriene i stedet for
+    ingenting. Spørringer uten kr/kvm (priskalkulatoren) bruker segmentets
+    median, så naboene er typiske boliger og ikke styrt av modellens pris
+    """
+
+    def __init__(self, df: pd.DataFrame, weights: Optional[Dict[str, float]] = None):
+        from scipy.spatial import cKDTree
+
+        self.weights = {**COMPARABLE_WEIGHTS, **(weights or {})}
+        self.df = df.reset_index(drop=True)
+        kommune = self.df['kommune'].astype(str)
+        boligtype = self.df['boligtype'].astype(str)
+        self.kommuner = {name: code for code, name in enumerate(sorted(kommune.unique()))}
+        self.boligtyper = {name: code for code, name in enumerate(sorted(boligtype.unique()))}
+        self._k = kommune.map(self.kommuner).to_numpy(dtype=np.int64)
+        self._t = boligtype.map(self.boligtyper).to_numpy(dtype=np.int64)
+
+        self.kr_kvm = self.df['pris_per_kvm'].to_numpy(dtype=np.float64)
+        log_kvm = np.log(self.df['storrelse_kvm'].to_numpy(dtype=np.float64))
+        log_kr = np.log(self.kr_kvm)
+        self._center = np.array([log_kvm.mean(), log_kr.mean()]) if len(self.df) else np.zeros(2)
+        self._scale = np.array([log_kvm.std() or 1.0, log_kr.std() or 1.0]) if len(self.df) else np.ones(2)
+        self._median_log_kr = self._segment_medians(log_kr)
+
+        self.tree = cKDTree(self._encode(log_kvm, log_kr, self._k, self._t))
+
+    def _segment_medians(self, log_kr: np.ndarray) -> np.ndarray:
+        """
+        Median log-kr/kvm per (kommune, boligtype), med boligtypens, kommunens
+        eller totalens median for små segmenter. Siste rad/kolonne er for ukjente
+        """
+        n_k, n_t = len(self.kommuner), len(self.boligtyper)
+        frame = pd.DataFrame({'k': self._k, 't': self._t, 'v': log_kr})
+        total = float(frame['v'].median()) if len(frame) else 0.0
+        medians = np.full((n_k + 1, n_t + 1), total)
+
+        per_type = frame.groupby('t')['v'].agg(['median', 'size'])
+        for t, row in per_type[per_type['size'] >= MIN_SEGMENT].iterrows():
+            medians[:, t] = row['median']
+        per_kommune = frame.groupby('k')['v'].agg(['median', 'size'])
+        for k, row in per_kommune[per_kommune['size'] >= MIN_SEGMENT].iterrows():
+            medians[k, n_t] = row['median']
+        per_segment = frame.groupby(['k', 't'])['v'].agg(['median', 'size'])
+        for (k, t), row in per_segment[per_segment['size'] >= MIN_SEGMENT].iterrows():
+            medians[k, t] = row['median']
+        return medians
+
+    def _encode(self, log_kvm: np.ndarray, log_kr: np.ndarray, k: np.ndarray, t: np.ndarray) -> np.ndarray:
+        """Punkter i indeksens rom. Kode -1 (ukjent kommune/boligtype) gir ingen one-hot"""
+        n_k, n_t = len(self.kommuner), len(self.boligtyper)
+        X = np.zeros((len(log_kvm), 2 + n_k + n_t))
+        X[:, 0] = (log_kvm - self._center[0]) / self._scale[0] * self.weights['storrelse_kvm']
+        X[:, 1] = (log_kr - self._center[1]) / self._scale[1] * self.weights['pris_per_kvm']
+        rows = np.arange(len(log_kvm))
+        X[rows[k >= 0], 2 + k[k >= 0]] = self.weights['kommune']
+        X[rows[t >= 0], 2 + n_k + t[t >= 0]] = self.weights['boligtype']
+        return X
+
+    def _weighted_kr_kvm(self, avstand: np.ndarray, posisjoner: np.ndarray) -> np.ndarray:
+        """Avstandsvektet snitt av naboenes kr/kvm (siste akse = naboer)"""
+        vekter = 1.0 / (avstand + DISTANCE_EPS)
+        return (vekter * self.kr_kvm[posisjoner]).sum(axis=-1) / vekter.sum(axis=-1)
+
+    def query(self, storrelse_kvm: float, kommune: str, boligtype: str, k: int = 10,
+              pris_per_kvm: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(avstander, posisjoner i self.df) for de k nærmeste boligene, nærmeste først"""
+        k_code = self.kommuner.get(kommune, -1)
+        t_code = self.boligtyper.get(boligtype, -1)
+        log_kr = np.log(pris_per_kvm) if pris_per_kvm else self._median_log_kr[k_code, t_code]
+        point = self._encode(np.array([np.log(storrelse_kvm)]), np.array([log_kr]),
+                             np.array([k_code]), np.array([t_code]))[0]
+        k = min(k, len(self.df))
+        avstand, posisjoner = self.tree.query(point, k=k)
+        return np.atleast_1d(avstand), np.atleast_1d(posisjoner)
+
+    def estimate(self, storrelse_kvm: float, kommune: str, boligtype: str, k: int = 10,
+                 pris_per_kvm: Optional[float] = None) -> float:
+        """Avstandsvektet prisestimat fra de k nærmeste (kr/kvm × størrelse)"""
+        if len(self.df) == 0:
+            return np.nan
+        avstand, posisjoner = self.query(storrelse_kvm, kommune, boligtype, k, pris_per_kvm)
+        return float(self._weighted_kr_kvm(avstand, posisjoner)) * storrelse_kvm
+
+    def comparables(self, storrelse_kvm: float, kommune: str, boligtype: str, k: int = 10,
+                    pris_per_kvm: Optional[float] = None) -> Tuple[pd.DataFrame, float]:
+        """De k nærmeste boligene (med kolonnen 'avstand') og prisestimatet fra dem"""
+        if len(self.df) == 0:
+            return self.df.assign(avstand=pd.Series(dtype=np.float64)), np.nan
+        avstand, posisjoner = self.query(storrelse_kvm, kommune, boligtype, k, pris_per_kvm)
+        estimat = float(self._weighted_kr_kvm(avstand, posisjoner)) * storrelse_kvm
+        return self.df.take(posisjoner).assign(avstand=avstand), estimat
+
+    def estimate_batch(self, k: int = 10, bruk_kr_kvm: bool = False,
+                       workers: int = -1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Prisestimat fra de k nærmeste for hver bolig i self.df (boligen selv
+        utelatt), og posisjonene til naboene (n × k). Med bruk_kr_kvm=False
+        søkes det med segmentets median-kr/kvm, så estimatet ikke avhenger av
+        boligens egen pris. workers=-1 bruker alle kjerner
+        """
+        n = len(self.df)
+        k = min(k, n - 1)
+        if k < 1:
+            return np.full(n, np.nan), np.empty((n, 0), dtype=np.int64)
+        log_kvm = np.log(self.df['storrelse_kvm'].to_numpy(dtype=np.float64))
+        log_kr = np.log(self.kr_kvm) if bruk_kr_kvm else self._median_log_kr[self._k, self._t]
+        avstand, posisjoner = self.tree.query(self._encode(log_kvm, log_kr, self._k, self._t), k=k + 1,
+                                              workers=workers)
+
+        # Fjern boligen selv (eller den fjerneste hvis duplikater har fortrengt den)
+        selv = posisjoner == np.arange(n)[:, None]
+        selv[~selv.any(axis=1), -1] = True
+        avstand = avstand[~selv].reshape(n, k)
+        posisjoner = posisjoner[~selv].reshape(n, k)
+        return self._weighted_kr_kvm(avstand, posisjoner) * np.exp(log_kvm), posisjoner
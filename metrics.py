@@ -0,0 +1,185 @@
+"""
+Boligmarked Analyse - Instrumentering
+Tellere, gauges og tidsmålinger (spans) for scraperen og dashboardet.
+Eksporteres som Prometheus-textfile (for node_exporter sin textfile-collector)
+og som JSON-lines trace med én linje per span
+
+    from metrics import METRICS
+    with METRICS.span('http_request', status='200') as span:
+        ...
+        span['bytes'] = len(body)
+    METRICS.inc('http_bytes_total', len(body))
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+METRICS_DIR = 'metrics'
+NAMESPACE = 'boliganalyse'
+
+# Histogram-bøtter for varighet i sekunder
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict) -> Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class Metrics:
+    """Trådsikkert register for tellere, gauges og histogrammer, med valgfri trace-fil"""
+
+    def __init__(self, namespace: str = NAMESPACE):
+        self.namespace = namespace
+        self.lock = threading.Lock()
+        self.counters: Dict[Key, float] = {}
+        self.gauges: Dict[Key, float] = {}
+        self.histograms: Dict[Key, List[float]] = {}   # [antall per bøtte..., +Inf, sum]
+        self._trace = None
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """Øk en teller"""
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def total(self, name: str) -> float:
+        """Summen av en teller over alle label-kombinasjoner"""
+        with self.lock:
+            return sum(value for (n, _), value in self.counters.items() if n == name)
+
+    def set(self, name: str, value: float, **labels) -> None:
+        """Sett en gauge"""
+        with self.lock:
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        """Registrer en varighet i histogrammet `name`"""
+        key = _key(name, labels)
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = [0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    hist[i] += 1
+            hist[-2] += 1
+            hist[-1] += seconds
+
+    @contextmanager
+    def span(self, name: str, **labels) -> Iterator[Dict]:
+        """
+        Mål tiden for en blokk: histogrammet <name>_seconds med `labels`, og en
+        linje i trace-filen. Attributter lagt i det yieldede dict-et havner i tracen
+        """
+        attrs: Dict = {}
+        start_wall = time.time()
+        start = time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe(f"{name}_seconds", seconds, **labels)
+            if self._trace is not None:
+                self._write_trace({
+                    'ts': round(start_wall, 6),
+                    'span': name,
+                    'ms': round(seconds * 1000, 3),
+                    'thread': threading.current_thread().name,
+                    **{k: str(v) for k, v in labels.items()},
+                    **attrs,
+                })
+
+    def start_trace(self, path: str) -> None:
+        """Skriv spans som JSON-lines til `path` (legges til på slutten av filen)"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self.lock:
+            if self._trace is not None:
+                self._trace.close()
+            self._trace = open(path, 'a', encoding='utf-8', buffering=1)
+
+    def _write_trace(self, record: Dict) -> None:
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self.lock:
+            if self._trace is not None:
+                self._trace.write(line + '\n')
+
+    def stop_trace(self) -> None:
+        with self.lock:
+            if self._trace is not None:
+                self._trace.close()
+                self._trace = None
+
+    def prometheus(self) -> str:
+        """Alle målinger i Prometheus sitt tekstformat"""
+        lines = []
+        with self.lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            histograms = {key: list(hist) for key, hist in self.histograms.items()}
+
+        for kind, values in (('counter', counters), ('gauge', gauges)):
+            for name in sorted({name for name, _ in values}):
+                full = f"{self.namespace}_{name}"
+                lines.append(f"# TYPE {full} {kind}")
+                for (n, labels), value in sorted(values.items()):
+                    if n == name:
+                        lines.append(f"{full}{_format_labels(labels)} {value:g}")
+
+        for name in sorted({name for name, _ in histograms}):
+            full = f"{self.namespace}_{name}"
+            lines.append(f"# TYPE {full} histogram")
+            for (n, labels), hist in sorted(histograms.items()):
+                if n != name:
+                    continue
+                for bound, count in zip(BUCKETS, hist):
+                    lines.append(f"{full}_bucket{_format_labels(labels, ('le', f'{bound:g}'))} {count}")
+                lines.append(f"{full}_bucket{_format_labels(labels, ('le', '+Inf'))} {hist[-2]}")
+                lines.append(f"{full}_sum{_format_labels(labels)} {hist[-1]:.6f}")
+                lines.append(f"{full}_count{_format_labels(labels)} {hist[-2]}")
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path: str) -> None:
+        """Skriv textfile atomisk (node_exporter skal aldri lese en halv fil)"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus())
+        os.replace(tmp, path)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Antall, total og snitt (ms) per histogram - for utskrift og debug-panelet"""
+        with self.lock:
+            histograms = {key: list(hist) for key, hist in self.histograms.items()}
+        rows = {}
+        for (name, labels), hist in sorted(histograms.items()):
+            label = name + (_format_labels(labels) if labels else '')
+            rows[label] = {
+                'antall': hist[-2],
+                'total_ms': hist[-1] * 1000,
+                'snitt_ms': hist[-1] * 1000 / hist[-2] if hist[-2] else 0.0,
+            }
+        return rows
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+
+# Felles register for prosessen
+METRICS = Metrics()
@@ -0,0 +1,453 @@
+"""
+Boligmarked Analyse - Prismodell og modellregister
+Trener prismodellen og lagrer den ferdig tilpassede modellen med
+feature-kolonner og metadata, nøklet på en innholdshash av datasettet.
+Appen laster modellen fra registeret og trener bare på nytt når dataene endres
+
+    python model.py              # tren (eller hent) modell for gjeldende datasett
+    python model.py --utvalg     # velg beste modell med kryssvalidering (selection.py)
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Protocol, Tuple
+
+import numpy as np
+import pandas as pd
+
+from metrics import METRICS
+
+# sklearn og joblib importeres i funksjonene som trenger dem, så appen kan
+# vise data og nøkkeltall før sklearn er lastet
+
+MODEL_DIR = 'modeller'
+MODEL_COLUMNS = ['storrelse_kvm', 'kommune', 'boligtype', 'pris']
+
+
+def encode_features(df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.Series, List[str]]:
+    """One-hot-encodet feature-matrise X, target y og alle kolonner (inkl. pris)"""
+    # Fjern rader med manglende data. Som strenger gir get_dummies bare de
+    # kategoriene som finnes, sortert - samme kolonner som StreamingFit
+    df_model = df[MODEL_COLUMNS].dropna().astype({'kommune': str, 'boligtype': str})
+
+    # Encode kategoriske variabler
+    # One-hot encoding for kommune og boligtype
+    df_encoded = pd.get_dummies(df_model, columns=['kommune', 'boligtype'], drop_first=True)
+
+    # Separer features og target
+    X = df_encoded.drop('pris', axis=1)
+    y = df_encoded['pris']
+    return X, y, df_encoded.columns.tolist()
+
+
+def train_price_model(df: pd.DataFrame):
+    """Tren ML-modell for prisprediksjon med flere features"""
+    from sklearn.linear_model import LinearRegression
+    from sklearn.metrics import mean_absolute_error, r2_score
+
+    X, y, all_columns = encode_features(df)
+
+    # Split data - på innholdet, så StreamingFit får samme split bit for bit
+    test = is_test_row(_row_hashes(df[MODEL_COLUMNS].dropna()))
+    X_train, X_test, y_train, y_test = X[~test], X[test], y[~test], y[test]
+
+    # Tren modell
+    model = LinearRegression()
+    model.fit(X_train, y_train)
+
+    # Evaluer
+    y_pred = model.predict(X_test)
+    r2 = r2_score(y_test, y_pred)
+    mae = mean_absolute_error(y_test, y_pred)
+
+    # Returner også feature names for senere bruk
+    feature_names = X.columns.tolist()
+
+    return model, r2, mae, feature_names, all_columns
+
+
+def _row_hashes(df: pd.DataFrame) -> np.ndarray:
+    df_model = df[MODEL_COLUMNS].astype({'kommune': str, 'boligtype': str, 'pris': 'float64',
+                                         'storrelse_kvm': 'float64'})
+    return pd.util.hash_pandas_object(df_model, index=False).to_numpy()
+
+
+def is_test_row(hashes: np.ndarray) -> np.ndarray:
+    """Testsettet: hver femte rad etter innholdshash (20 %, uavhengig av rekkefølge og bitstørrelse)"""
+    return hashes % 5 == 0
+
+
+def _hash_key(antall: int, hash_sum: int) -> str:
+    return hashlib.sha256(f"{antall}:{hash_sum}".encode()).hexdigest()[:16]
+
+
+def data_hash(df: pd.DataFrame) -> str:
+    """
+    Innholdshash av kolonnene modellen trenes på: summen av radhashene
+    (mod 2^64) og antall rader. Uavhengig av radrekkefølgen - dashboardet
+    (sortert filterindeks), SQLite og CLI-et gir samme nøkkel - og kan
+    regnes ut bit for bit (StreamingFit)
+    """
+    hashes = _row_hashes(df)
+    return _hash_key(len(hashes), int(hashes.sum(dtype=np.uint64)))
+
+
+def canonical_order(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Radene i en fast rekkefølge gitt av innholdet, så train/test-splitten
+    (og dermed R²/MAE) blir den samme uansett hvordan datasettet ble lastet
+    """
+    return df.iloc[np.argsort(_row_hashes(df), kind='stable')]
+
+
+def label_codes(labels) -> Tuple[np.ndarray, List[str]]:
+    """
+    (kode per rad, unike verdier) for en kolonne med kategorier. Kategoriske
+    kolonner har kodene fra før; ellers pd.factorize (hashing, ingen sortering).
+    Manglende verdier får kode -1
+    """
+    if isinstance(labels, pd.Series):
+        labels = labels.array
+    if isinstance(labels, pd.Categorical):
+        return labels.codes, [str(label) for label in labels.categories]
+    labels = np.atleast_1d(np.asarray(labels))
+    if labels.dtype.kind == 'U':
+        labels = labels.astype(object)   # factorize er langt raskere på objekter enn på fast bredde
+    codes, unike = pd.factorize(labels)
+    return codes, [str(label) for label in unike]
+
+
+class Pricer(Protocol):
+    """Felles grensesnitt for LinearPricer og ModelPricer (make_pricer)"""
+
+    def predict_one(self, storrelse_kvm: float, kommune: str, boligtype: str) -> float: ...
+
+    def predict(self, storrelse_kvm, kommune, boligtype) -> np.ndarray: ...
+
+
+class LinearPricer:
+    """
+    Den lineære modellen kompilert til en koeffisienttabell:
+    pris = intercept + stigning * kvm + kommune-ledd + boligtype-ledd.
+    Prediksjon uten DataFrame - skalar med predict_one(), NumPy-batch med predict().
+    Ukjente kategorier (og referansekategorien fra drop_first) gir ledd 0,
+    akkurat som en rad med bare nuller i one-hot-kolonnene
+    """
+
+    def __init__(self, intercept: float, stigning: float, kommuner: Dict[str, float],
+                 boligtyper: Dict[str, float]):
+        self.intercept = intercept
+        self.stigning = stigning
+        self.kommuner = kommuner
+        self.boligtyper = boligtyper
+
+    @classmethod
+    def from_model(cls, model, feature_names: List[str]) -> 'LinearPricer':
+        """Bygg tabellen fra en tilpasset LinearRegression og dens feature-kolonner"""
+        coef = dict(zip(feature_names, (float(c) for c in model.coef_)))
+        return cls(
+            intercept=float(model.intercept_),
+            stigning=coef.get('storrelse_kvm', 0.0),
+            kommuner={name[len('kommune_'):]: c for name, c in coef.items() if name.startswith('kommune_')},
+            boligtyper={name[len('boligtype_'):]: c for name, c in coef.items() if name.startswith('boligtype_')},
+        )
+
+    def predict_one(self, storrelse_kvm: float, kommune: str, boligtype: str) -> float:
+        """Predikert pris for én bolig"""
+        return (self.intercept + self.stigning * storrelse_kvm
+                + self.kommuner.get(kommune, 0.0) + self.boligtyper.get(boligtype, 0.0))
+
+    @staticmethod
+    def _offsets(labels, table: Dict[str, float]) -> np.ndarray:
+        """Ledd per rad - oppslag bare for de unike verdiene"""
+        codes, unike = label_codes(labels)
+        # Ekstra 0 sist: kode -1 (manglende verdi) gir ledd 0
+        return np.array([table.get(label, 0.0) for label in unike] + [0.0])[codes]
+
+    def predict(self, storrelse_kvm, kommune, boligtype) -> np.ndarray:
+        """Predikerte priser for arrays av (størrelse, kommune, boligtype)"""
+        pris = self.intercept + self.stigning * np.asarray(storrelse_kvm, dtype=np.float64)
+        pris += self._offsets(kommune, self.kommuner)
+        pris += self._offsets(boligtype, self.boligtyper)
+        return pris
+
+
+class ModelPricer:
+    """
+    Samme API som LinearPricer for modeller uten koeffisienttabell (f.eks.
+    gradient boosting eller log-target). One-hot-matrisen bygges direkte i NumPy
+    """
+
+    def __init__(self, model, feature_names: List[str]):
+        self.model = model
+        self.n_features = len(feature_names)
+        self.storrelse_col = feature_names.index('storrelse_kvm')
+        self.kommuner = {name[len('kommune_'):]: i for i, name in enumerate(feature_names)
+                         if name.startswith('kommune_')}
+        self.boligtyper = {name[len('boligtype_'):]: i for i, name in enumerate(feature_names)
+                           if name.startswith('boligtype_')}
+
+    def _matrix(self, storrelse_kvm, kommune, boligtype) -> np.ndarray:
+        storrelse_kvm = np.atleast_1d(np.asarray(storrelse_kvm, dtype=np.float64))
+        X = np.zeros((len(storrelse_kvm), self.n_features))
+        X[:, self.storrelse_col] = storrelse_kvm
+        for labels, table in ((kommune, self.kommuner), (boligtype, self.boligtyper)):
+            codes, unike = label_codes(labels)
+            cols = np.array([table.get(label, -1) for label in unike] + [-1])[codes]
+            rows = np.flatnonzero(cols >= 0)
+            X[rows, cols[rows]] = 1
+        return X
+
+    def predict_one(self, storrelse_kvm: float, kommune: str, boligtype: str) -> float:
+        """Predikert pris for én bolig"""
+        return float(self.model.predict(self._matrix([storrelse_kvm], [kommune], [boligtype]))[0])
+
+    def predict(self, storrelse_kvm, kommune, boligtype) -> np.ndarray:
+        """Predikerte priser for arrays av (størrelse, kommune, boligtype)"""
+        return self.model.predict(self._matrix(storrelse_kvm, kommune, boligtype))
+
+
+def make_pricer(model, feature_names: List[str]) -> Pricer:
+    """Koeffisienttabell for lineære modeller, ellers ModelPricer"""
+    if hasattr(model, 'coef_') and hasattr(model, 'intercept_'):
+        return LinearPricer.from_model(model, feature_names)
+    return ModelPricer(model, feature_names)
+
+
+class StreamingFit:
+    """
+    Den lineære prismodellen (samme features og split som train_price_model)
+    tilpasset bit for bit: per (test, kommune, boligtype) holdes bare antall og
+    summene av x, x², y, xy og y² (x = størrelse, y = pris). Normalligningene,
+    R² og registernøkkelen (data_hash) regnes ut fra summene, så datasettet
+    holdes aldri i minnet. MAE trenger ett pass til over testradene
+    """
+    _SUMS = ['n', 'x', 'xx', 'y', 'xy', 'yy']
+
+    def __init__(self):
+        self.sums: Optional[pd.DataFrame] = None
+        self.antall = 0
+        self._hash_sum = 0
+
+    def add(self, chunk: pd.DataFrame) -> None:
+        hashes = _row_hashes(chunk)
+        self.antall += len(hashes)
+        self._hash_sum = (self._hash_sum + int(hashes.sum(dtype=np.uint64))) % 2 ** 64
+
+        gyldig = chunk[MODEL_COLUMNS].notna().all(axis=1).to_numpy()
+        x = chunk['storrelse_kvm'].to_numpy(dtype=np.float64)[gyldig]
+        y = chunk['pris'].to_numpy(dtype=np.float64)[gyldig]
+        parts = pd.DataFrame({
+            'test': is_test_row(hashes[gyldig]),
+            'kommune': chunk['kommune'].astype(str).to_numpy()[gyldig],
+            'boligtype': chunk['boligtype'].astype(str).to_numpy()[gyldig],
+            'n': 1.0, 'x': x, 'xx': x * x, 'y': y, 'xy': x * y, 'yy': y * y,
+        })
+        sums = parts.groupby(['test', 'kommune', 'boligtype'])[self._SUMS].sum()
+        self.sums = sums if self.sums is None else self.sums.add(sums, fill_value=0)
+
+    def key(self) -> str:
+        """Samme nøkkel som data_hash for hele datasettet"""
+        return _hash_key(self.antall, self._hash_sum)
+
+    def _design(self, index: pd.MultiIndex, kommuner: List[str], typer: List[str]) -> np.ndarray:
+        """Konstantleddet og dummyene for hver gruppe (kolonne 1, størrelsen, er 0)"""
+        design = np.zeros((len(index), 2 + len(kommuner) + len(typer)))
+        design[:, 0] = 1
+        kommune = pd.Index(kommuner).get_indexer(index.get_level_values('kommune'))
+        boligtype = pd.Index(typer).get_indexer(index.get_level_values('boligtype'))
+        rows = np.arange(len(index))
+        design[rows[kommune >= 0], 2 + kommune[kommune >= 0]] = 1
+        design[rows[boligtype >= 0], 2 + len(kommuner) + boligtype[boligtype >= 0]] = 1
+        return design
+
+    def result(self, chunks: Iterable[pd.DataFrame]):
+        """Tilpass modellen og evaluer på testradene: (model, r2, mae, feature_names, all_columns)"""
+        from sklearn.linear_model import LinearRegression
+
+        if self.sums is None:
+            raise ValueError("Ingen rader å trene på")
+        # Som get_dummies(drop_first=True): sorterte kategorier, den første er referansen
+        kommuner = sorted(self.sums.index.get_level_values('kommune').unique())[1:]
+        typer = sorted(self.sums.index.get_level_values('boligtype').unique())[1:]
+        feature_names = (['storrelse_kvm'] + [f'kommune_{k}' for k in kommuner]
+                         + [f'boligtype_{t}' for t in typer])
+        test = self.sums.index.get_level_values('test').to_numpy(dtype=bool)
+        train, held_out = self.sums[~test], self.sums[test]
+
+        # X'X og X'y: en rad er design + x * e1, summert over radene i hver gruppe
+        design = self._design(train.index, kommuner, typer)
+        e1 = np.zeros(design.shape[1])
+        e1[1] = 1
+        dx = design.T @ train['x'].to_numpy()
+        xtx = (design.T @ (design * train['n'].to_numpy()[:, None]) + np.outer(dx, e1) + np.outer(e1, dx)
+               + train['xx'].sum() * np.outer(e1, e1))
+        xty = design.T @ train['y'].to_numpy() + train['xy'].sum() * e1
+        coef = np.linalg.lstsq(xtx, xty, rcond=None)[0]
+
+        model = LinearRegression()
+        model.intercept_ = float(coef[0])
+        model.coef_ = coef[1:]
+        model.n_features_in_ = len(feature_names)
+        model.feature_names_in_ = np.array(feature_names, dtype=object)
+
+        # R² på testradene fra summene: prediksjonen er c + b * x per gruppe
+        c = self._design(held_out.index, kommuner, typer) @ coef
+        b = coef[1]
+        n, x, xx, y, xy, yy = (held_out[col].to_numpy() for col in self._SUMS)
+        sse = (yy - 2 * c * y - 2 * b * xy + n * c * c + 2 * c * b * x + b * b * xx).sum()
+        sst = yy.sum() - y.sum() ** 2 / n.sum()
+        r2 = 1 - sse / sst
+
+        pricer = LinearPricer.from_model(model, feature_names)
+        abs_sum = 0.0
+        for chunk in chunks:
+            rows = chunk[MODEL_COLUMNS].dropna()
+            rows = rows[is_test_row(_row_hashes(rows))]
+            pred = pricer.predict(rows['storrelse_kvm'], rows['kommune'].astype(str), rows['boligtype'].astype(str))
+            abs_sum += np.abs(rows['pris'].to_numpy(dtype=np.float64) - pred).sum()
+        mae = abs_sum / n.sum()
+
+        all_columns = ['storrelse_kvm', 'pris'] + feature_names[1:]
+        return model, r2, mae, feature_names, all_columns
+
+
+class ModelRegistry:
+    """
+    Modellregister på disk: <hash>.joblib (modell + kolonner) og
+    <hash>.json (metadata: R², MAE, treningstid, antall rader osv.)
+    """
+
+    def __init__(self, model_dir: str = MODEL_DIR):
+        self.model_dir = model_dir
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        base = os.path.join(self.model_dir, key)
+        return base + '.joblib', base + '.json'
+
+    def metadata(self, key: str) -> Optional[Dict]:
+        """Metadata for en lagret modell, eller None"""
+        _, meta_path = self._paths(key)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def load(self, key: str):
+        """Last (model, r2, mae, feature_names, all_columns) for en hash"""
+        import joblib
+
+        model_path, _ = self._paths(key)
+        artifact = joblib.load(model_path)
+        meta = self.metadata(key)
+        return artifact['model'], meta['r2'], meta['mae'], artifact['feature_names'], artifact['all_columns']
+
+    def save(self, key: str, result, trening_sek: float, n_rader: int, extra: Optional[Dict] = None) -> Dict:
+        """Lagre en trent modell med metadata (extra: f.eks. resultater fra modellutvalget)"""
+        import joblib
+        import sklearn
+
+        model, r2, mae, feature_names, all_columns = result
+        os.makedirs(self.model_dir, exist_ok=True)
+        model_path, meta_path = self._paths(key)
+
+        joblib.dump({'model': model, 'feature_names': feature_names, 'all_columns': all_columns}, model_path)
+
+        meta = {
+            'data_hash': key,
+            'modell': type(model).__name__,
+            'r2': float(r2),
+            'mae': float(mae),
+            'trening_sek': round(trening_sek, 4),
+            'n_rader': n_rader,
+            'features': feature_names,
+            'sklearn': sklearn.__version__,
+            'opprettet': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            **(extra or {}),
+        }
+        # Metadata skrives sist - den markerer at modellen er komplett
+        tmp = meta_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, meta_path)
+        return meta
+
+    def get_or_train(self, df: pd.DataFrame):
+        """Hent modell for datasettet fra registeret, eller tren og lagre en ny"""
+        key = data_hash(df)
+        if self.metadata(key) is not None:
+            with METRICS.span('model_load'):
+                return self.load(key)
+
+        with METRICS.span('model_train') as span:
+            start = time.perf_counter()
+            result = train_price_model(canonical_order(df))
+            self.save(key, result, time.perf_counter() - start, len(df))
+            span['rader'] = len(df)
+        return result
+
+    def get_or_fit(self, fit: StreamingFit, chunks: Callable[[], Iterable[pd.DataFrame]]):
+        """
+        get_or_train for et datasett som leses i biter: fit har sett alle bitene,
+        chunks() leser dem på nytt (for MAE) hvis modellen må trenes
+        """
+        key = fit.key()
+        if self.metadata(key) is not None:
+            with METRICS.span('model_load'):
+                return self.load(key)
+
+        with METRICS.span('model_train') as span:
+            start = time.perf_counter()
+            result = fit.result(chunks())
+            self.save(key, result, time.perf_counter() - start, fit.antall)
+            span['rader'] = fit.antall
+        return result
+
+    def list(self) -> List[Dict]:
+        """Metadata for alle lagrede modeller, nyeste først"""
+        if not os.path.isdir(self.model_dir):
+            return []
+        metas = [self.metadata(name[:-5]) for name in os.listdir(self.model_dir) if name.endswith('.json')]
+        return sorted(metas, key=lambda m: m['opprettet'], reverse=True)
+
+
+if __name__ == "__main__":
+    from storage import load_dataset, remove_outliers
+
+    parser = argparse.ArgumentParser(description="Tren prismodellen og lagre den i modellregisteret")
+    parser.add_argument('--utvalg', action='store_true',
+                        help="Velg modell med kryssvalidering over flere modellfamilier (selection.py)")
+    parser.add_argument('--folder', type=int, default=5, help="Antall folder i kryssvalideringen")
+    parser.add_argument('--workers', type=int, default=None, help="Prosesser (standard: alle kjerner)")
+    parser.add_argument('--latens-budsjett', type=float, default=None,
+                        help="Maks prediksjonslatens for én bolig i mikrosekunder")
+    args = parser.parse_args()
+
+    df = remove_outliers(load_dataset())
+    registry = ModelRegistry()
+    key = data_hash(df)
+
+    if args.utvalg:
+        from selection import select_model
+
+        start = time.perf_counter()
+        result, rapport = select_model(df, folds=args.folder, workers=args.workers,
+                                       latency_budget_us=args.latens_budsjett)
+        print(rapport.to_string(float_format=lambda v: f"{v:,.3f}"))
+        vinner = rapport[rapport['valgt']].iloc[0]
+        registry.save(key, result, time.perf_counter() - start, len(df), extra={
+            'utvalg': {'familie': vinner['familie'], 'params': vinner['params'], 'folder': args.folder,
+                       'latens_us': float(vinner['latens_us']), 'latens_budsjett_us': args.latens_budsjett},
+        })
+        ny = True
+    else:
+        ny = registry.metadata(key) is None
+        registry.get_or_train(df)
+
+    meta = registry.metadata(key)
+    print(f"{'🆕 Trent' if ny else '✓ Fantes allerede'}: {registry._paths(key)[0]} ({meta['modell']})")
+    print(f"R²: {meta['r2']:.3f} | MAE: {meta['mae']:,.0f} kr | Treningstid: {meta['trening_sek']:.3f} s "
+          f"| {meta['n_rader']} rader")
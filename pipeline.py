@@ -0,0 +1,188 @@
+"""
+Boligmarked Analyse - Strømmende scrape-pipeline
+fetch → parse → validate → dedupe → (enrich) → sink
+
+Hver location skrives til disk som en egen batch så snart den er ferdig,
+med checkpoint slik at en avbrutt kjøring kan fortsette der den slapp
+"""
+
+import glob
+import json
+import os
+import shutil
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import pandas as pd
+
+from extractors import COLUMNS
+from metrics import METRICS
+from storage import SqlStore, dataset_version, load_dataset, save_dataset, to_compact, upsert_boliger
+
+RUN_DIR = '.scrape_run'
+
+Batch = Tuple[str, str, List[Dict]]
+
+
+def fetch(scraper, locations: List[Tuple[str, str]], max_pages: Optional[int] = None,
+          index=None, concurrent: bool = True) -> Iterator[Batch]:
+    """Hent og parse - én batch per location, i den rekkefølgen de blir ferdige"""
+    yield from scraper.iter_locations(locations, max_pages, index, concurrent)
+
+
+def is_valid(bolig: Dict) -> bool:
+    """Sjekk at en record har alle felter og fornuftige verdier"""
+    return (
+        all(col in bolig for col in COLUMNS)
+        and bool(bolig['finn_kode']) and str(bolig['finn_kode']).isdigit()
+        and bolig['pris'] > 0
+        and bolig['storrelse_kvm'] > 0
+        and bool(bolig['kommune'])
+    )
+
+
+def validate(batches: Iterator[Batch], stats: Optional[Dict] = None) -> Iterator[Batch]:
+    """Fjern ugyldige records (antall forkastede telles i stats['forkastet'])"""
+    for location_id, area_name, boliger in batches:
+        gyldige = [bolig for bolig in boliger if is_valid(bolig)]
+        METRICS.inc('records_rejected_total', len(boliger) - len(gyldige))
+        if stats is not None:
+            stats['forkastet'] = stats.get('forkastet', 0) + len(boliger) - len(gyldige)
+        yield location_id, area_name, gyldige
+
+
+def dedupe(batches: Iterator[Batch], seen: Set[str]) -> Iterator[Batch]:
+    """Fjern finn_koder vi allerede har sett i denne kjøringen (første forekomst vinner)"""
+    for location_id, area_name, boliger in batches:
+        unike = []
+        for bolig in boliger:
+            if bolig['finn_kode'] not in seen:
+                seen.add(bolig['finn_kode'])
+                unike.append(bolig)
+        METRICS.inc('records_duplicate_total', len(boliger) - len(unike))
+        yield location_id, area_name, unike
+
+
+def enrich(batches: Iterator[Batch], enricher) -> Iterator[Batch]:
+    """
+    Hent detaljer fra annonsesidene for batchens boliger (se enrichment.py).
+    Detaljene lagres i enricherens cache - recordene går videre uendret
+    """
+    for location_id, area_name, boliger in batches:
+        enricher.enrich([bolig['finn_kode'] for bolig in boliger])
+        yield location_id, area_name, boliger
+
+
+class BatchSink:
+    """
+    Skriver hver batch til en egen Parquet-fil i run_dir og oppdaterer
+    checkpoint.json med ferdige locations. finalize() setter sammen delene
+    til det endelige datasettet
+    """
+    def __init__(self, run_dir: str = RUN_DIR, resume: bool = False, index=None):
+        self.run_dir = run_dir
+        self.checkpoint_path = os.path.join(run_dir, 'checkpoint.json')
+        self.index = index
+        self.done: Set[str] = set()
+        self.seen: Set[str] = set()
+        self.parts = 0
+        self.cube = None
+
+        if resume and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            self.done = set(checkpoint['done'])
+            self.parts = checkpoint['parts']
+            for path in self._part_paths():
+                koder = pd.read_parquet(path, columns=['finn_kode'])['finn_kode']
+                self.seen.update(koder.dropna().astype(str))
+        else:
+            shutil.rmtree(run_dir, ignore_errors=True)
+        os.makedirs(run_dir, exist_ok=True)
+
+    def _part_paths(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.run_dir, 'del-*.parquet')))[:self.parts]
+
+    def write(self, location_id: str, boliger: List[Dict]) -> None:
+        """Skriv en batch og marker location som ferdig"""
+        if boliger:
+            self.parts += 1
+            path = os.path.join(self.run_dir, f"del-{self.parts:05d}.parquet")
+            to_compact(pd.DataFrame(boliger, columns=COLUMNS)).to_parquet(path, index=False)
+
+        # Indeksen må lagres sammen med checkpointet, ellers tror vi ved
+        # gjenopptak at annonsene i ferdige locations fortsatt er nye
+        if self.index is not None:
+            self.index.save()
+
+        self.done.add(location_id)
+        tmp = self.checkpoint_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'done': sorted(self.done), 'parts': self.parts}, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    def iter_parts(self) -> Iterator[pd.DataFrame]:
+        """Les batchene fra disk, én om gangen"""
+        for path in self._part_paths():
+            yield pd.read_parquet(path)
+
+    def finalize(self, output: str, incremental: bool = False) -> Optional[pd.DataFrame]:
+        """
+        Sett sammen batchene til output. I vanlig modus strømmes delene rett
+        til fil; i inkrementell modus upsertes de inn i eksisterende datasett.
+        Aggregat-kuben (self.cube) oppdateres/beregnes og lagres ved siden av datasettet.
+        Returnerer det ferdige datasettet (None hvis ingenting ble hentet)
+        """
+        from aggregates import AggregateCube, cube_path
+
+        if incremental:
+            nye = [df for df in self.iter_parts()]
+            nye = pd.concat(nye, ignore_index=True) if nye else pd.DataFrame(columns=COLUMNS)
+            print(f"\n🔄 {len(nye)} nye/endrede boliger")
+            if nye.empty and not os.path.exists(output):
+                return None
+
+            # Oppdater aggregat-kuben med bare endringene hvis den er à jour
+            forrige_versjon = dataset_version(output)
+            df, erstattet = upsert_boliger(nye, output)
+            save_dataset(df, output)
+            if os.path.exists(cube_path(output)):
+                cube = AggregateCube.load(cube_path(output))
+                if cube.data_version == forrige_versjon:
+                    cube.update(to_compact(nye), erstattet, df, dataset_version(output))
+                    cube.save(cube_path(output))
+        else:
+            if self.parts == 0:
+                return None
+            write_parts(self.iter_parts(), output)
+            df = load_dataset(output)
+
+        self.cube = AggregateCube.for_dataset(output, df)
+        shutil.rmtree(self.run_dir, ignore_errors=True)
+        return df
+
+
+def write_parts(parts: Iterator[pd.DataFrame], output: str) -> None:
+    """Skriv delene til output uten å holde hele datasettet i minnet"""
+    tmp = output + '.tmp'
+    if output.endswith('.parquet'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+        for df in parts:
+            # Kategorier varierer mellom delene - skriv som vanlige strenger
+            table = pa.Table.from_pandas(df.astype({'kommune': str, 'boligtype': str}), preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp, table.schema, compression='zstd')
+            writer.write_table(table.cast(writer.schema))
+        writer.close()
+    elif output.endswith('.db'):
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        store = SqlStore(tmp)
+        for df in parts:
+            store.save(df, replace=False)
+    else:
+        for i, df in enumerate(parts):
+            save_dataset(df, tmp, append=i > 0)
+    os.replace(tmp, output)
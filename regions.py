@@ -0,0 +1,131 @@
+"""
+Boligmarked Analyse - Regioner og partisjonerte datasett
+Hvilke områder som scrapes styres av locations.json (fylke → liste med
+[Finn location ID, kommune]). Regional scraping skriver til et datasett
+partisjonert på fylke og scrape-dato:
+
+    data/boliger/fylke=Østfold/dato=2026-10-17/del-000-av-004.parquet
+
+Locations fordeles på shards med en stabil hash av location ID, så hver
+prosess eller maskin kan ta sin del (--shard i --shards n). Lesing tar bare
+partisjonene for de valgte fylkene - filene fra siste kjøring per fylke
+"""
+
+import glob
+import json
+import os
+import zlib
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+LOCATIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'locations.json')
+PARTITION_ROOT = os.path.join('data', 'boliger')
+
+Location = Tuple[str, str]
+
+
+class PartitionSelection(NamedTuple):
+    """Utvalg av partisjoner - brukes som data_version i dashboardet (hashbar)"""
+    root: str
+    fylker: Tuple[str, ...]
+    version: str
+
+
+def load_locations(path: str = LOCATIONS_PATH) -> Dict[str, List[Location]]:
+    """fylke → [(location_id, kommune)] i rekkefølgen fra konfigurasjonen"""
+    with open(path, encoding='utf-8') as f:
+        return {fylke: [tuple(loc) for loc in locations] for fylke, locations in json.load(f).items()}
+
+
+def shard_of(location_id: str, shards: int) -> int:
+    """Stabil fordeling (samme på alle maskiner, uavhengig av rekkefølgen i konfigurasjonen)"""
+    return zlib.crc32(location_id.encode('utf-8')) % shards
+
+
+def select_locations(locations: Dict[str, List[Location]], fylker: Optional[List[str]] = None,
+                     shard: int = 0, shards: int = 1) -> Dict[str, List[Location]]:
+    """Locations for de valgte fylkene (None = alle) som hører til denne shard-en"""
+    ukjente = set(fylker or []) - set(locations)
+    if ukjente:
+        raise ValueError(f"Ukjente fylker: {', '.join(sorted(ukjente))} (se {LOCATIONS_PATH})")
+    valgt = {}
+    for fylke in fylker or locations:
+        mine = [loc for loc in locations[fylke] if shard_of(loc[0], shards) == shard]
+        if mine:
+            valgt[fylke] = mine
+    return valgt
+
+
+def partition_path(fylke: str, dato: str, shard: int = 0, shards: int = 1, root: str = PARTITION_ROOT) -> str:
+    return os.path.join(root, f"fylke={fylke}", f"dato={dato}", f"del-{shard:03d}-av-{shards:03d}.parquet")
+
+
+def list_partitions(root: str = PARTITION_ROOT) -> List[Dict[str, str]]:
+    """Alle partisjonsfiler som {fylke, dato, del, path}"""
+    partitions = []
+    for path in glob.glob(os.path.join(root, 'fylke=*', 'dato=*', '*.parquet')):
+        dato_dir, filename = os.path.split(path)
+        fylke_dir = os.path.dirname(dato_dir)
+        partitions.append({
+            'fylke': os.path.basename(fylke_dir)[len('fylke='):],
+            'dato': os.path.basename(dato_dir)[len('dato='):],
+            'del': filename,
+            'path': path,
+        })
+    return partitions
+
+
+def fylker(root: str = PARTITION_ROOT) -> List[str]:
+    """Fylkene som har data"""
+    return sorted({p['fylke'] for p in list_partitions(root)})
+
+
+def latest_partitions(root: str = PARTITION_ROOT, fylker: Optional[List[str]] = None) -> List[Dict[str, str]]:
+    """
+    Filene fra siste kjøring per fylke: nyeste dato, og innenfor den datoen
+    bare shard-oppsettet (av-NNN) som ble skrevet sist. Eldre datoer og et
+    tidligere antall shards tas ikke med - ellers kommer fjernede annonser tilbake
+    """
+    per_fylke: Dict[str, List[Dict[str, str]]] = {}
+    for p in list_partitions(root):
+        if fylker is None or p['fylke'] in fylker:
+            per_fylke.setdefault(p['fylke'], []).append(p)
+
+    latest = []
+    for filer in per_fylke.values():
+        dato = max(p['dato'] for p in filer)
+        filer = [p for p in filer if p['dato'] == dato]
+        oppsett = max(filer, key=lambda p: os.path.getmtime(p['path']))['del'].rsplit('-av-', 1)[1]
+        latest.extend(p for p in filer if p['del'].endswith('-av-' + oppsett))
+    return sorted(latest, key=lambda p: (p['fylke'], p['del']))
+
+
+def selection(root: str = PARTITION_ROOT, fylker: Optional[List[str]] = None) -> PartitionSelection:
+    """Utvalget med en versjon som endres når en av filene endres"""
+    files = latest_partitions(root, fylker)
+    stamp = max((os.path.getmtime(p['path']) for p in files), default=0)
+    return PartitionSelection(root, tuple(sorted(fylker or [])), f"{len(files)}@{stamp}")
+
+
+def load_partitions(root: str = PARTITION_ROOT, fylker: Optional[List[str]] = None,
+                    columns: Optional[List[str]] = None):
+    """
+    Siste data for de valgte fylkene (None = alle) med kompakte datatyper og
+    en fylke-kolonne. Bare filene for fylkene leses. Annonser som finnes i
+    flere shards (samme annonse under flere locations) tas med én gang
+    """
+    import pandas as pd
+    from extractors import COLUMNS
+    from storage import to_compact
+
+    deler = []
+    for p in latest_partitions(root, fylker):
+        df = pd.read_parquet(p['path'], columns=columns)
+        deler.append(df.assign(fylke=p['fylke']))
+    if not deler:
+        return to_compact(pd.DataFrame(columns=columns or COLUMNS).assign(fylke=pd.Series(dtype=str)))
+
+    df = pd.concat(deler, ignore_index=True)
+    if 'finn_kode' in df.columns:
+        df = df.drop_duplicates('finn_kode', keep='first')
+    df['fylke'] = df['fylke'].astype('category')
+    return to_compact(df)
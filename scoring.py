@@ -0,0 +1,226 @@
+"""
+Boligmarked Analyse - Bulk-scoring av hele datasettet
+Predikerer pris for alle annonser, og regner ut avvik og persentil innenfor
+hvert segment (kommune, boligtype). Annonser langt under eller over
+predikert pris flagges. Datasettet leses og skrives i biter, og bitene
+scores parallelt på flere kjerner
+
+    python scoring.py                                   # boliger_ostfold.* -> *_scoret.*
+    python scoring.py --data boliger_norge.parquet --workers 8 --terskel 2.5
+"""
+
+import argparse
+import os
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from aggregates import sketch_bins, sketch_value
+from model import MODEL_COLUMNS, ModelRegistry, Pricer, StreamingFit, make_pricer
+from pipeline import write_parts
+from storage import default_path, iter_dataset, remove_outliers
+
+CHUNK_ROWS = 250_000
+
+# Robust z-score (avvik fra segmentets median i MAD-enheter) over denne flagges
+FLAGG_TERSKEL = 3.0
+MAD_SKALA = 1.4826
+# Bøttebredden i avviksskissen: relativ feil ~0,25 % på pris / predikert
+AVVIK_GAMMA = 1.005
+
+_pricer: Optional[Pricer] = None
+
+
+def _init_worker(pricer: Pricer) -> None:
+    global _pricer
+    _pricer = pricer
+
+
+def score_chunk(chunk: pd.DataFrame, pricer: Optional[Pricer] = None) -> pd.DataFrame:
+    """Predikert pris og avvik (kr og relativt) for en bit"""
+    pricer = pricer or _pricer
+    predikert = pricer.predict(chunk['storrelse_kvm'], chunk['kommune'].astype(str),
+                               chunk['boligtype'].astype(str))
+    pris = chunk['pris'].to_numpy(dtype=np.float64)
+    # En lineær modell kan gi negative priser for små boliger - da er relativt avvik meningsløst
+    gyldig = predikert > 0
+    return chunk.assign(
+        predikert_pris=predikert.round(),
+        avvik_kr=(pris - predikert).round(),
+        avvik_pct=np.where(gyldig, pris / np.where(gyldig, predikert, 1) - 1, np.nan) * 100,
+    )
+
+
+def _segment_keys(chunk: pd.DataFrame) -> np.ndarray:
+    return (chunk['kommune'].astype(str) + '|' + chunk['boligtype'].astype(str)).to_numpy()
+
+
+def _scored(path: str, pricer: Pricer, workers: int, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Scorede biter i samme rekkefølge som datasettet, med maks 2 biter per worker i arbeid"""
+    chunks = iter_dataset(path, chunk_rows)
+    if workers <= 1:
+        for chunk in chunks:
+            yield score_chunk(chunk, pricer)
+        return
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(pricer,)) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(score_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class SegmentStats:
+    """
+    Kvantil-skisse av relativt avvik per segment (logaritmiske bøtter på
+    pris / predikert, som aggregatkuben) - grunnlag for median, MAD, persentil
+    og flagg. Minnet vokser med antall bøtter, ikke antall rader
+    """
+
+    def __init__(self):
+        self.sketches: Dict[str, Counter] = {}
+        self.bins: Dict[str, np.ndarray] = {}
+        self.cumulative: Dict[str, np.ndarray] = {}
+        self.median: Dict[str, float] = {}
+        self.mad: Dict[str, float] = {}
+
+    @staticmethod
+    def _bins(avvik: np.ndarray) -> np.ndarray:
+        # pris / predikert; en pris på 0 (avvik -100 %) havner i laveste bøtte
+        return sketch_bins(np.maximum(1 + avvik / 100, 1e-6), AVVIK_GAMMA)
+
+    def add(self, chunk: pd.DataFrame) -> None:
+        avvik = chunk['avvik_pct'].to_numpy(dtype=np.float64)
+        gyldig = ~np.isnan(avvik)
+        bins = pd.DataFrame({'key': _segment_keys(chunk)[gyldig], 'bin': self._bins(avvik[gyldig])})
+        for (key, bin_index), n in bins.value_counts().items():
+            self.sketches.setdefault(key, Counter())[int(bin_index)] += int(n)
+
+    def finish(self) -> None:
+        for key, sketch in self.sketches.items():
+            bins = np.array(sorted(sketch))
+            counts = np.array([sketch[b] for b in bins])
+            values = (sketch_value(bins, AVVIK_GAMMA) - 1) * 100
+            self.bins[key] = bins
+            self.cumulative[key] = np.cumsum(counts)
+            self.median[key] = _weighted_median(values, counts)
+            avstand = np.abs(values - self.median[key])
+            order = np.argsort(avstand, kind='stable')
+            self.mad[key] = _weighted_median(avstand[order], counts[order])
+        self.sketches = {}
+
+    def rank(self, chunk: pd.DataFrame, terskel: float) -> pd.DataFrame:
+        """Legg til persentil (0-100) innen segmentet og flagg for under-/overprisede"""
+        avvik = chunk['avvik_pct'].to_numpy(dtype=np.float64)
+        keys = _segment_keys(chunk)
+        bins = self._bins(np.nan_to_num(avvik))
+        persentil = np.full(len(chunk), np.nan)
+        z = np.full(len(chunk), np.nan)
+        for key in np.unique(keys):
+            if key not in self.bins:
+                continue
+            rows = keys == key
+            cumulative = np.concatenate([[0], self.cumulative[key]])
+            persentil[rows] = (cumulative[np.searchsorted(self.bins[key], bins[rows], side='right')]
+                               / cumulative[-1] * 100)
+            if self.mad[key] > 0:
+                z[rows] = (avvik[rows] - self.median[key]) / (MAD_SKALA * self.mad[key])
+
+        persentil[np.isnan(avvik)] = np.nan
+        flagg = np.where(z < -terskel, 'underpriset', np.where(z > terskel, 'overpriset', ''))
+        return chunk.assign(persentil=persentil.round(1), flagg=flagg)
+
+
+def _weighted_median(values: np.ndarray, counts: np.ndarray) -> float:
+    """Medianen av sorterte verdier med vekter (snitt av de to midterste, som np.median)"""
+    cumulative = np.cumsum(counts)
+    midten = (cumulative[-1] - 1) / 2
+    return float(values[np.searchsorted(cumulative, [np.floor(midten), np.ceil(midten)], side='right')].mean())
+
+
+def load_pricer(path: str, chunk_rows: int = CHUNK_ROWS) -> Tuple[Pricer, Dict]:
+    """
+    Modellen for datasettet fra modellregisteret (samme rensede treningsdata og
+    nøkkel som dashboardet, så en modell trent der gjenbrukes). Datasettet
+    leses i biter; bare summer per segment holdes i minnet (StreamingFit)
+    """
+    columns = MODEL_COLUMNS + ['pris_per_kvm']
+
+    def chunks() -> Iterator[pd.DataFrame]:
+        return (remove_outliers(chunk) for chunk in iter_dataset(path, chunk_rows, columns))
+
+    fit = StreamingFit()
+    for chunk in chunks():
+        fit.add(chunk)
+    model, r2, mae, feature_names, _ = ModelRegistry().get_or_fit(fit, chunks)
+    return make_pricer(model, feature_names), {'r2': r2, 'mae': mae, 'n_rader': fit.antall}
+
+
+def score_dataset(path: Optional[str] = None, output: Optional[str] = None, workers: int = 1,
+                  chunk_rows: int = CHUNK_ROWS, terskel: float = FLAGG_TERSKEL, topp: int = 10) -> Dict:
+    """
+    Score hele datasettet i to strømmende pass: først avvik per segment,
+    deretter persentil og flagg mens bitene skrives til output
+    """
+    path = path or default_path()
+    if output is None:
+        base, ext = os.path.splitext(path)
+        output = f"{base}_scoret{'.parquet' if ext == '.db' else ext}"
+    if output.endswith('.db'):
+        raise ValueError("Scoret datasett kan ikke skrives til SQLite - bruk .parquet eller .csv")
+
+    pricer, modell = load_pricer(path, chunk_rows)
+
+    stats = SegmentStats()
+    for chunk in _scored(path, pricer, workers, chunk_rows):
+        stats.add(chunk)
+    stats.finish()
+
+    resultat = {'output': output, 'modell': modell, 'antall': 0, 'underpriset': 0, 'overpriset': 0}
+    billigste = []
+
+    def ranked() -> Iterator[pd.DataFrame]:
+        for chunk in _scored(path, pricer, workers, chunk_rows):
+            chunk = stats.rank(chunk, terskel)
+            resultat['antall'] += len(chunk)
+            resultat['underpriset'] += int((chunk['flagg'] == 'underpriset').sum())
+            resultat['overpriset'] += int((chunk['flagg'] == 'overpriset').sum())
+            billigste.append(chunk[chunk['flagg'] == 'underpriset'].nsmallest(topp, 'avvik_pct'))
+            yield chunk
+
+    write_parts(ranked(), output)
+    billigste = [df for df in billigste if len(df)]
+    resultat['topp_underpriset'] = (pd.concat(billigste).nsmallest(topp, 'avvik_pct')
+                                    if billigste else pd.DataFrame())
+    return resultat
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score alle boliger mot prismodellen og flagg avvikere")
+    parser.add_argument('--data', default=None, help="Datasett (standard: boliger_ostfold.parquet/.csv)")
+    parser.add_argument('--output', default=None, help="Resultatfil (.parquet eller .csv, standard: <data>_scoret)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Prosesser som scorer biter")
+    parser.add_argument('--chunk', type=int, default=CHUNK_ROWS, help="Rader per bit")
+    parser.add_argument('--terskel', type=float, default=FLAGG_TERSKEL,
+                        help="Flagg når avviket er mer enn så mange robuste standardavvik fra segmentets median")
+    args = parser.parse_args()
+
+    resultat = score_dataset(args.data, args.output, args.workers, args.chunk, args.terskel)
+
+    modell = resultat['modell']
+    print(f"🤖 Modell: R² {modell['r2']:.3f} | MAE {modell['mae']:,.0f} kr | {modell['n_rader']} treningsrader")
+    print(f"📊 {resultat['antall']} boliger scoret -> {resultat['output']}")
+    print(f"   🔻 {resultat['underpriset']} underpriset | 🔺 {resultat['overpriset']} overpriset")
+
+    topp = resultat['topp_underpriset']
+    if len(topp):
+        print("\nMest underprisede:")
+        for _, rad in topp.iterrows():
+            print(f"   {rad['finn_kode']}  {rad['kommune']:<12} {rad['boligtype']:<14} "
+                  f"{rad['pris']:>12,.0f} kr  (predikert {rad['predikert_pris']:,.0f}, {rad['avvik_pct']:+.0f} %)")
@@ -1,216 +1,601 @@
 """
 Boligmarked Analyse - Finn.no Scraper FINAL
-Bruker korrekte Finn.no location IDs for Østfold
+Bruker korrekte Finn.no location IDs for Østfold, og for andre regioner
+fra locations.json (se regions.py)
 """
 
+import argparse
+import hashlib
+import json
+import os
+import random
 import requests
-from bs4 import BeautifulSoup
-import pandas as pd
+from requests.adapters import HTTPAdapter
+import threading
 import time
-import re
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator, List, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from archive import ARCHIVE_DIR, PageArchive, iter_replay
+from extractors import (COLUMNS, FINN_PER_PAGE, SoupExtractor, get_extractor, parse_pris,
+                        parse_result_info, parse_storrelse)
+from metrics import METRICS, METRICS_DIR
+from regions import PARTITION_ROOT, load_locations, partition_path, select_locations
+
+
+# Finn viser maks 50 annonser per side og maks 50 sider per søk
+FINN_MAX_PAGES = 50
+
+# Finn.no location IDs for Østfold (fra locations.json, der flere fylker kan legges til)
+OSTFOLD_LOCATIONS = load_locations()['Østfold']
+
+
+class TokenBucket:
+    """
+    Trådsikker token bucket - maks `rate` forespørsler per sekund,
+    med inntil `capacity` forespørsler i en kort burst
+    """
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Vent til et token er ledig og bruk det"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ResponseCache:
+    """
+    Enkel respons-cache på disk, nøkkel = URL.
+    Lagrer body + ETag/Last-Modified slik at vi kan gjøre conditional GET
+    """
+    def __init__(self, cache_dir: str = '.finn_cache'):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+    
+    def _path(self, url: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode('utf-8')).hexdigest())
+    
+    def get(self, url: str) -> Optional[Tuple[bytes, Dict]]:
+        """Returner (body, meta) fra cache, eller None"""
+        path = self._path(url)
+        try:
+            with open(path + '.json', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(path + '.html', 'rb') as f:
+                return f.read(), meta
+        except (FileNotFoundError, ValueError):
+            return None
+    
+    def put(self, url: str, body: bytes, headers) -> None:
+        """Lagre respons - kun hvis serveren ga oss noe å validere mot"""
+        meta = {
+            'url': url,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+        }
+        if not meta['etag'] and not meta['last_modified']:
+            return
+        
+        # Skriv til temp-fil og bytt inn, så samtidige tråder aldri ser halve filer
+        path = self._path(url)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(body)
+        os.replace(tmp, path + '.html')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp, path + '.json')
+
+
+class ListingIndex:
+    """
+    Persistent indeks over finn_koder vi har sett, med første/siste gang sett
+    og et fingerprint av annonsen for å oppdage endringer (f.eks. prisendring)
+    """
+    def __init__(self, path: str = 'boliger_index.json'):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.entries = json.load(f)
+    
+    @staticmethod
+    def fingerprint(bolig: Dict) -> str:
+        return f"{bolig['pris']}|{bolig['storrelse_kvm']}|{bolig['boligtype']}|{bolig['tittel']}"
+    
+    def __contains__(self, finn_kode: str) -> bool:
+        return finn_kode in self.entries
+    
+    def observe(self, bolig: Dict) -> bool:
+        """
+        Registrer at annonsen er sett nå. Returnerer True hvis den er ny eller
+        endret (og dermed skal upsertes)
+        """
+        finn_kode = bolig.get('finn_kode')
+        if not finn_kode:
+            return True
+        
+        now = time.strftime('%Y-%m-%dT%H:%M:%S')
+        fingerprint = self.fingerprint(bolig)
+        
+        with self.lock:
+            entry = self.entries.get(finn_kode)
+            if entry is None:
+                self.entries[finn_kode] = {'first_seen': now, 'last_seen': now, 'fingerprint': fingerprint}
+                return True
+            
+            entry['last_seen'] = now
+            if entry['fingerprint'] != fingerprint:
+                entry['fingerprint'] = fingerprint
+                return True
+            return False
+    
+    def save(self) -> None:
+        """Skriv indeksen atomisk til disk"""
+        tmp = self.path + '.tmp'
+        with self.lock, open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp, self.path)
+
 
 class FinnScraper:
-    def __init__(self):
+    # Statuskoder som er verdt å prøve på nytt
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+    
+    def __init__(self, rate_per_host: float = 4.0, burst: int = 4, max_workers: int = 8,
+                 max_retries: int = 4, backoff: float = 1.0, cache_dir: Optional[str] = '.finn_cache',
+                 extractor: str = 'lxml', archive_dir: Optional[str] = None):
         self.base_url = "https://www.finn.no"
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
+        
+        # Felles rate limit per host + tak på samtidige forespørsler
+        self.rate_per_host = rate_per_host
+        self.burst = burst
+        self.max_workers = max_workers
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._buckets_lock = threading.Lock()
+        
+        # Delt session med connection pool (keep-alive, én TLS-handshake per tilkobling)
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        
+        # Retry med eksponentiell backoff + jitter
+        self.max_retries = max_retries
+        self.backoff = backoff
+        
+        # Conditional-GET cache (None = av)
+        self.cache = ResponseCache(cache_dir) if cache_dir else None
+        
+        # Dekningsrapport per location fra siste kjøring
+        self.rapporter: List[Dict] = []
+        
+        # Pluggbar HTML-parser (se extractors.py)
+        self.extractor = get_extractor(extractor)
+        self._soup_extractor = SoupExtractor()
+        
+        # Arkiv over rå søkesider for replay uten nettverk (None = av, se archive.py)
+        self.archive = PageArchive(archive_dir) if archive_dir else None
     
-    def scrape_location(self, location_id: str, area_name: str, max_pages: int = 5) -> List[Dict]:
+    def _bucket_for(self, url: str) -> TokenBucket:
+        """Hent (eller opprett) token bucket for hosten i url"""
+        host = urlparse(url).netloc
+        with self._buckets_lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.rate_per_host, self.burst)
+            return self._buckets[host]
+    
+    def _backoff_delay(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        """Eksponentiell backoff med full jitter, respekterer Retry-After"""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                return float(retry_after)
+        return random.uniform(0, self.backoff * (2 ** attempt))
+    
+    def _get(self, url: str, use_cache: bool = True) -> bytes:
         """
-        Scraper boliger for en spesifikk Finn.no location
+        GET via delt session med rate limit, retry/backoff og conditional-GET cache.
+        Returnerer body (fra nettet eller cachen ved 304). use_cache=False går
+        utenom respons-cachen (for sider som caches på annen måte)
         """
-        boliger = []
+        with METRICS.span('http_get') as span:
+            span['url'] = url
+            return self._get_with_retry(url, span, use_cache)
+    
+    def _get_with_retry(self, url: str, span: Dict, use_cache: bool = True) -> bytes:
+        cache = self.cache if use_cache else None
+        cached = cache.get(url) if cache else None
+        headers = {}
+        if cached:
+            meta = cached[1]
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
         
+        for attempt in range(self.max_retries + 1):
+            span['forsok'] = attempt + 1
+            start = time.perf_counter()
+            self._bucket_for(url).acquire()
+            METRICS.observe('rate_limit_wait_seconds', time.perf_counter() - start)
+            
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, headers=headers, timeout=10)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                METRICS.inc('http_errors_total', reason=type(e).__name__)
+                if attempt == self.max_retries:
+                    raise
+                METRICS.inc('http_retries_total', reason=type(e).__name__)
+                time.sleep(self._backoff_delay(attempt))
+                continue
+            
+            METRICS.observe('http_request_seconds', time.perf_counter() - start, status=response.status_code)
+            span['status'] = response.status_code
+            
+            if response.status_code == 304 and cached:
+                METRICS.inc('http_cache_hits_total')
+                span['bytes'] = len(cached[0])
+                return cached[0]
+            
+            if response.status_code == 304:
+                # 304 uten at vi har en kopi (f.eks. fra en proxy) har ingen body - prøv
+                # igjen uten betingede headere og forbi mellomliggende cacher
+                METRICS.inc('http_errors_total', reason='304 uten cache')
+                if attempt == self.max_retries:
+                    raise requests.HTTPError(f"304 Not Modified uten cachet kopi: {url}", response=response)
+                METRICS.inc('http_retries_total', reason=304)
+                headers = {'Cache-Control': 'no-cache'}
+                continue
+            
+            if response.status_code in self.RETRY_STATUS and attempt < self.max_retries:
+                METRICS.inc('http_retries_total', reason=response.status_code)
+                time.sleep(self._backoff_delay(attempt, response))
+                continue
+            
+            response.raise_for_status()
+            
+            METRICS.inc('http_bytes_total', len(response.content))
+            span['bytes'] = len(response.content)
+            if cache:
+                cache.put(url, response.content, response.headers)
+            return response.content
+    
+    def _search_url(self, location_id: str, page: int = 1, sort: Optional[str] = None) -> str:
+        """Bygg søke-url for en location og side"""
         search_url = f"{self.base_url}/realestate/homes/search.html?location={location_id}"
+        if sort:
+            search_url += f"&sort={sort}"
+        return search_url if page == 1 else f"{search_url}&page={page}"
+    
+    def _parse_page(self, html: bytes, area_name: str) -> Optional[List[Dict]]:
+        """
+        Parse en søkeresultat-side. Returnerer None hvis siden ikke har
+        annonser (slutten av resultatene)
+        """
+        with METRICS.span('parse_page', parser=self.extractor.name) as span:
+            side = self.extractor.parse_page(html, area_name)
+            span['annonser'] = len(side) if side else 0
+        if side:
+            METRICS.inc('listings_parsed_total', len(side))
+        return side
+    
+    def _get_page(self, location_id: str, area_name: str, page: int, sort: Optional[str] = None) -> bytes:
+        """Hent en søkeside (og arkiver den hvis arkivet er på)"""
+        url = self._search_url(location_id, page, sort)
+        html = self._get(url)
+        if self.archive is not None:
+            with METRICS.span('archive_put'):
+                self.archive.put(url, html, location_id, area_name, page, sort)
+        return html
+    
+    def _fetch_page(self, location_id: str, area_name: str, page: int,
+                    sort: Optional[str] = None) -> Optional[List[Dict]]:
+        """Hent og parse en side"""
+        html = self._get_page(location_id, area_name, page, sort)
+        return self._parse_page(html, area_name)
+    
+    def _fetch_first_page(self, location_id: str, area_name: str,
+                          sort: Optional[str] = None) -> Tuple[Optional[List[Dict]], Optional[int], Optional[int]]:
+        """Hent side 1 og les totalt antall treff og antall sider"""
+        html = self._get_page(location_id, area_name, 1, sort)
+        treff, sider = parse_result_info(html)
+        return self._parse_page(html, area_name), treff, sider
+    
+    def _probe_pages(self, location_id: str, area_name: str, start: int, bound: int,
+                     sort: Optional[str] = None) -> List[Tuple[int, Optional[List[Dict]], Optional[Exception]]]:
+        """Hent sider sekvensielt til vi treffer en tom side (når antall sider er ukjent)"""
+        resultater = []
+        for page in range(start, bound + 1):
+            try:
+                side = self._fetch_page(location_id, area_name, page, sort)
+            except Exception as e:
+                resultater.append((page, None, e))
+                continue
+            resultater.append((page, side, None))
+            if side is None:
+                break
+        return resultater
+    
+    @staticmethod
+    def _page_bound(sider: Optional[int], max_pages: Optional[int]) -> int:
+        """Siste side vi skal hente: antall sider fra side 1, Finn sitt tak og ev. max_pages"""
+        bound = min(sider, FINN_MAX_PAGES) if sider is not None else FINN_MAX_PAGES
+        if max_pages is not None:
+            bound = min(bound, max_pages)
+        return bound
+    
+    def _report(self, area_name: str, boliger: List[Dict], treff: Optional[int], sider: Optional[int],
+                sider_hentet: int, feil: List[Tuple[int, Exception]], bound: int, stoppet: bool) -> Dict:
+        """Lag (og skriv ut) dekningsrapport for en location"""
+        if stoppet:
+            avkortet = False
+        elif sider is None:
+            # Vi nådde grensen uten å se en tom side
+            avkortet = True
+        else:
+            avkortet = bound < sider or (treff is not None and treff > sider * FINN_PER_PAGE)
         
-        print(f"📍 {area_name}...", end=" ")
+        rapport = {
+            'kommune': area_name,
+            'treff': treff,
+            'sider': sider,
+            'sider_hentet': sider_hentet,
+            'boliger': len(boliger),
+            'feil': len(feil),
+            'avkortet': avkortet,
+        }
+        self.rapporter.append(rapport)
+        METRICS.inc('pages_fetched_total', sider_hentet)
+        METRICS.inc('page_errors_total', len(feil))
+        if avkortet:
+            METRICS.inc('locations_truncated_total')
         
-        for page in range(1, max_pages + 1):
-            url = search_url if page == 1 else f"{search_url}&page={page}"
-            
+        status = ''.join(f"Feil side {page}: {e} " for page, e in feil)
+        info = f"{sider_hentet}/{sider if sider is not None else '?'} sider"
+        if treff is not None:
+            info += f", {treff} treff"
+        print(f"📍 {area_name}... {status}✓ {len(boliger)} boliger ({info}){' ⚠️ avkortet' if avkortet else ''}")
+        return rapport
+    
+    def scrape_location(self, location_id: str, area_name: str, max_pages: Optional[int] = None,
+                        index: Optional['ListingIndex'] = None) -> List[Dict]:
+        """
+        Scraper boliger for en spesifikk Finn.no location (sekvensielt).
+        Antall sider leses fra side 1; max_pages=None betyr alle sider.
+        
+        Med `index` (inkrementell modus) sorteres søket nyeste først, kun nye
+        eller endrede annonser returneres, og vi stopper så snart en side
+        bare inneholder kjente, uendrede annonser
+        """
+        boliger = []
+        feil = []
+        sort = 'PUBLISHED_DESC' if index is not None else None
+        treff = sider = None
+        sider_hentet = 0
+        stoppet = False
+        bound = self._page_bound(None, max_pages)
+        
+        page = 1
+        while page <= bound:
             try:
-                response = requests.get(url, headers=self.headers, timeout=10)
-                response.raise_for_status()
-                
-                soup = BeautifulSoup(response.content, 'html.parser')
-                annonser = soup.find_all('article', class_='sf-search-ad')
-                
-                if not annonser:
-                    break
-                
-                for annonse in annonser:
-                    bolig_data = self._extract_bolig_data(annonse, area_name)
-                    if bolig_data:
-                        boliger.append(bolig_data)
-                
-                time.sleep(1)
-                
+                if page == 1:
+                    side, treff, sider = self._fetch_first_page(location_id, area_name, sort)
+                    bound = self._page_bound(sider, max_pages)
+                else:
+                    side = self._fetch_page(location_id, area_name, page, sort)
             except Exception as e:
-                print(f"Feil: {e}")
+                # Retry er allerede brukt opp - hopp over siden, ikke hele kommunen
+                feil.append((page, e))
+                page += 1
+                continue
+            
+            sider_hentet += 1
+            page += 1
+            
+            if side is None:
+                stoppet = True
                 break
+            
+            if index is not None:
+                endret = [bolig for bolig in side if index.observe(bolig)]
+                boliger.extend(endret)
+                if side and not endret:
+                    stoppet = True
+                    break
+            else:
+                boliger.extend(side)
         
-        print(f"✓ {len(boliger)} boliger")
+        self._report(area_name, boliger, treff, sider, sider_hentet, feil, bound, stoppet)
         return boliger
     
-    def _extract_bolig_data(self, annonse, area_name: str) -> Dict:
-        """Ekstraher data fra annonse"""
+    def _scrape_location_parallel(self, location_id: str, area_name: str, max_pages: Optional[int],
+                                  pool: ThreadPoolExecutor) -> List[Dict]:
+        """
+        Scraper en location med sidene hentet parallelt i `pool`: side 1 først,
+        deretter resten av sidene opp til antall sider lest fra side 1
+        """
         try:
-            # Finn lenke og Finn-kode
-            lenke_tag = annonse.find('a', href=re.compile(r'/realestate/homes/ad.html'))
-            lenke = None
-            finn_kode = None
-            
-            if lenke_tag and lenke_tag.get('href'):
-                lenke = self.base_url + lenke_tag['href']
-                match = re.search(r'finnkode=(\d+)', lenke)
-                if match:
-                    finn_kode = match.group(1)
-            
-            # Finn pris
-            pris = None
-            pris_elements = annonse.find_all(string=re.compile(r'\d+.*kr', re.IGNORECASE))
-            if pris_elements:
-                pris = self._parse_pris(pris_elements[0])
-            
-            # Finn størrelse
-            storrelse = None
-            size_elements = annonse.find_all(string=re.compile(r'\d+\s*m²'))
-            if size_elements:
-                storrelse = self._parse_storrelse(size_elements[0])
-            
-            # Finn tittel
-            tittel = None
-            heading = annonse.find(['h2', 'h3'])
-            if heading:
-                tittel = heading.get_text(strip=True)
+            side, treff, sider = pool.submit(self._fetch_first_page, location_id, area_name).result()
+            resultater = [(1, side, None)]
+        except Exception as e:
+            treff, sider = None, None
+            resultater = [(1, None, e)]
+        
+        bound = self._page_bound(sider, max_pages)
+        
+        if resultater[0][1] is None and resultater[0][2] is None:
+            pass
+        elif sider is None:
+            resultater += pool.submit(self._probe_pages, location_id, area_name, 2, bound).result()
+        else:
+            futures = [
+                (page, pool.submit(self._fetch_page, location_id, area_name, page))
+                for page in range(2, bound + 1)
+            ]
+            for page, future in futures:
+                try:
+                    resultater.append((page, future.result(), None))
+                except Exception as e:
+                    resultater.append((page, None, e))
+        
+        boliger = []
+        feil = []
+        sider_hentet = 0
+        stoppet = False
+        for page, side, e in resultater:
+            if e is not None:
+                # Retry er allerede brukt opp - hopp over siden, ikke hele kommunen
+                feil.append((page, e))
+                continue
             
-            # Finn boligtype
-            text = annonse.get_text().lower()
-            boligtype = 'Annet'
-            if 'leilighet' in text:
-                boligtype = 'Leilighet'
-            elif 'enebolig' in text:
-                boligtype = 'Enebolig'
-            elif 'rekkehus' in text:
-                boligtype = 'Rekkehus'
-            elif 'tomannsbolig' in text:
-                boligtype = 'Tomannsbolig'
+            sider_hentet += 1
+            if side is None:
+                stoppet = True
+                break
             
-            # Kun returner hvis vi har pris OG størrelse
-            if pris and storrelse and pris > 100000 and storrelse > 10:  # Sanity check
-                return {
-                    'finn_kode': finn_kode,
-                    'tittel': tittel,
-                    'pris': pris,
-                    'storrelse_kvm': storrelse,
-                    'pris_per_kvm': round(pris / storrelse, 0),
-                    'boligtype': boligtype,
-                    'kommune': area_name,
-                    'lenke': lenke
+            boliger.extend(side)
+        
+        self._report(area_name, boliger, treff, sider, sider_hentet, feil, bound, stoppet)
+        return boliger
+    
+    def iter_locations(self, locations: List[Tuple[str, str]], max_pages: Optional[int] = None,
+                       index: Optional['ListingIndex'] = None,
+                       concurrent: bool = True) -> Iterator[Tuple[str, str, List[Dict]]]:
+        """
+        Scraper locations og gir (location_id, area_name, boliger) etter hvert
+        som hver location blir ferdig.
+        
+        Parallelt: én tråd per location koordinerer, mens alle HTTP-kall går via
+        en felles pool på max_workers tråder (begrenset av rate limit per host).
+        Side 1 hentes først; når antall sider er kjent hentes resten parallelt.
+        I inkrementell modus (`index`) må sidene per location hentes i rekkefølge
+        for å kunne stoppe tidlig, så da er det bare locations som går parallelt
+        """
+        if not concurrent:
+            for location_id, area_name in locations:
+                yield location_id, area_name, self.scrape_location(location_id, area_name, max_pages, index)
+            return
+        
+        n_locations = max(1, min(len(locations), self.max_workers))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as page_pool, \
+                ThreadPoolExecutor(max_workers=n_locations) as location_pool:
+            if index is not None:
+                futures = {
+                    location_pool.submit(self.scrape_location, location_id, area_name, max_pages, index):
+                        (location_id, area_name)
+                    for location_id, area_name in locations
+                }
+            else:
+                futures = {
+                    location_pool.submit(self._scrape_location_parallel, location_id, area_name,
+                                         max_pages, page_pool): (location_id, area_name)
+                    for location_id, area_name in locations
                 }
             
-            return None
-            
-        except:
-            return None
+            for future in as_completed(futures):
+                location_id, area_name = futures[future]
+                yield location_id, area_name, future.result()
     
-    def _parse_pris(self, pris_text: str) -> float:
+    def scrape_locations(self, locations: List[Tuple[str, str]], max_pages: Optional[int] = None,
+                         index: Optional['ListingIndex'] = None) -> List[Dict]:
+        """
+        Scraper flere locations parallelt (se iter_locations), samlet i samme
+        rekkefølge som sekvensiell modus
+        """
+        per_location = {
+            location_id: boliger
+            for location_id, _, boliger in self.iter_locations(locations, max_pages, index)
+        }
+        
+        alle_boliger = []
+        for location_id, _ in locations:
+            alle_boliger.extend(per_location[location_id])
+        return alle_boliger
+    
+    def _extract_bolig_data(self, annonse, area_name: str) -> Optional[Dict]:
+        """Ekstraher data fra en bs4-annonse"""
+        return self._soup_extractor.extract(annonse, area_name)
+    
+    def _parse_pris(self, pris_text: str) -> Optional[float]:
         """Parse pris"""
-        if not pris_text:
-            return None
-        nummer = re.sub(r'[^\d]', '', pris_text)
-        try:
-            return float(nummer)
-        except:
-            return None
+        return parse_pris(pris_text)
     
-    def _parse_storrelse(self, size_text: str) -> float:
+    def _parse_storrelse(self, size_text: str) -> Optional[float]:
         """Parse størrelse"""
-        if not size_text:
-            return None
-        match = re.search(r'(\d+)', size_text)
-        if match:
-            return float(match.group(1))
-        return None
+        return parse_storrelse(size_text)
 
 
-def scrape_ostfold_boliger():
-    """
-    Scrape boliger i Østfold med korrekte location IDs
-    """
-    scraper = FinnScraper()
-    
-    # Finn.no location IDs for Østfold
-    locations = [
-        ('1.20002.20022', 'Moss'),
-        ('1.20002.20024', 'Fredrikstad'),
-        ('1.20002.20021', 'Halden'),
-        ('1.20002.22103', 'Indre Østfold'),
-        ('1.20002.20023', 'Sarpsborg'),
-        ('1.20002.20035', 'Råde'),
-        ('1.20002.20034', 'Rakkestad'),
-        ('1.20002.20025', 'Hvaler'),
-        ('1.20002.20037', 'Våler'),
-        ('1.20002.20033', 'Skiptvet'),
-        ('2.20002.22103.23011', 'Askim'),
-        ('2.20002.22103.23012', 'Eidsberg'),
-        ('2.20002.22103.23013', 'Hobøl'),
-        ('2.20002.22103.23010', 'Spydeberg'),
-        ('2.20002.22103.23009', 'Trøgstad'),
-    ]
-    
-    alle_boliger = []
+def _export_metrics(metrics_dir: Optional[str], varighet: float, antall: int, navn: str = 'scraper') -> None:
+    """Gauges for kjøringen, skriv Prometheus-textfile og vis hvor tiden gikk"""
+    listings = METRICS.total('listings_total')
+    METRICS.set('scrape_duration_seconds', varighet)
+    METRICS.set('listings_per_second', listings / varighet if varighet > 0 else 0)
+    METRICS.set('dataset_rows', antall)
+    METRICS.set('last_run_timestamp_seconds', time.time())
     
-    print("="*60)
-    print("SCRAPER BOLIGMARKED - ØSTFOLD")
-    print("="*60 + "\n")
-    
-    for location_id, area_name in locations:
-        boliger = scraper.scrape_location(location_id, area_name, max_pages=5)
-        alle_boliger.extend(boliger)
-        time.sleep(2)
-    
-    if not alle_boliger:
-        print("\n❌ Ingen boliger hentet!")
-        return None
-    
-    # Lag DataFrame
-    df = pd.DataFrame(alle_boliger)
-    
-    # Fjern duplikater
-    df = df.drop_duplicates(subset=['finn_kode'], keep='first')
+    print("\n⏱️  Tid brukt (sum over tråder):")
+    for name, row in METRICS.summary().items():
+        print(f"   {name:<45} {row['antall']:>6}×  {row['total_ms']:>10,.0f} ms  (snitt {row['snitt_ms']:.1f} ms)")
+    print(f"   {listings / varighet if varighet > 0 else 0:.1f} annonser/s over {varighet:.1f} s")
     
+    if metrics_dir:
+        METRICS.write_prometheus(os.path.join(metrics_dir, f'{navn}.prom'))
+        METRICS.stop_trace()
+        print(f"📈 Metrics: {os.path.join(metrics_dir, f'{navn}.prom')}, trace: "
+              f"{os.path.join(metrics_dir, f'{navn}_trace.jsonl')}")
+
+
+def _print_statistics(df, output: str, cube) -> None:
+    """Oppsummering av det ferdige datasettet, fra aggregat-kuben"""
     print(f"\n{'='*60}")
-    print(f"✅ Totalt {len(df)} unike boliger hentet")
+    print(f"✅ Totalt {len(df)} unike boliger")
     print(f"{'='*60}\n")
     
-    # Lagre
-    df.to_csv('boliger_ostfold.csv', index=False, encoding='utf-8')
-    print(f"📁 Lagret til: boliger_ostfold.csv\n")
+    print(f"📁 Lagret til: {output}\n")
+    
+    # STATISTIKK - roll-ups fra aggregat-kuben (medianer er estimater, ±1 %)
+    totalt = cube.rollup(None, renset=None).iloc[0]
     
-    # STATISTIKK
     print("="*60)
     print("STATISTIKK - ØSTFOLD BOLIGMARKED")
     print("="*60 + "\n")
     
-    print(f"Gjennomsnittspris:       {df['pris'].mean():>12,.0f} kr")
-    print(f"Median pris:             {df['pris'].median():>12,.0f} kr")
-    print(f"Billigste:               {df['pris'].min():>12,.0f} kr")
-    print(f"Dyreste:                 {df['pris'].max():>12,.0f} kr")
-    print(f"\nGjennomsnittlig størrelse: {df['storrelse_kvm'].mean():>10.1f} kvm")
-    print(f"Pris per kvm (snitt):      {df['pris_per_kvm'].mean():>10,.0f} kr\n")
+    print(f"Gjennomsnittspris:       {totalt['snitt']:>12,.0f} kr")
+    print(f"Median pris:             {totalt['median']:>12,.0f} kr")
+    print(f"Billigste:               {totalt['min']:>12,.0f} kr")
+    print(f"Dyreste:                 {totalt['maks']:>12,.0f} kr")
+    print(f"\nGjennomsnittlig størrelse: {totalt['snitt_kvm']:>10.1f} kvm")
+    print(f"Pris per kvm (snitt):      {totalt['kr_kvm']:>10,.0f} kr\n")
     
     # Per kommune
     print("="*60)
     print("PER KOMMUNE")
     print("="*60 + "\n")
     
-    per_kommune = df.groupby('kommune').agg({
-        'pris': ['count', 'mean', 'median'],
-        'pris_per_kvm': 'mean'
-    }).round(0)
+    per_kommune = cube.rollup('kommune', renset=None)[['antall', 'snitt', 'median', 'kr_kvm']].round(0)
     per_kommune.columns = ['Antall', 'Snitt pris', 'Median', 'Kr/kvm']
     per_kommune = per_kommune.sort_values('Antall', ascending=False)
     print(per_kommune.to_string())
@@ -220,10 +605,7 @@ def scrape_ostfold_boliger():
     print("PER BOLIGTYPE")
     print("="*60 + "\n")
     
-    per_type = df.groupby('boligtype').agg({
-        'pris': ['count', 'mean'],
-        'pris_per_kvm': 'mean'
-    }).round(0)
+    per_type = cube.rollup('boligtype', renset=None)[['antall', 'snitt', 'kr_kvm']].round(0)
     per_type.columns = ['Antall', 'Snitt pris', 'Kr/kvm']
     per_type = per_type.sort_values('Antall', ascending=False)
     print(per_type.to_string())
@@ -231,9 +613,315 @@ def scrape_ostfold_boliger():
     print("\n" + "="*60)
     print("✅ Data klar for analyse og visualisering!")
     print("="*60)
+
+
+def is_full_snapshot(rapporter: List[Dict], incremental: bool = False) -> bool:
+    """
+    Har kjøringen sett alle annonser? Bare da kan annonser som mangler regnes
+    som fjernet i prishistorikken. Inkrementelt hentes bare nye/endrede, og en
+    side som feilet eller en avkortet location mangler annonser som fortsatt finnes
+    """
+    return not incremental and not any(r['avkortet'] or r['feil'] for r in rapporter)
+
+
+def scrape_ostfold_boliger(concurrent: bool = True, max_workers: int = 8, rate_per_host: float = 4.0,
+                           cache_dir: Optional[str] = '.finn_cache', extractor: str = 'lxml',
+                           incremental: bool = False, index_path: str = 'boliger_index.json',
+                           max_pages: Optional[int] = None, output: Optional[str] = None,
+                           resume: bool = False, metrics_dir: Optional[str] = METRICS_DIR,
+                           archive_dir: Optional[str] = None, details: bool = False,
+                           detail_workers: int = 4, history_dir: Optional[str] = 'historikk'):
+    """
+    Scrape boliger i Østfold med korrekte location IDs.
     
+    Dataene strømmes gjennom pipeline.py og skrives til disk per location.
+    resume=True: fortsett en avbrutt kjøring fra siste checkpoint.
+    incremental=True: hent kun nye/endrede annonser (se ListingIndex) og
+    upsert dem inn i eksisterende datasett.
+    output: .csv (standard), .parquet (kompakt kolonneformat) eller .db (SQLite), se storage.py
+    metrics_dir: skriv scraper.prom (Prometheus textfile) og scraper_trace.jsonl hit (None = av)
+    archive_dir: arkiver rå søkesider hit for senere replay (None = av, se archive.py)
+    details: hent byggeår, soverom m.m. fra annonsesidene til detaljcachen (se enrichment.py)
+    history_dir: registrer prisendringer, nye og fjernede annonser i prishistorikken (None = av, se history.py)
+    """
+    # pandas/pyarrow (via pipeline og storage) lastes først her, ikke ved import av scraper
+    from pipeline import BatchSink, dedupe, enrich, fetch, validate
+    from storage import DATA_CSV
+
+    output = output or DATA_CSV
+    
+    if metrics_dir:
+        METRICS.start_trace(os.path.join(metrics_dir, 'scraper_trace.jsonl'))
+    run_start = time.perf_counter()
+    scraper = FinnScraper(rate_per_host=rate_per_host, max_workers=max_workers, cache_dir=cache_dir,
+                          extractor=extractor, archive_dir=archive_dir)
+    
+    index = ListingIndex(index_path) if incremental else None
+    sink = BatchSink(resume=resume, index=index)
+    
+    print("="*60)
+    print("SCRAPER BOLIGMARKED - ØSTFOLD")
+    print("="*60 + "\n")
+    
+    if sink.done:
+        print(f"↩️  Fortsetter - {len(sink.done)} locations allerede ferdige\n")
+    
+    # fetch → parse → validate → dedupe → sink
+    gjenstaende = [(location_id, area_name) for location_id, area_name in OSTFOLD_LOCATIONS
+                   if location_id not in sink.done]
+    pipeline_stats = {}
+    batches = dedupe(validate(fetch(scraper, gjenstaende, max_pages, index, concurrent), pipeline_stats), sink.seen)
+    enricher = None
+    if details:
+        from enrichment import DetailEnricher
+        enricher = DetailEnricher(scraper, max_workers=detail_workers)
+        batches = enrich(batches, enricher)
+    for location_id, _, boliger in batches:
+        METRICS.inc('listings_total', len(boliger))
+        with METRICS.span('sink_write'):
+            sink.write(location_id, boliger)
+    if scraper.archive is not None:
+        scraper.archive.close()
+    
+    avkortet = [r['kommune'] for r in scraper.rapporter if r['avkortet']]
+    if avkortet:
+        print(f"\n⚠️  Ufullstendig dekning for: {', '.join(avkortet)}")
+    feilet = [r['kommune'] for r in scraper.rapporter if r['feil']]
+    if feilet:
+        print(f"\n⚠️  Sider feilet for: {', '.join(feilet)} - fjernede annonser registreres ikke denne gangen")
+    if pipeline_stats.get('forkastet'):
+        print(f"\n🗑️  {pipeline_stats['forkastet']} ugyldige annonser forkastet")
+    if enricher is not None:
+        enricher.cache.close()
+        stats = enricher.stats
+        print(f"\n🔎 Detaljer: {stats['hentet']} hentet, {stats['cache']} fra cache, "
+              f"{stats['borte']} borte, {stats['feil']} feil ({len(enricher.cache)} i {enricher.cache.path})")
+    
+    # Sett sammen batchene til det ferdige datasettet
+    with METRICS.span('finalize'):
+        df = sink.finalize(output, incremental)
+    if history_dir and df is not None:
+        from history import PriceHistory
+        
+        with METRICS.span('history_record'):
+            hendelser = PriceHistory(history_dir).record(df, full=is_full_snapshot(scraper.rapporter, incremental))
+        print("\n🕒 Historikk: " + ", ".join(f"{antall} {hendelse}" for hendelse, antall in hendelser.items()))
+    _export_metrics(metrics_dir, time.perf_counter() - run_start, 0 if df is None else len(df))
+    
+    if df is None:
+        print("\n❌ Ingen boliger hentet!")
+        return None
+    
+    _print_statistics(df, output, sink.cube)
+    return df
+
+
+def scrape_regions(fylker: Optional[List[str]] = None, shard: int = 0, shards: int = 1,
+                   concurrent: bool = True, max_workers: int = 8, rate_per_host: float = 4.0,
+                   cache_dir: Optional[str] = '.finn_cache', extractor: str = 'lxml',
+                   max_pages: Optional[int] = None, root: str = PARTITION_ROOT,
+                   metrics_dir: Optional[str] = METRICS_DIR, archive_dir: Optional[str] = None,
+                   history_dir: Optional[str] = 'historikk') -> Dict[str, int]:
+    """
+    Scrape fylkene (None = alle i locations.json) til det partisjonerte
+    datasettet: én fil per fylke for denne shard-en under fylke=<fylke>/dato=<i dag>.
+    Med shards > 1 tar denne kjøringen bare sine locations (se regions.shard_of),
+    så shards kan kjøres i egne prosesser eller på egne maskiner.
+    Returnerer antall boliger per fylke
+    """
+    import pandas as pd
+    from pipeline import BatchSink, dedupe, fetch, validate
+    from storage import to_compact
+
+    valgt = select_locations(load_locations(), fylker, shard, shards)
+    dato = time.strftime('%Y-%m-%d')
+    navn = f"scraper-{shard:03d}" if shards > 1 else 'scraper'
+    
+    if metrics_dir:
+        METRICS.start_trace(os.path.join(metrics_dir, f'{navn}_trace.jsonl'))
+    run_start = time.perf_counter()
+    scraper = FinnScraper(rate_per_host=rate_per_host, max_workers=max_workers, cache_dir=cache_dir,
+                          extractor=extractor, archive_dir=archive_dir)
+    
+    print("="*60)
+    print(f"SCRAPER BOLIGMARKED - {', '.join(valgt) or 'ingen locations'} (shard {shard + 1}/{shards})")
+    print("="*60 + "\n")
+    
+    antall = {}
+    for fylke, locations in valgt.items():
+        print(f"🗺️  {fylke}: {len(locations)} locations")
+        sink = BatchSink(run_dir=os.path.join('.scrape_run', f"{fylke}-{shard:03d}"))
+        batches = dedupe(validate(fetch(scraper, locations, max_pages, None, concurrent)), sink.seen)
+        for location_id, _, boliger in batches:
+            METRICS.inc('listings_total', len(boliger), fylke=fylke)
+            with METRICS.span('sink_write'):
+                sink.write(location_id, boliger)
+        
+        output = partition_path(fylke, dato, shard, shards, root)
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with METRICS.span('finalize', fylke=fylke):
+            df = sink.finalize(output)
+            if df is None:
+                # Tom fil likevel - den markerer kjøringen, så gårsdagens annonser ikke leses
+                empty = to_compact(pd.DataFrame(columns=COLUMNS))
+                empty.astype({'kommune': str, 'boligtype': str}).to_parquet(output, index=False)
+        antall[fylke] = 0 if df is None else len(df)
+        if df is not None and history_dir:
+            from history import PriceHistory
+            
+            # Én region er ikke hele snapshoten - fjernede annonser kan ikke utledes
+            PriceHistory(history_dir).record(df, full=False)
+        print(f"   📁 {antall[fylke]} boliger -> {output}\n")
+    if scraper.archive is not None:
+        scraper.archive.close()
+    
+    _export_metrics(metrics_dir, time.perf_counter() - run_start, sum(antall.values()), navn)
+    return antall
+
+
+def _scrape_shard(kwargs: Dict) -> Dict[str, int]:
+    return scrape_regions(**kwargs)
+
+
+def scrape_sharded(shards: int, rate_per_host: float = 4.0, **kwargs) -> Dict[str, int]:
+    """
+    Kjør alle shards lokalt i hver sin prosess. Rate limit er per prosess,
+    så den deles på antall shards for å holde samme totale belastning på Finn
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    
+    jobs = [{**kwargs, 'shard': shard, 'shards': shards, 'rate_per_host': rate_per_host / shards}
+            for shard in range(shards)]
+    antall: Dict[str, int] = {}
+    with ProcessPoolExecutor(shards) as pool:
+        for resultat in pool.map(_scrape_shard, jobs):
+            for fylke, n in resultat.items():
+                antall[fylke] = antall.get(fylke, 0) + n
+    return antall
+
+
+def replay_archive(archive_dir: str = ARCHIVE_DIR, extractor: str = 'lxml', workers: Optional[int] = None,
+                   as_of: Optional[str] = None, output: Optional[str] = None,
+                   metrics_dir: Optional[str] = METRICS_DIR):
+    """
+    Bygg datasettet på nytt fra arkiverte søkesider, uten nettverk: siste
+    henting av hver location (til og med as_of) parses i `workers` prosesser
+    og går gjennom samme validate → dedupe → sink som en vanlig scrape
+    """
+    from pipeline import BatchSink, dedupe, validate
+    from storage import DATA_CSV
+
+    output = output or DATA_CSV
+    workers = workers or os.cpu_count() or 1
+    
+    if metrics_dir:
+        METRICS.start_trace(os.path.join(metrics_dir, 'replay_trace.jsonl'))
+    run_start = time.perf_counter()
+    
+    print("="*60)
+    print(f"REPLAY AV ARKIV - {archive_dir}{f' (per {as_of})' if as_of else ''}")
+    print("="*60 + "\n")
+    
+    sink = BatchSink(run_dir='.replay_run')
+    replay_stats = {}
+    pipeline_stats = {}
+    batches = iter_replay(archive_dir, extractor, workers, as_of, stats=replay_stats)
+    for location_id, area_name, boliger in dedupe(validate(batches, pipeline_stats), sink.seen):
+        print(f"📍 {area_name}... ✓ {len(boliger)} boliger")
+        METRICS.inc('listings_total', len(boliger))
+        with METRICS.span('sink_write'):
+            sink.write(location_id, boliger)
+    
+    sider = replay_stats.get('sider', 0)
+    varighet = time.perf_counter() - run_start
+    METRICS.inc('pages_replayed_total', sider)
+    print(f"\n🗄️  {sider} sider parset på {varighet:.1f} s med {workers} prosesser "
+          f"({sider / varighet if varighet > 0 else 0:.0f} sider/s)")
+    if pipeline_stats.get('forkastet'):
+        print(f"🗑️  {pipeline_stats['forkastet']} ugyldige annonser forkastet")
+    
+    with METRICS.span('finalize'):
+        df = sink.finalize(output)
+    _export_metrics(metrics_dir, time.perf_counter() - run_start, 0 if df is None else len(df), 'replay')
+    
+    if df is None:
+        print("\n❌ Ingen boliger i arkivet!")
+        return None
+    
+    _print_statistics(df, output, sink.cube)
     return df
 
 
 if __name__ == "__main__":
-    df = scrape_ostfold_boliger()
+    parser = argparse.ArgumentParser(description="Scraper boliger i Østfold fra Finn.no")
+    parser.add_argument('--sekvensiell', action='store_true', help="Hent en side om gangen")
+    parser.add_argument('--workers', type=int, default=8, help="Maks samtidige forespørsler")
+    parser.add_argument('--rate', type=float, default=4.0, help="Maks forespørsler per sekund per host")
+    parser.add_argument('--cache-dir', default='.finn_cache', help="Mappe for respons-cache")
+    parser.add_argument('--ingen-cache', action='store_true', help="Skru av respons-cache")
+    parser.add_argument('--parser', default='lxml', choices=['lxml', 'soup'], help="HTML-parser backend")
+    parser.add_argument('--max-sider', type=int, default=None, help="Maks sider per location (standard: alle)")
+    parser.add_argument('--format', choices=['csv', 'parquet', 'sqlite'], default='csv',
+                        help="Lagringsformat (parquet = kompakt kolonneformat, sqlite = database for dashboardet)")
+    parser.add_argument('--inkrementell', action='store_true',
+                        help="Hent kun nye/endrede annonser og oppdater eksisterende datasett")
+    parser.add_argument('--fortsett', action='store_true', help="Fortsett en avbrutt kjøring fra checkpoint")
+    parser.add_argument('--metrics-dir', default=METRICS_DIR,
+                        help="Mappe for Prometheus-textfile og JSON-lines trace ('' = av)")
+    parser.add_argument('--arkiv', default=None,
+                        help=f"Arkiver rå søkesider i denne mappen (med --replay: arkivet som leses, standard {ARCHIVE_DIR})")
+    parser.add_argument('--detaljer', action='store_true',
+                        help="Hent byggeår, soverom, tomt, fellesgjeld og energimerke fra annonsesidene")
+    parser.add_argument('--detalj-workers', type=int, default=4, help="Maks samtidige annonsesider")
+    parser.add_argument('--historikk-dir', default='historikk',
+                        help="Mappe for prishistorikken ('' = av, se history.py)")
+    parser.add_argument('--fylke', nargs='+', default=None,
+                        help="Scrape fylkene fra locations.json til data/boliger/ ('alle' = hele konfigurasjonen)")
+    parser.add_argument('--shards', type=int, default=1,
+                        help="Del locations på n shards (uten --shard kjøres alle lokalt i n prosesser)")
+    parser.add_argument('--shard', type=int, default=None, help="Kjør bare denne shard-en (0 til shards-1)")
+    parser.add_argument('--replay', action='store_true', help="Parse arkivet på nytt uten nettverk")
+    parser.add_argument('--per', default=None, help="Replay: arkivet slik det var på dette tidspunktet (ISO-tid eller dato)")
+    parser.add_argument('--prosesser', type=int, default=None, help="Replay: antall prosesser (standard: alle kjerner)")
+    args = parser.parse_args()
+    
+    from storage import DATA_CSV, DATA_PARQUET, DATA_SQLITE
+    output = {'csv': DATA_CSV, 'parquet': DATA_PARQUET, 'sqlite': DATA_SQLITE}[args.format]
+    
+    if args.replay:
+        replay_archive(args.arkiv or ARCHIVE_DIR, args.parser, args.prosesser, args.per, output,
+                       args.metrics_dir or None)
+    elif args.fylke:
+        regional = dict(
+            fylker=None if args.fylke == ['alle'] else args.fylke,
+            concurrent=not args.sekvensiell,
+            max_workers=args.workers,
+            cache_dir=None if args.ingen_cache else args.cache_dir,
+            extractor=args.parser,
+            max_pages=args.max_sider,
+            metrics_dir=args.metrics_dir or None,
+            archive_dir=args.arkiv,
+            history_dir=args.historikk_dir or None
+        )
+        if args.shards > 1 and args.shard is None:
+            antall = scrape_sharded(args.shards, args.rate, **regional)
+        else:
+            antall = scrape_regions(shard=args.shard or 0, shards=args.shards, rate_per_host=args.rate, **regional)
+        print("✅ " + ", ".join(f"{fylke}: {n} boliger" for fylke, n in antall.items()))
+    else:
+        scrape_ostfold_boliger(
+            concurrent=not args.sekvensiell,
+            max_workers=args.workers,
+            rate_per_host=args.rate,
+            cache_dir=None if args.ingen_cache else args.cache_dir,
+            extractor=args.parser,
+            incremental=args.inkrementell,
+            max_pages=args.max_sider,
+            output=output,
+            resume=args.fortsett,
+            metrics_dir=args.metrics_dir or None,
+            archive_dir=args.arkiv,
+            details=args.detaljer,
+            detail_workers=args.detalj_workers,
+            history_dir=args.historikk_dir or None
+        )
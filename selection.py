@@ -0,0 +1,163 @@
+"""
+Boligmarked Analyse - Modellutvalg
+Kryssvaliderer flere modellfamilier (lineær, ridge, gradient boosting, og
+varianter med log-pris som target) over et lite hyperparameter-rutenett.
+Hver (kandidat, fold) er en egen oppgave i en prosesspool. Vinneren er
+kandidaten med best R² blant de som holder latensbudsjettet for prediksjon
+
+    python model.py --utvalg --latens-budsjett 500
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.compose import TransformedTargetRegressor
+from sklearn.ensemble import HistGradientBoostingRegressor
+from sklearn.linear_model import LinearRegression, Ridge
+from sklearn.metrics import mean_absolute_error, r2_score
+from sklearn.model_selection import KFold
+from threadpoolctl import threadpool_limits
+
+from model import MODEL_COLUMNS, canonical_order, encode_features, make_pricer
+
+SEARCH_SPACE: Dict[str, List[Dict]] = {
+    'lineær': [{}],
+    'ridge': [{'alpha': alpha} for alpha in (0.1, 1.0, 10.0, 100.0)],
+    'ridge_log': [{'alpha': alpha} for alpha in (1.0, 10.0)],
+    'gbm': [{'learning_rate': lr, 'max_leaf_nodes': leaves, 'max_iter': 300}
+            for lr in (0.05, 0.1) for leaves in (15, 31)],
+    'gbm_log': [{'learning_rate': 0.1, 'max_leaf_nodes': 31, 'max_iter': 300}],
+}
+
+# Antall enkeltprediksjoner latensen måles over (median)
+LATENCY_REPEAT = 50
+
+_X: Optional[np.ndarray] = None
+_y: Optional[np.ndarray] = None
+_feature_names: List[str] = []
+_boliger: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+
+
+def build_estimator(familie: str, params: Dict):
+    """Lag en (utrent) modell for en familie og et sett hyperparametere"""
+    if familie.endswith('_log'):
+        return TransformedTargetRegressor(regressor=build_estimator(familie[:-4], params),
+                                          func=np.log, inverse_func=np.exp)
+    if familie == 'lineær':
+        return LinearRegression(**params)
+    if familie == 'ridge':
+        return Ridge(**params)
+    if familie == 'gbm':
+        return HistGradientBoostingRegressor(random_state=42, **params)
+    raise ValueError(f"Ukjent modellfamilie: {familie}")
+
+
+def _init_worker(X: np.ndarray, y: np.ndarray, feature_names: List[str],
+                 boliger: Tuple[np.ndarray, np.ndarray, np.ndarray]) -> None:
+    # Data sendes én gang per prosess, ikke per oppgave
+    global _X, _y, _feature_names, _boliger
+    _X, _y, _feature_names, _boliger = X, y, feature_names, boliger
+    # Én tråd per prosess - ellers konkurrerer OpenMP-trådene i gradient boosting
+    # med de andre prosessene, og både treningstid og latens blir misvisende
+    threadpool_limits(1)
+
+
+def _evaluate(familie: str, params: Dict, train_idx: np.ndarray, test_idx: np.ndarray) -> Dict:
+    """Tren på én fold og mål R², MAE, treningstid og latens for én prediksjon"""
+    model = build_estimator(familie, params)
+    start = time.perf_counter()
+    model.fit(_X[train_idx], _y[train_idx])
+    fit_sek = time.perf_counter() - start
+
+    y_pred = model.predict(_X[test_idx])
+
+    # Latensen måles gjennom make_pricer, slik modellen serveres i appen og API-et
+    # (lineære modeller som koeffisienttabell, andre via ModelPricer)
+    pricer = make_pricer(model, _feature_names)
+    bolig = [values[test_idx[:1]] for values in _boliger]
+    tider = []
+    for _ in range(LATENCY_REPEAT):
+        start = time.perf_counter()
+        pricer.predict(*bolig)
+        tider.append(time.perf_counter() - start)
+
+    return {
+        'familie': familie,
+        'params': json.dumps(params, sort_keys=True),
+        'r2': r2_score(_y[test_idx], y_pred),
+        'mae': mean_absolute_error(_y[test_idx], y_pred),
+        'trenings_sek': fit_sek,
+        'latens_us': float(np.median(tider)) * 1e6,
+    }
+
+
+def run_selection(X: np.ndarray, y: np.ndarray, feature_names: List[str],
+                  boliger: Tuple[np.ndarray, np.ndarray, np.ndarray], folds: int = 5,
+                  workers: Optional[int] = None, latency_budget_us: Optional[float] = None) -> pd.DataFrame:
+    """
+    Kryssvalider alle kandidater i SEARCH_SPACE parallelt. boliger er
+    (størrelse, kommune, boligtype) for radene i X, til latensmålingen.
+    Returnerer én rad per kandidat (snitt over foldene) sortert etter R²,
+    med kolonnen 'valgt' for vinneren
+    """
+    splits = list(KFold(n_splits=folds, shuffle=True, random_state=42).split(X))
+    oppgaver = [(familie, params, train_idx, test_idx)
+                for familie, grid in SEARCH_SPACE.items()
+                for params in grid
+                for train_idx, test_idx in splits]
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(workers or os.cpu_count(), initializer=_init_worker, initargs=(X, y, feature_names, boliger)) as pool:
+        resultater = list(pool.map(_evaluate, *zip(*oppgaver)))
+    wall = time.perf_counter() - start
+
+    rapport = pd.DataFrame(resultater).groupby(['familie', 'params'], sort=False).agg(
+        r2=('r2', 'mean'),
+        r2_std=('r2', 'std'),
+        mae=('mae', 'mean'),
+        trenings_sek=('trenings_sek', 'mean'),
+        latens_us=('latens_us', 'median'),
+    ).reset_index().sort_values('r2', ascending=False, ignore_index=True)
+
+    if latency_budget_us is not None:
+        innenfor = rapport['latens_us'] <= latency_budget_us
+    else:
+        innenfor = rapport['r2'].notna()
+    if not innenfor.any():
+        raise ValueError(f"Ingen kandidater holder latensbudsjettet på {latency_budget_us} µs "
+                         f"(raskeste: {rapport['latens_us'].min():.0f} µs)")
+    rapport['valgt'] = False
+    rapport.loc[rapport[innenfor].index[0], 'valgt'] = True
+    rapport.attrs['wall_sek'] = wall
+    return rapport
+
+
+def select_model(df: pd.DataFrame, folds: int = 5, workers: Optional[int] = None,
+                 latency_budget_us: Optional[float] = None) -> Tuple[Tuple, pd.DataFrame]:
+    """
+    Velg modell med kryssvalidering og tren vinneren på alle data.
+    Returnerer (model, r2, mae, feature_names, all_columns) som train_price_model
+    (r2/mae er snitt over foldene) og rapporten fra run_selection
+    """
+    # Fast radrekkefølge, så foldene blir de samme uansett hvordan datasettet ble lastet
+    df = canonical_order(df)
+    X, y, all_columns = encode_features(df)
+    feature_names = X.columns.tolist()
+    rader = df[MODEL_COLUMNS].dropna()   # samme rader som X
+    boliger = (rader['storrelse_kvm'].to_numpy(dtype=np.float64), rader['kommune'].astype(str).to_numpy(),
+               rader['boligtype'].astype(str).to_numpy())
+    X = X.to_numpy(dtype=np.float64)
+    y = y.to_numpy(dtype=np.float64)
+
+    rapport = run_selection(X, y, feature_names, boliger, folds, workers, latency_budget_us)
+    vinner = rapport[rapport['valgt']].iloc[0]
+    print(f"⏱️  {len(rapport)} kandidater × {folds} folder på {rapport.attrs['wall_sek']:.1f} s")
+
+    model = build_estimator(vinner['familie'], json.loads(vinner['params']))
+    model.fit(X, y)
+    return (model, vinner['r2'], vinner['mae'], feature_names, all_columns), rapport
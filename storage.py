@@ -0,0 +1,292 @@
+"""
+Boligmarked Analyse - Lagring av datasettet
+Kolonnebasert format (Parquet) med kompakte datatyper, CSV som eksport,
+og en innebygd SQLite-database med indekser for dashboard-filtrene
+"""
+
+import os
+import sqlite3
+import sys
+from contextlib import closing
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+DATA_CSV = 'boliger_ostfold.csv'
+DATA_PARQUET = 'boliger_ostfold.parquet'
+DATA_SQLITE = 'boliger_ostfold.db'
+
+# DATA CLEANING - realistiske grenser for boliger i Østfold (min, maks)
+OUTLIER_BOUNDS = {
+    'storrelse_kvm': (20, 500),          # 20 kvm (hybler) - 500 kvm (store eneboliger)
+    'pris': (500000, 25000000),          # 500k (realistisk i Østfold) - 25M (luksus)
+    'pris_per_kvm': (5000, 150000),      # 5k/kvm - 150k/kvm (leiligheter sentrum)
+}
+
+AD_URL = "https://www.finn.no/realestate/homes/ad.html?finnkode="
+
+# Kompakte datatyper. pris lagres som int32 fordi float32 ikke kan
+# representere alle priser over ~16,7 mill eksakt. tittel holdes som
+# Arrow-strenger (sammenhengende buffer i stedet for ett Python-objekt per rad)
+DTYPES = {
+    'finn_kode': 'Int64',
+    'tittel': 'string[pyarrow]',
+    'pris': 'int32',
+    'storrelse_kvm': 'float32',
+    'pris_per_kvm': 'float32',
+    'boligtype': 'category',
+    'kommune': 'category',
+}
+
+
+def to_compact(df: pd.DataFrame) -> pd.DataFrame:
+    """Konverter til kompakte datatyper og dropp lenke (den kan utledes fra finn_kode)"""
+    df = df.drop(columns=['lenke'], errors='ignore')
+    if 'finn_kode' in df.columns:
+        df['finn_kode'] = pd.to_numeric(df['finn_kode'], errors='coerce')
+    if 'pris' in df.columns:
+        df['pris'] = df['pris'].round()
+    df = df.astype({col: dtype for col, dtype in DTYPES.items() if col in df.columns})
+
+    # Fjern kategorier som ikke lenger er i bruk (f.eks. etter filtrering)
+    for col in ('boligtype', 'kommune'):
+        if col in df.columns:
+            df[col] = df[col].cat.remove_unused_categories()
+    return df
+
+
+def add_links(df: pd.DataFrame) -> pd.DataFrame:
+    """Utled lenke fra finn_kode"""
+    df = df.copy()
+    df['lenke'] = AD_URL + df['finn_kode'].astype('string')
+    return df
+
+
+def remove_outliers(df: pd.DataFrame) -> pd.DataFrame:
+    """Fjern outliers utenfor OUTLIER_BOUNDS"""
+    mask = pd.Series(True, index=df.index)
+    for col, (lo, hi) in OUTLIER_BOUNDS.items():
+        mask &= (df[col] >= lo) & (df[col] <= hi)
+    return df[mask]
+
+
+class SqlStore:
+    """
+    Innebygd SQLite-database for datasettet. Filtrene og group-by-aggregatene
+    i dashboardet kjøres i databasen (med indekser), så bare resultatet
+    havner i minnet. Outliers (OUTLIER_BOUNDS) filtreres alltid bort i spørringene
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS boliger (
+            finn_kode INTEGER PRIMARY KEY,
+            tittel TEXT,
+            pris INTEGER NOT NULL,
+            storrelse_kvm REAL NOT NULL,
+            pris_per_kvm REAL NOT NULL,
+            boligtype TEXT NOT NULL,
+            kommune TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_kommune_type_pris ON boliger (kommune, boligtype, pris);
+        CREATE INDEX IF NOT EXISTS idx_type_pris ON boliger (boligtype, pris);
+        CREATE INDEX IF NOT EXISTS idx_pris ON boliger (pris);
+    """
+    COLUMNS = ['finn_kode', 'tittel', 'pris', 'storrelse_kvm', 'pris_per_kvm', 'boligtype', 'kommune']
+
+    def __init__(self, path: str = DATA_SQLITE):
+        self.path = path
+
+    def _connect(self) -> sqlite3.Connection:
+        # Ny tilkobling per kall - SQLite-tilkoblinger skal ikke deles mellom tråder
+        return sqlite3.connect(self.path)
+
+    def save(self, df: pd.DataFrame, replace: bool = True) -> None:
+        """Skriv datasettet (replace=False: upsert på finn_kode)"""
+        df = to_compact(df)
+        rows = df[self.COLUMNS].astype(object).where(df[self.COLUMNS].notna(), None)
+
+        with closing(self._connect()) as con, con:
+            con.executescript(self.SCHEMA)
+            if replace:
+                con.execute("DELETE FROM boliger")
+            con.executemany(
+                f"INSERT OR REPLACE INTO boliger VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                rows.itertuples(index=False, name=None)
+            )
+            con.execute("ANALYZE")
+
+    def _where(self, kommune: Optional[str] = None, boligtype: Optional[str] = None,
+               pris_range: Optional[Tuple[int, int]] = None) -> Tuple[str, List]:
+        """Bygg WHERE-ledd for sidebar-filtrene + outlier-grensene"""
+        clauses = []
+        params = []
+        if kommune is not None:
+            clauses.append("kommune = ?")
+            params.append(kommune)
+        if boligtype is not None:
+            clauses.append("boligtype = ?")
+            params.append(boligtype)
+        if pris_range is not None:
+            clauses.append("pris BETWEEN ? AND ?")
+            params.extend(pris_range)
+        for col, (lo, hi) in OUTLIER_BOUNDS.items():
+            clauses.append(f"{col} BETWEEN ? AND ?")
+            params.extend((lo, hi))
+        return "WHERE " + " AND ".join(clauses), params
+
+    def query(self, sql: str, params: List = ()) -> pd.DataFrame:
+        """Kjør en spørring og returner resultatet som DataFrame"""
+        with closing(self._connect()) as con:
+            return pd.read_sql_query(sql, con, params=list(params))
+
+    def filtered(self, kommune: Optional[str] = None, boligtype: Optional[str] = None,
+                 pris_range: Optional[Tuple[int, int]] = None,
+                 columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Rader som matcher filtrene (tilsvarer df_filtered i app.py)"""
+        where, params = self._where(kommune, boligtype, pris_range)
+        cols = ', '.join(columns or self.COLUMNS)
+        return to_compact(self.query(f"SELECT {cols} FROM boliger {where}", params))
+
+    def options(self) -> Dict:
+        """Verdier til sidebar-filtrene: kommuner, boligtyper og prisintervall"""
+        where, params = self._where()
+        kommuner = self.query(f"SELECT DISTINCT kommune FROM boliger {where} ORDER BY kommune", params)
+        typer = self.query(f"SELECT DISTINCT boligtype FROM boliger {where} ORDER BY boligtype", params)
+        pris = self.query(f"SELECT MIN(pris) AS min, MAX(pris) AS max, COUNT(*) AS antall FROM boliger {where}",
+                          params)
+        return {
+            'kommuner': kommuner['kommune'].tolist(),
+            'boligtyper': typer['boligtype'].tolist(),
+            'min_pris': int(pris['min'].iloc[0]),
+            'max_pris': int(pris['max'].iloc[0]),
+            'antall': int(pris['antall'].iloc[0]),
+        }
+
+    def summary(self, kommune: Optional[str] = None, boligtype: Optional[str] = None,
+                pris_range: Optional[Tuple[int, int]] = None) -> Dict:
+        """Antall og snitt av pris, størrelse og kr/kvm for filtrene (samme format som FilterIndex.summary)"""
+        where, params = self._where(kommune, boligtype, pris_range)
+        rad = self.query(f"""SELECT COUNT(*) AS antall, AVG(pris) AS pris, AVG(storrelse_kvm) AS storrelse_kvm,
+                                    AVG(pris_per_kvm) AS pris_per_kvm FROM boliger {where}""", params).iloc[0]
+        return {'antall': int(rad['antall']), **{col: float(rad[col]) if pd.notna(rad[col]) else float('nan')
+                                                 for col in ('pris', 'storrelse_kvm', 'pris_per_kvm')}}
+
+    def aggregate(self, group_by: str, kommune: Optional[str] = None, boligtype: Optional[str] = None,
+                  pris_range: Optional[Tuple[int, int]] = None) -> pd.DataFrame:
+        """
+        Statistikk per gruppe (kommune eller boligtype), regnet ut i databasen:
+        antall, snitt/median/min/maks pris, snitt størrelse og snitt kr/kvm
+        """
+        if group_by not in ('kommune', 'boligtype'):
+            raise ValueError(f"Kan ikke gruppere på {group_by}")
+
+        where, params = self._where(kommune, boligtype, pris_range)
+        sql = f"""
+            WITH filtrert AS (
+                SELECT {group_by} AS gruppe, pris, storrelse_kvm, pris_per_kvm,
+                       ROW_NUMBER() OVER (PARTITION BY {group_by} ORDER BY pris) AS rn,
+                       COUNT(*) OVER (PARTITION BY {group_by}) AS n
+                FROM boliger {where}
+            )
+            SELECT gruppe AS {group_by},
+                   COUNT(*) AS antall,
+                   AVG(pris) AS snitt,
+                   AVG(CASE WHEN rn IN ((n + 1) / 2, (n + 2) / 2) THEN pris END) AS median,
+                   MIN(pris) AS min,
+                   MAX(pris) AS maks,
+                   AVG(storrelse_kvm) AS snitt_kvm,
+                   AVG(pris_per_kvm) AS kr_kvm
+            FROM filtrert
+            GROUP BY gruppe
+        """
+        return self.query(sql, params).set_index(group_by)
+
+
+def default_path() -> str:
+    """Parquet hvis den finnes, ellers CSV"""
+    return DATA_PARQUET if os.path.exists(DATA_PARQUET) else DATA_CSV
+
+
+def dataset_version(path: Optional[str] = None) -> str:
+    """Versjon av datasettet (filsti + endringstidspunkt) - brukes som cache-nøkkel"""
+    path = path or default_path()
+    if not os.path.exists(path):
+        return path
+    return f"{path}@{os.path.getmtime(path)}"
+
+
+def load_dataset(path: Optional[str] = None, with_links: bool = False) -> pd.DataFrame:
+    """Last datasettet (Parquet, SQLite eller CSV) med kompakte datatyper"""
+    path = path or default_path()
+
+    if path.endswith('.parquet'):
+        df = to_compact(pd.read_parquet(path))
+    elif path.endswith('.db'):
+        with closing(sqlite3.connect(path)) as con:
+            df = to_compact(pd.read_sql_query("SELECT * FROM boliger", con))
+    else:
+        df = to_compact(pd.read_csv(path, dtype={'kommune': 'category', 'boligtype': 'category'}))
+
+    return add_links(df) if with_links else df
+
+
+def iter_dataset(path: Optional[str] = None, chunk_rows: int = 250_000,
+                 columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+    """Les datasettet i biter på chunk_rows rader, så det ikke må ligge i minnet samtidig"""
+    path = path or default_path()
+
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns):
+            yield to_compact(batch.to_pandas())
+    elif path.endswith('.db'):
+        cols = ', '.join(columns) if columns else '*'
+        with closing(sqlite3.connect(path)) as con:
+            for df in pd.read_sql_query(f"SELECT {cols} FROM boliger", con, chunksize=chunk_rows):
+                yield to_compact(df)
+    else:
+        for df in pd.read_csv(path, usecols=columns, chunksize=chunk_rows):
+            yield to_compact(df)
+
+
+def save_dataset(df: pd.DataFrame, path: str, append: bool = False) -> None:
+    """
+    Lagre datasettet - Parquet (kompakt, uten lenke), SQLite eller CSV-eksport (med lenke).
+    append=True legger til rader i en eksisterende CSV
+    """
+    df = to_compact(df)
+
+    if path.endswith('.parquet'):
+        df.to_parquet(path, index=False, compression='zstd')
+    elif path.endswith('.db'):
+        SqlStore(path).save(df)
+    else:
+        add_links(df).to_csv(path, index=False, encoding='utf-8',
+                             mode='a' if append else 'w', header=not append)
+
+
+def upsert_boliger(nye: pd.DataFrame, path: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Slå sammen nye/endrede boliger med eksisterende datasett på finn_kode
+    (nye rader erstatter gamle). Returnerer (datasett, erstattede rader)
+    """
+    nye = to_compact(nye)
+    if not os.path.exists(path):
+        return nye, nye.iloc[0:0]
+
+    eksisterende = load_dataset(path)
+    erstattes = eksisterende['finn_kode'].isin(nye['finn_kode'].dropna())
+    df = to_compact(pd.concat([nye, eksisterende[~erstattes]], ignore_index=True))
+    return df, eksisterende[erstattes]
+
+
+if __name__ == "__main__":
+    # Konverter mellom formatene, f.eks. CSV-eksport av Parquet-datasettet:
+    #   python storage.py boliger_ostfold.parquet boliger_ostfold.csv
+    if len(sys.argv) != 3:
+        print("Bruk: python storage.py <inn.parquet|inn.db|inn.csv> <ut.parquet|ut.db|ut.csv>")
+        sys.exit(1)
+
+    df = load_dataset(sys.argv[1])
+    save_dataset(df, sys.argv[2])
+    print(f"📁 {len(df)} boliger lagret til: {sys.argv[2]}")
@@ -0,0 +1,121 @@
+"""
+Boligmarked Analyse - Syntetiske datasett
+Genererer boligannonser med samme skjema som scraperen og realistiske
+fordelinger: andelen per (kommune, boligtype), og størrelse og kr/kvm som
+korrelert log-normal per segment, tilpasset boliger_ostfold.csv. En liten
+andel avvikere legges inn slik at outlier-fjerningen har noe å gjøre
+
+    python synthetic.py --rader 1000000 --output boliger_syntetisk.parquet
+"""
+
+import argparse
+import time
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from storage import DATA_CSV, OUTLIER_BOUNDS, remove_outliers, save_dataset, to_compact
+
+# Segmenter med færre annonser enn dette bruker boligtypens fordeling
+MIN_SEGMENT = 8
+FINN_KODE_START = 400_000_000
+
+
+def _lognormal_params(df: pd.DataFrame) -> Dict[str, float]:
+    log_kvm = np.log(df['storrelse_kvm'].to_numpy(dtype=np.float64))
+    log_kr_kvm = np.log(df['pris_per_kvm'].to_numpy(dtype=np.float64))
+    rho = np.corrcoef(log_kvm, log_kr_kvm)[0, 1] if len(df) > 2 else 0.0
+    return {
+        'kvm_mu': float(log_kvm.mean()),
+        'kvm_sd': float(log_kvm.std()),
+        'kr_kvm_mu': float(log_kr_kvm.mean()),
+        'kr_kvm_sd': float(log_kr_kvm.std()),
+        'rho': float(np.nan_to_num(rho)),
+    }
+
+
+def fit_profile(df: pd.DataFrame) -> Dict:
+    """
+    Fordelingene i et ekte datasett: segmentandeler, log-normal-parametre per
+    segment (boligtypens ved få annonser), titler per boligtype og avvikerandel
+    """
+    rent = remove_outliers(df.dropna(subset=['storrelse_kvm', 'pris_per_kvm']))
+    per_type = {boligtype: _lognormal_params(g) for boligtype, g in rent.groupby('boligtype', observed=True)}
+
+    segmenter = []
+    for (kommune, boligtype), g in rent.groupby(['kommune', 'boligtype'], observed=True):
+        params = _lognormal_params(g) if len(g) >= MIN_SEGMENT else per_type[boligtype]
+        segmenter.append({'kommune': kommune, 'boligtype': boligtype, 'andel': len(g) / len(rent), **params})
+
+    return {
+        'segmenter': pd.DataFrame(segmenter),
+        'titler': {boligtype: g['tittel'].astype(str).unique() for boligtype, g in rent.groupby('boligtype', observed=True)},
+        'avvik_andel': 1 - len(rent) / len(df),
+    }
+
+
+def generate(rader: int, profile: Optional[Dict] = None, seed: int = 42) -> pd.DataFrame:
+    """`rader` syntetiske annonser (kompakte datatyper, uten lenke)"""
+    profile = profile or fit_profile(pd.read_csv(DATA_CSV))
+    rng = np.random.default_rng(seed)
+    seg = profile['segmenter']
+
+    idx = rng.choice(len(seg), size=rader, p=(seg['andel'] / seg['andel'].sum()).to_numpy())
+    z1 = rng.standard_normal(rader)
+    z2 = rng.standard_normal(rader)
+    p = {col: seg[col].to_numpy()[idx] for col in ('kvm_mu', 'kvm_sd', 'kr_kvm_mu', 'kr_kvm_sd', 'rho')}
+    kvm = np.exp(p['kvm_mu'] + p['kvm_sd'] * z1).round()
+    kr_kvm = np.exp(p['kr_kvm_mu'] + p['kr_kvm_sd'] * (p['rho'] * z1 + np.sqrt(1 - p['rho'] ** 2) * z2))
+
+    # Avvikere: feilregistrert areal (en faktor 10 for stort eller for lite)
+    avvik = rng.random(rader) < profile['avvik_andel']
+    kvm[avvik] *= rng.choice([0.1, 10.0], size=int(avvik.sum()))
+    kvm = np.maximum(kvm.round(), 1)
+
+    lo, hi = OUTLIER_BOUNDS['pris']
+    # Prisantydninger er runde tall (nærmeste 10 000)
+    pris = (np.clip(kvm * kr_kvm, lo / 2, hi * 2) / 10_000).round() * 10_000
+
+    boligtyper = seg['boligtype'].to_numpy()[idx]
+    tittel = np.empty(rader, dtype=object)
+    for boligtype, titler in profile['titler'].items():
+        rows = boligtyper == boligtype
+        tittel[rows] = titler[rng.integers(0, len(titler), int(rows.sum()))]
+
+    df = pd.DataFrame({
+        'finn_kode': rng.permutation(rader) + FINN_KODE_START,
+        'tittel': tittel,
+        'pris': pris,
+        'storrelse_kvm': kvm,
+        'pris_per_kvm': (pris / kvm).round(),
+        'boligtype': pd.Categorical(boligtyper),
+        'kommune': pd.Categorical(seg['kommune'].to_numpy()[idx]),
+    })
+    return to_compact(df)
+
+
+def compare(real: pd.DataFrame, synth: pd.DataFrame) -> pd.DataFrame:
+    """Medianpris og -størrelse per boligtype, ekte mot syntetisk (etter outlier-fjerning)"""
+    def medians(df):
+        return remove_outliers(df).groupby('boligtype', observed=True)[['pris', 'storrelse_kvm']].median()
+
+    return medians(real).join(medians(synth), lsuffix='_ekte', rsuffix='_syntetisk')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generer et syntetisk boligdatasett")
+    parser.add_argument('--rader', type=int, default=1_000_000)
+    parser.add_argument('--output', default='boliger_syntetisk.parquet', help=".parquet, .db eller .csv")
+    parser.add_argument('--kilde', default=DATA_CSV, help="Datasett fordelingene tilpasses")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    real = pd.read_csv(args.kilde)
+    start = time.perf_counter()
+    df = generate(args.rader, fit_profile(real), args.seed)
+    print(f"🧪 {len(df):,} annonser generert på {time.perf_counter() - start:.1f} s".replace(",", " "))
+    print(compare(real, df).round(0).to_string())
+
+    save_dataset(df, args.output)
+    print(f"💾 Lagret til {args.output}")
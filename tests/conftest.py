@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modulene ligger i rotkatalogen (ingen pakke)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,21 @@
+from archive import PageArchive
+
+URL = 'https://www.finn.no/realestate/homes/search.html?location=1.20002.20022'
+
+
+def test_uendret_side_i_ny_kjoring(tmp_path):
+    """Samme side i to kjøringer: andre put skal bare skrive en indekslinje"""
+    body = b'<html><article class="sf-search-ad">side</article></html>'
+
+    arkiv = PageArchive(str(tmp_path))
+    forste = arkiv.put(URL, body, '1.20002.20022', 'Moss', 1)
+    arkiv.close()
+
+    arkiv = PageArchive(str(tmp_path))
+    andre = arkiv.put(URL, body, '1.20002.20022', 'Moss', 1)
+    arkiv.close()
+
+    assert (andre['segment'], andre['offset']) == (forste['segment'], forste['offset'])
+    assert len(arkiv.entries()) == 2
+    assert arkiv.read(andre) == body
+    assert len(list(tmp_path.glob('*.z'))) == 1
@@ -0,0 +1,80 @@
+import pytest
+import requests
+
+from scraper import FinnScraper, is_full_snapshot
+
+SIDE = ('<html><body><article class="sf-search-ad"><h2><a href="/realestate/homes/ad.html?finnkode={kode}">'
+        'Leilighet {kode}</a></h2><span>80 m²</span><span>3 000 000 kr</span></article></body></html>')
+
+
+def _scraper(feilende_sider):
+    scraper = FinnScraper(cache_dir=None)
+
+    def get(url, use_cache=True):
+        page = int(url.rsplit('page=', 1)[1]) if 'page=' in url else 1
+        if page in feilende_sider:
+            raise requests.HTTPError(f"503 for side {page}")
+        if page > 3:
+            return b'<html><body>Ingen treff</body></html>'
+        return SIDE.format(kode=1000 + page).encode('utf-8')
+
+    scraper._get = get
+    return scraper
+
+
+def test_feilet_side_er_ikke_full_snapshot():
+    """En side som feilet mangler annonser - de skal ikke registreres som fjernet"""
+    scraper = _scraper({2})
+    boliger = scraper.scrape_location('1.20002.20022', 'Moss')
+
+    assert [b['finn_kode'] for b in boliger] == ['1001', '1003']
+    assert scraper.rapporter[0]['feil'] == 1
+    assert not is_full_snapshot(scraper.rapporter)
+
+
+def test_komplett_kjoring_er_full_snapshot():
+    scraper = _scraper(set())
+    scraper.scrape_location('1.20002.20022', 'Moss')
+
+    assert is_full_snapshot(scraper.rapporter)
+    assert not is_full_snapshot(scraper.rapporter, incremental=True)
+
+
+class _Response:
+    def __init__(self, status_code, content=b''):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code), response=self)
+
+
+def _svar(scraper, *responses):
+    """Session som gir responses i rekkefølge og husker headerne for hvert kall"""
+    kall = []
+
+    def get(url, headers=None, timeout=None):
+        kall.append(dict(headers or {}))
+        return responses[len(kall) - 1]
+
+    scraper.session.get = get
+    return kall
+
+
+def test_304_uten_cache_proves_pa_nytt():
+    """En 304 vi ikke ba om har ingen body - den skal ikke gi en tom side"""
+    scraper = FinnScraper(cache_dir=None, rate_per_host=1000, burst=10)
+    kall = _svar(scraper, _Response(304), _Response(200, b'<html>side</html>'))
+
+    assert scraper._get('https://www.finn.no/x') == b'<html>side</html>'
+    assert kall == [{}, {'Cache-Control': 'no-cache'}]
+
+
+def test_304_uten_cache_feiler_til_slutt():
+    scraper = FinnScraper(cache_dir=None, rate_per_host=1000, burst=10, max_retries=1)
+    _svar(scraper, _Response(304), _Response(304))
+
+    with pytest.raises(requests.HTTPError):
+        scraper._get('https://www.finn.no/x')